@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FormsAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "forms_app"
+
+    def ready(self):
+        from forms_app import signals  # noqa: F401
@@ -0,0 +1,187 @@
+# forms_app/charts.py
+"""
+Отрисовка графиков matplotlib в PNG с кэшем на диске.
+
+Дашборд строит один и тот же график «Заказы vs Выкуплено» при каждом
+открытии страницы, хотя Form14Data меняется только при загрузке; формы 1
+и 3 для одинаковых файлов тоже рисуют одинаковые графики. Поэтому график
+описывается словарём (spec) — данные серий плюс оформление, — а PNG
+хранится под SHA-256 от этого словаря. Повторный вызов с теми же данными
+отдаёт готовые байты без matplotlib.
+
+Рисование идёт через объектный API (matplotlib.figure.Figure), без
+глобального состояния pyplot, поэтому безопасно в многопоточных воркерах.
+При превышении CHART_CACHE_MAX_BYTES удаляются давно не использовавшиеся
+PNG (LRU по времени последнего обращения, как в ingest_cache).
+
+Формат spec:
+    {
+        "figsize": (8, 4),
+        "series": [{"kind": "plot" | "bar", "x": [...], "y": [...], "options": {...}}],
+        "title": "...", "title_options": {...},
+        "xlabel": "...", "ylabel": "...",
+        "xticks": {"rotation": 45, "ha": "right"},  # свойства подписей оси X
+        "legend": {...} | None, "grid": {...} | None,
+        "savefig": {...},  # доп. аргументы Figure.savefig
+    }
+Значения серий должны сериализоваться в JSON (списки, а не Series).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+
+# Меняется при изменении способа отрисовки — старые PNG перестают находиться
+CHART_VERSION = 1
+CHART_SUFFIX = ".png"
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def cache_dir():
+    return getattr(
+        settings,
+        "CHART_CACHE_DIR",
+        os.path.join(settings.BASE_DIR, "cache", "charts"),
+    )
+
+
+def max_bytes():
+    return getattr(settings, "CHART_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+
+
+def make_key(spec):
+    """SHA-256 от канонического представления данных и оформления графика."""
+    payload = json.dumps(
+        [CHART_VERSION, spec], ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _path(key, namespace=""):
+    name = f"{namespace}-{key}" if namespace else key
+    return os.path.join(cache_dir(), name + CHART_SUFFIX)
+
+
+def render_png(spec, namespace=""):
+    """
+    Возвращает PNG графика: из кэша или отрисовав и сохранив его.
+    namespace — префикс файла, по которому записи можно сбросить разом
+    (см. invalidate), например "dashboard-<id пользователя>".
+    """
+    path = _path(make_key(spec), namespace)
+    try:
+        with open(path, "rb") as f:
+            png = f.read()
+    except OSError:
+        png = None
+    if png:
+        # Отмечаем обращение — по нему работает вытеснение
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return png
+
+    png = draw_png(spec)
+    _store(path, png)
+    return png
+
+
+def draw_png(spec):
+    """Рисует график по spec без кэша и возвращает PNG."""
+    # matplotlib нужен только при промахе кэша — не тянем его при импорте
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=spec.get("figsize", (8, 4)))
+    ax = fig.add_subplot()
+    for series in spec["series"]:
+        draw = getattr(ax, series.get("kind", "plot"))
+        draw(series["x"], series["y"], **series.get("options", {}))
+
+    if spec.get("title"):
+        ax.set_title(spec["title"], **spec.get("title_options", {}))
+    if spec.get("xlabel"):
+        ax.set_xlabel(spec["xlabel"])
+    if spec.get("ylabel"):
+        ax.set_ylabel(spec["ylabel"])
+    if spec.get("xticks"):
+        for label in ax.get_xticklabels():
+            label.set(**spec["xticks"])
+    if spec.get("legend") is not None:
+        ax.legend(**spec["legend"])
+    if spec.get("grid") is not None:
+        ax.grid(**spec["grid"])
+    fig.tight_layout()
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png", **spec.get("savefig", {}))
+    return buf.getvalue()
+
+
+def _store(path, png):
+    """Сохраняет PNG атомарно (через временный файл) и чистит кэш."""
+    directory = os.path.dirname(path)
+    tmp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить график в кэш: {e}")
+        if tmp_path:
+            _remove(tmp_path)
+        return
+    evict()
+
+
+def _entries(namespace=None):
+    directory = cache_dir()
+    if not os.path.isdir(directory):
+        return []
+    prefix = f"{namespace}-" if namespace else ""
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(CHART_SUFFIX) or not name.startswith(prefix):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict(limit=None):
+    """Удаляет самые давние PNG, пока размер кэша больше лимита."""
+    limit = max_bytes() if limit is None else limit
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        if _remove(path):
+            total -= size
+            removed += 1
+    return removed
+
+
+def invalidate(namespace):
+    """Удаляет все графики с префиксом namespace. Возвращает их число."""
+    return sum(_remove(path) for _, _, path in _entries(namespace))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
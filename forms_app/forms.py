@@ -176,6 +176,17 @@ class CuttingForm(forms.Form):
         widget=forms.RadioSelect(attrs={"class": "form-check-input"}),
     )
 
+    solver_mode = forms.ChoiceField(
+        label="Способ расчёта",
+        choices=[
+            ("hint", "Эвристика + уточнение CP-SAT (до 30 с)"),
+            ("heuristic", "Только эвристика — мгновенно"),
+            ("cpsat", "Только CP-SAT (до 30 с)"),
+        ],
+        initial="hint",
+        widget=forms.RadioSelect(attrs={"class": "form-check-input"}),
+    )
+
 
 class Form16UploadForm(forms.Form):
     """Форма для загрузки файла оборачиваемости"""
@@ -0,0 +1,455 @@
+# forms_app/ingest.py
+"""
+Потоковое чтение Excel-отчётов Wildberries / Ozon.
+
+pd.read_excel сначала превращает весь лист в список ячеек openpyxl и только
+потом отдаёт его медленному python-парсеру. Здесь лист читается построчно
+(openpyxl read_only + values_only), в памяти остаются только нужные колонки,
+а результат совместим с pd.read_excel: хвостовые пустые строки отбрасываются,
+безымянные колонки называются "Unnamed: N", дубликаты — "Имя.1",
+числовые строки приводятся к числам.
+
+Результат разбора кэшируется по содержимому файла (см. ingest_cache), так что
+повторная загрузка того же отчёта в другую форму не парсит его заново.
+Несколько файлов одной загрузки read_sheets разбирает параллельно.
+"""
+
+import math
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from openpyxl import load_workbook
+
+from forms_app import ingest_cache
+
+# Результат read_sheets для одного файла
+ParsedSheet = namedtuple("ParsedSheet", ["name", "df", "error", "seconds", "cached"])
+
+# Строки, которые pandas по умолчанию считает пропусками
+NA_STRINGS = frozenset(
+    {
+        "",
+        "#N/A",
+        "#N/A N/A",
+        "#NA",
+        "-1.#IND",
+        "-1.#QNAN",
+        "-NaN",
+        "-nan",
+        "1.#IND",
+        "1.#QNAN",
+        "<NA>",
+        "N/A",
+        "NA",
+        "NULL",
+        "NaN",
+        "None",
+        "n/a",
+        "nan",
+        "null",
+    }
+)
+
+
+def _source_name(source):
+    if isinstance(source, str):
+        return source
+    return str(getattr(source, "name", "") or "")
+
+
+def _prepare_source(source):
+    """bytes → BytesIO, файловые объекты перематываем в начало."""
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+def _is_legacy_xls(source):
+    return _source_name(source).lower().endswith(".xls")
+
+
+def _convert_cell(value):
+    """Та же нормализация значения ячейки, что и в pandas (openpyxl-движок)."""
+    if value is None:
+        return np.nan
+    if isinstance(value, float):
+        if math.isnan(value):
+            return np.nan
+        if value.is_integer():
+            return int(value)
+        return value
+    if isinstance(value, str) and value in NA_STRINGS:
+        return np.nan
+    return value
+
+
+def _trim_row(row):
+    """Отбрасывает пустые ячейки в конце строки."""
+    end = len(row)
+    while end and (row[end - 1] is None or row[end - 1] == ""):
+        end -= 1
+    return row[:end]
+
+
+def _header_names(header_row):
+    """Имена колонок как у pandas: пустые → "Unnamed: N", дубли → "Имя.1"."""
+    names = []
+    seen = {}
+    for idx, value in enumerate(header_row):
+        value = _convert_cell(value)
+        if isinstance(value, float) and math.isnan(value):
+            name = f"Unnamed: {idx}"
+        else:
+            name = value
+        if name in seen:
+            seen[name] += 1
+            candidate = f"{name}.{seen[name]}"
+            while candidate in seen:
+                seen[name] += 1
+                candidate = f"{name}.{seen[name]}"
+            seen[candidate] = 0
+            name = candidate
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _is_str_hint(hint):
+    return hint is str or hint == "str"
+
+
+def _column_hint(dtype, name):
+    """Подсказка типа колонки: dtype — словарь {колонка: тип} или один тип для всех."""
+    if isinstance(dtype, dict):
+        return dtype.get(name)
+    return dtype
+
+
+def _apply_dtype(series, hint):
+    if _is_str_hint(hint):
+        return series
+    dtype = pd.api.types.pandas_dtype(hint)
+    if pd.api.types.is_numeric_dtype(dtype):
+        return pd.to_numeric(series, errors="coerce").astype(dtype)
+    return series.astype(dtype)
+
+
+def _infer_numeric(series):
+    """Как python-парсер pandas: колонка из «числовых» строк становится числовой."""
+    try:
+        return pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return series
+
+
+def sheet_names(source):
+    """Список листов книги без загрузки их содержимого."""
+    source = _prepare_source(source)
+    if _is_legacy_xls(source):
+        return pd.ExcelFile(source).sheet_names
+
+    wb = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source.read()
+
+
+def read_sheet(
+    source,
+    sheet_name=0,
+    header=0,
+    skiprows=0,
+    usecols=None,
+    dtype=None,
+    nrows=None,
+    use_cache=True,
+):
+    """
+    Читает лист Excel в DataFrame, не загружая всю книгу в память.
+
+    source     — путь, bytes или файловый объект (в т.ч. UploadedFile)
+    sheet_name — индекс или имя листа
+    header     — номер строки заголовка (считая от skiprows, как в pandas)
+    skiprows   — сколько строк пропустить в самом начале
+    usecols    — белый список колонок; отсутствующие в файле просто пропускаются,
+                 проверка обязательных колонок остаётся за вызывающим кодом
+    dtype      — подсказки типов {колонка: тип} или, как в pd.read_excel, один тип
+                 для всех колонок; str сохраняет значения строками, числовые
+                 типы превращают нечисловые значения в NaN
+    nrows      — читать не больше указанного числа строк данных
+    use_cache  — искать результат в кэше по содержимому файла (ingest_cache)
+    """
+    dtype = {} if dtype is None else dtype
+    legacy = _is_legacy_xls(source)
+    data = _read_bytes(source)
+    options = _parse_options(sheet_name, header, skiprows, usecols, dtype, nrows)
+
+    key = _cache_key(data, legacy, options) if use_cache else None
+    if key is not None:
+        df = ingest_cache.load(key)
+        if df is not None:
+            return df
+
+    df = _parse(data, legacy, options)
+
+    if key is not None:
+        ingest_cache.store(key, df)
+    return df
+
+
+def read_sheets(
+    sources,
+    sheet_name=0,
+    header=0,
+    skiprows=0,
+    usecols=None,
+    dtype=None,
+    nrows=None,
+    use_cache=True,
+):
+    """
+    Читает несколько файлов с одинаковыми параметрами (см. read_sheet).
+
+    Разбор файлов, которых нет в кэше, идёт параллельно в пуле процессов
+    (INGEST_WORKERS). Ошибка одного файла не прерывает остальные: для каждого
+    источника возвращается ParsedSheet(name, df, error, seconds, cached)
+    в исходном порядке.
+    """
+    options = _parse_options(sheet_name, header, skiprows, usecols, {} if dtype is None else dtype, nrows)
+    results = [None] * len(sources)
+    pending = []  # (позиция, имя, bytes, legacy, ключ кэша)
+
+    for pos, source in enumerate(sources):
+        name = _source_name(source)
+        start = time.perf_counter()
+        try:
+            legacy = _is_legacy_xls(source)
+            data = _read_bytes(source)
+            key = _cache_key(data, legacy, options) if use_cache else None
+            df = ingest_cache.load(key) if key is not None else None
+        except Exception as e:
+            results[pos] = ParsedSheet(
+                name, None, e, time.perf_counter() - start, False
+            )
+            continue
+        if df is not None:
+            results[pos] = ParsedSheet(
+                name, df, None, time.perf_counter() - start, True
+            )
+        else:
+            pending.append((pos, name, data, legacy, key))
+
+    workers = min(parse_workers(), len(pending))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (item, pool.submit(_timed_parse, item[2], item[3], options))
+                for item in pending
+            ]
+            parsed = []
+            for item, future in futures:
+                try:
+                    parsed.append((item, *future.result()))
+                except Exception as e:
+                    parsed.append((item, None, 0.0, e))
+    else:
+        parsed = []
+        for item in pending:
+            try:
+                parsed.append((item, *_timed_parse(item[2], item[3], options)))
+            except Exception as e:
+                parsed.append((item, None, 0.0, e))
+
+    for (pos, name, _, _, key), df, seconds, error in parsed:
+        if error is None and key is not None:
+            ingest_cache.store(key, df)
+        results[pos] = ParsedSheet(name, df, error, seconds, False)
+    return results
+
+
+def format_parse_times(parsed):
+    """Строка для сообщения пользователю: время разбора каждого файла."""
+    parts = []
+    for item in parsed:
+        if item.error is not None:
+            continue
+        suffix = " (из кэша)" if item.cached else ""
+        parts.append(f"{item.name} — {item.seconds:.2f} с{suffix}")
+    return "; ".join(parts)
+
+
+def parse_workers():
+    return max(1, getattr(settings, "INGEST_WORKERS", 1))
+
+
+def _parse_options(sheet_name, header, skiprows, usecols, dtype, nrows):
+    return {
+        "sheet_name": sheet_name,
+        "header": header,
+        "skiprows": skiprows,
+        "usecols": list(usecols) if usecols is not None else None,
+        "dtype": dtype,
+        "nrows": nrows,
+    }
+
+
+def _cache_key(data, legacy, options):
+    if not ingest_cache.is_enabled():
+        return None
+    usecols = options["usecols"]
+    dtype = options["dtype"]
+    return ingest_cache.make_key(
+        data,
+        {
+            "sheet_name": options["sheet_name"],
+            "header": options["header"],
+            "skiprows": options["skiprows"],
+            "usecols": sorted(map(str, usecols)) if usecols is not None else None,
+            "dtype": (
+                {str(col): str(hint) for col, hint in dtype.items()}
+                if isinstance(dtype, dict)
+                else str(dtype)
+            ),
+            "nrows": options["nrows"],
+            "legacy": legacy,
+        },
+    )
+
+
+def _parse(data, legacy, options):
+    parse = _parse_legacy_xls if legacy else _parse_sheet
+    return parse(BytesIO(data), **options)
+
+
+def _timed_parse(data, legacy, options):
+    """Выполняется в процессе пула: (DataFrame, секунды, ошибка)."""
+    start = time.perf_counter()
+    df = _parse(data, legacy, options)
+    return df, time.perf_counter() - start, None
+
+
+def _parse_legacy_xls(source, sheet_name, header, skiprows, usecols, dtype, nrows):
+    # openpyxl не читает старый формат .xls
+    wanted = set(usecols) if usecols is not None else None
+    return pd.read_excel(
+        source,
+        sheet_name=sheet_name,
+        header=header,
+        skiprows=skiprows,
+        usecols=(lambda col: col in wanted) if wanted is not None else None,
+        dtype=dtype or None,
+        nrows=nrows,
+    )
+
+
+def _parse_sheet(source, sheet_name, header, skiprows, usecols, dtype, nrows):
+    wb = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        if isinstance(sheet_name, int):
+            ws = wb.worksheets[sheet_name]
+        elif sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+        else:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        # Размеры листа в выгрузках WB часто записаны неверно
+        ws.reset_dimensions()
+
+        wanted = set(usecols) if usecols is not None else None
+        str_columns = set()
+
+        names = None
+        kept = []  # [(индекс в строке, имя колонки)]
+        columns = {}  # имя колонки → список значений
+        n_rows = 0
+        pending_blank = 0  # пустые строки внутри данных; хвостовые pandas отбрасывает
+        header_row = skiprows + header
+
+        for row_number, row in enumerate(ws.iter_rows(values_only=True)):
+            if row_number < header_row:
+                continue
+
+            if names is None:
+                names = _header_names(_trim_row(row))
+                kept = [
+                    (idx, name)
+                    for idx, name in enumerate(names)
+                    if wanted is None or name in wanted
+                ]
+                columns = {name: [] for _, name in kept}
+                str_columns = {
+                    name for _, name in kept if _is_str_hint(_column_hint(dtype, name))
+                }
+                continue
+
+            row = _trim_row(row)
+            if not row:
+                pending_blank += 1
+                continue
+
+            if nrows is not None and n_rows + pending_blank >= nrows:
+                # Лимит исчерпан пустыми строками — они оказались бы хвостовыми
+                break
+            for _ in range(pending_blank):
+                for _, name in kept:
+                    columns[name].append(np.nan)
+            n_rows += pending_blank
+            pending_blank = 0
+
+            if len(row) > len(names):
+                # Строка данных шире заголовка: pandas добавляет "Unnamed: N"
+                for idx in range(len(names), len(row)):
+                    name = f"Unnamed: {idx}"
+                    names.append(name)
+                    if wanted is None or name in wanted:
+                        kept.append((idx, name))
+                        columns[name] = [np.nan] * n_rows
+                        if _is_str_hint(_column_hint(dtype, name)):
+                            str_columns.add(name)
+
+            row_len = len(row)
+            for idx, name in kept:
+                value = _convert_cell(row[idx]) if idx < row_len else np.nan
+                if name in str_columns and not (
+                    isinstance(value, float) and math.isnan(value)
+                ):
+                    value = str(value)
+                columns[name].append(value)
+            n_rows += 1
+
+            if nrows is not None and n_rows >= nrows:
+                break
+    finally:
+        wb.close()
+
+    if names is None:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(columns, columns=[name for _, name in kept])
+    for name in df.columns:
+        hint = _column_hint(dtype, name)
+        if hint is not None:
+            df[name] = _apply_dtype(df[name], hint)
+        elif df[name].dtype == object:
+            df[name] = _infer_numeric(df[name])
+    return df
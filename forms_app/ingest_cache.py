@@ -0,0 +1,155 @@
+# forms_app/ingest_cache.py
+"""
+Кэш разобранных Excel-отчётов.
+
+Один и тот же отчёт WB часто загружают по нескольку раз (форма 9, затем 10,
+12, 14 или повторно после ошибки). Ключ кэша — SHA-256 содержимого файла
+плюс параметры чтения, значение — готовый DataFrame в pickle на локальном
+диске. При превышении INGEST_CACHE_MAX_BYTES удаляются давно не
+использовавшиеся записи (LRU по времени последнего обращения).
+
+Тот же кэш хранит агрегаты финансовых отчётов форм 2 и 18 (см. wb_finance):
+store/load принимают любой объект, который сериализуется pickle.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+from django.conf import settings
+
+# Меняется при изменении формата результата ingest.read_sheet
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".pkl"
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def is_enabled():
+    return getattr(settings, "INGEST_CACHE_ENABLED", True)
+
+
+def cache_dir():
+    return getattr(
+        settings,
+        "INGEST_CACHE_DIR",
+        os.path.join(settings.BASE_DIR, "cache", "ingest"),
+    )
+
+
+def max_bytes():
+    return getattr(settings, "INGEST_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+
+
+def make_key(data, params):
+    """SHA-256 от содержимого файла и канонического представления параметров."""
+    digest = hashlib.sha256(data)
+    digest.update(
+        json.dumps(
+            [CACHE_VERSION, params], ensure_ascii=False, sort_keys=True, default=str
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+def _path(key):
+    return os.path.join(cache_dir(), key + CACHE_SUFFIX)
+
+
+def load(key):
+    """Возвращает объект (обычно DataFrame) из кэша или None."""
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_pickle(path)
+    except Exception as e:
+        print(f"⚠️ Повреждённая запись кэша {key}: {e}")
+        _remove(path)
+        return None
+    # Отмечаем обращение — по нему работает вытеснение
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return df
+
+
+def store(key, df):
+    """Сохраняет объект атомарно (через временный файл) и чистит кэш."""
+    directory = cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        pd.to_pickle(df, tmp_path)
+        if os.path.getsize(tmp_path) > max_bytes():
+            # Запись больше всего кэша — хранить её бессмысленно
+            _remove(tmp_path)
+            return
+        os.replace(tmp_path, _path(key))
+    except Exception as e:
+        print(f"⚠️ Не удалось сохранить кэш {key}: {e}")
+        _remove(tmp_path)
+        return
+    evict()
+
+
+def _entries():
+    directory = cache_dir()
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict(limit=None):
+    """Удаляет самые давние записи, пока размер кэша больше лимита."""
+    limit = max_bytes() if limit is None else limit
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        if _remove(path):
+            total -= size
+            removed += 1
+    return removed
+
+
+def purge(older_than=None):
+    """
+    Очищает кэш. older_than — возраст в секундах; без него удаляется всё.
+    Возвращает (число удалённых записей, освобождено байт).
+    """
+    now = time.time()
+    removed = 0
+    freed = 0
+    for mtime, size, path in _entries():
+        if older_than is not None and now - mtime < older_than:
+            continue
+        if _remove(path):
+            removed += 1
+            freed += size
+    return removed, freed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,270 @@
+# forms_app/jobs.py
+"""
+Очередь фоновых задач для тяжёлых отчётов (формы 2, 15, 16, 18, 19).
+
+Веб-запрос только сохраняет загруженные файлы и параметры в ReportJob,
+а расчёт выполняет отдельный процесс `python manage.py run_report_workers`.
+Внешний брокер не нужен: очередь хранится в той же БД, задачу забирает
+тот обработчик, чей условный UPDATE pending → running сработал первым.
+Браузер опрашивает JSON-статус задачи и скачивает готовый файл из MEDIA_ROOT.
+
+Обработчик задачи — функция handler(job), указанная в JOB_KINDS. Он
+возвращает ReportResult, а об ошибках во входных данных сообщает через
+ReportJobError (текст показывается пользователю как есть).
+"""
+
+import os
+import socket
+import time
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from forms_app.models import ReportJob
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+JobKind = namedtuple("JobKind", ["handler", "title", "back_url"])
+
+JOB_KINDS = {
+    "form2": JobKind(
+        "forms_app.views.form2_view.run_form2_job",
+        "Форма 2: финансовый отчёт Wildberries",
+        "forms_app:form2",
+    ),
+    "form15": JobKind(
+        "forms_app.views.form15_view.run_form15_job",
+        "Форма 15: расчёт раскроя",
+        "forms_app:form15_view",
+    ),
+    "form16": JobKind(
+        "forms_app.views.form16_view.run_form16_job",
+        "Форма 16: отчёт по оборачиваемости",
+        "forms_app:form16_generate_report",
+    ),
+    "form18": JobKind(
+        "forms_app.views.form18_view.run_form18_job",
+        "Форма 18: финансовый отчёт",
+        "forms_app:form18_list",
+    ),
+    "form19": JobKind(
+        "forms_app.views.form19_view.run_form19_job",
+        "Форма 19: анализ трафика",
+        "forms_app:form19_view",
+    ),
+}
+
+ReportResult = namedtuple("ReportResult", ["content", "filename", "content_type"])
+
+# Как часто обработчик снимает зависшие задачи и чистит старые результаты
+MAINTENANCE_INTERVAL = 10 * 60
+
+# Ключ сессии с задачами анонимного пользователя: {вид задачи: [id, ...]}
+SESSION_JOBS_KEY = "report_jobs"
+SESSION_JOBS_LIMIT = 10
+
+
+class ReportJobError(Exception):
+    """Ошибка во входных данных задачи — текст показывается пользователю."""
+
+
+def is_async():
+    return getattr(settings, "REPORT_JOBS_ASYNC", True)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(kind, user=None, params=None, files=None):
+    """
+    Ставит задачу в очередь. files — {поле формы: UploadedFile}; файлы
+    сохраняются в MEDIA_ROOT/report_jobs/inputs/<id задачи>/.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+    job = ReportJob(
+        kind=kind,
+        user=user if user is not None and user.is_authenticated else None,
+        params=params or {},
+    )
+    for field, uploaded in (files or {}).items():
+        name = os.path.basename(uploaded.name)
+        path = default_storage.save(
+            f"report_jobs/inputs/{job.pk}/{field}/{name}", uploaded
+        )
+        job.inputs[field] = {"path": path, "name": uploaded.name}
+    job.save()
+    return job
+
+
+def remember_in_session(request, job, keep=SESSION_JOBS_LIMIT):
+    """
+    Запоминает задачу анонимного пользователя в его сессии: все анонимные
+    задачи хранятся с user=None, и отличить свои можно только так.
+    """
+    if request.user.is_authenticated:
+        return
+    remembered = request.session.get(SESSION_JOBS_KEY, {})
+    ids = [str(job.pk)] + remembered.get(job.kind, [])
+    remembered[job.kind] = ids[:keep]
+    request.session[SESSION_JOBS_KEY] = remembered
+
+
+def session_job_ids(request, kind):
+    """id задач вида kind, запущенных в этой сессии (новые первыми)."""
+    return request.session.get(SESSION_JOBS_KEY, {}).get(kind, [])
+
+
+def claim(job, worker=""):
+    """Переводит задачу в running; False — её уже забрал другой обработчик."""
+    started_at = timezone.now()
+    claimed = ReportJob.objects.filter(
+        pk=job.pk, status=ReportJob.STATUS_PENDING
+    ).update(status=ReportJob.STATUS_RUNNING, worker=worker, started_at=started_at)
+    if claimed:
+        job.status = ReportJob.STATUS_RUNNING
+        job.worker = worker
+        job.started_at = started_at
+    return bool(claimed)
+
+
+def claim_next(worker=""):
+    """Забирает самую старую задачу из очереди или возвращает None."""
+    pending = ReportJob.objects.filter(status=ReportJob.STATUS_PENDING).order_by(
+        "created_at"
+    )
+    for job in pending[:10]:
+        if claim(job, worker):
+            return job
+    return None
+
+
+def run_job(job):
+    """Выполняет уже захваченную задачу и сохраняет результат в MEDIA_ROOT."""
+    try:
+        handler = import_string(JOB_KINDS[job.kind].handler)
+        result = handler(job)
+    except ReportJobError as e:
+        _finish(job, ReportJob.STATUS_FAILED, error=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job, ReportJob.STATUS_FAILED, error=f"Ошибка при обработке: {e}")
+    else:
+        extension = os.path.splitext(result.filename)[1]
+        job.result_file.save(
+            f"{job.pk}{extension}", ContentFile(result.content), save=False
+        )
+        job.result_name = result.filename
+        job.content_type = result.content_type
+        job.progress = 100
+        job.stage = ""
+        _finish(job, ReportJob.STATUS_DONE)
+    finally:
+        _remove_inputs(job)
+    return job
+
+
+def _finish(job, status, error=""):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save()
+
+
+def _remove_inputs(job):
+    for item in job.inputs.values():
+        try:
+            default_storage.delete(item["path"])
+        except OSError:
+            pass
+    if not job.inputs:
+        return
+    # Пустые каталоги report_jobs/inputs/<id>/<поле>/ (только для локального хранилища)
+    try:
+        job_dir = default_storage.path(f"report_jobs/inputs/{job.pk}")
+    except NotImplementedError:
+        return
+    for field in job.inputs:
+        try:
+            os.rmdir(os.path.join(job_dir, field))
+        except OSError:
+            pass
+    try:
+        os.rmdir(job_dir)
+    except OSError:
+        pass
+
+
+def fail_stale(timeout=None):
+    """Помечает ошибкой задачи, которые выполняются дольше REPORT_JOBS_TIMEOUT."""
+    timeout = timeout or getattr(settings, "REPORT_JOBS_TIMEOUT", 60 * 60)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return ReportJob.objects.filter(
+        status=ReportJob.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(
+        status=ReportJob.STATUS_FAILED,
+        error="Задача прервана: обработчик не ответил вовремя. Запустите её заново.",
+        finished_at=timezone.now(),
+    )
+
+
+def purge(older_than_days=None):
+    """
+    Удаляет завершённые задачи старше REPORT_JOBS_RETENTION_DAYS вместе с
+    файлами. Входные файлы тоже: у задач, чей обработчик упал или был убит
+    (fail_stale), run_job их не удалил.
+    """
+    if older_than_days is None:
+        older_than_days = getattr(settings, "REPORT_JOBS_RETENTION_DAYS", 7)
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    removed = 0
+    for job in ReportJob.objects.filter(
+        status__in=(ReportJob.STATUS_DONE, ReportJob.STATUS_FAILED),
+        finished_at__lt=cutoff,
+    ):
+        if job.result_file:
+            job.result_file.delete(save=False)
+        _remove_inputs(job)
+        job.delete()
+        removed += 1
+    return removed
+
+
+def work(poll_interval=2.0, once=False):
+    """
+    Цикл обработчика: забирает задачи по одной, пока не остановят.
+    once=True — обработать текущую очередь и выйти.
+    """
+    name = worker_name()
+    last_maintenance = None
+    while True:
+        if last_maintenance is None or (
+            time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL
+        ):
+            stale = fail_stale()
+            purged = purge()
+            if stale or purged:
+                print(f"🧹 [{name}] зависших задач: {stale}, удалено старых: {purged}")
+            last_maintenance = time.monotonic()
+
+        job = claim_next(name)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        print(f"▶️ [{name}] {job.kind} {job.pk}")
+        start = time.perf_counter()
+        run_job(job)
+        icon = "✅" if job.status == ReportJob.STATUS_DONE else "❌"
+        print(
+            f"{icon} [{name}] {job.kind} {job.pk} — {time.perf_counter() - start:.1f} с"
+        )
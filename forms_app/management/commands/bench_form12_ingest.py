@@ -0,0 +1,139 @@
+# forms_app/management/commands/bench_form12_ingest.py
+
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from forms_app.models import Form12Data
+from forms_app.views.form12_view import aggregate_form12, build_form12_records
+
+
+def make_raw_sheet(rows, articles, seed=0):
+    """Синтетический лист WB: несколько размеров на артикул, как в выгрузке."""
+    rng = np.random.default_rng(seed)
+    article_ids = rng.integers(0, articles, rows)
+    return pd.DataFrame(
+        {
+            "Артикул WB": (100000000 + article_ids).astype(str),
+            "Артикул продавца": np.char.add("SKU-", article_ids.astype(str)),
+            "Размер": rng.choice(["42", "44", "46", "48", "50"], rows),
+            "шт.": rng.integers(0, 20, rows),
+            "Сумма заказов минус комиссия WB, руб.": rng.random(rows) * 10000,
+            "Выкупили, шт.": rng.integers(0, 15, rows),
+            "К перечислению за товар, руб.": rng.random(rows) * 8000,
+            "Текущий остаток, шт.": rng.integers(0, 100, rows),
+        }
+    )
+
+
+def legacy_records(df_raw, user, file_date):
+    """Прежняя реализация upload_file12: groupby + iterrows + safe_float/safe_int."""
+    df_processed = (
+        df_raw.groupby(["Артикул WB", "Артикул продавца"], as_index=False)
+        .agg(
+            {
+                "шт.": "sum",
+                "Сумма заказов минус комиссия WB, руб.": "sum",
+                "Выкупили, шт.": "sum",
+                "К перечислению за товар, руб.": "sum",
+                "Текущий остаток, шт.": "sum",
+            }
+        )
+        .round(0)
+    )
+    df_processed = df_processed.rename(columns={"шт.": "Заказы, шт."})
+
+    new_records = []
+    for idx, row in df_processed.iterrows():
+        wb_article = str(row["Артикул WB"]).strip()
+        if not wb_article or wb_article == "0":
+            continue
+
+        def safe_float(val):
+            try:
+                return float(val) if pd.notna(val) else None
+            except:
+                return None
+
+        def safe_int(val):
+            try:
+                return int(val) if pd.notna(val) else None
+            except:
+                return None
+
+        new_records.append(
+            Form12Data(
+                user=user,
+                wb_article=wb_article,
+                barcode=None,
+                seller_article=str(row.get("Артикул продавца", "")).strip() or None,
+                size=None,
+                orders_qty=safe_int(row.get("Заказы, шт.")),
+                order_amount_net=safe_float(
+                    row.get("Сумма заказов минус комиссия WB, руб.")
+                ),
+                sold_qty=safe_int(row.get("Выкупили, шт.")),
+                transfer_amount=safe_float(row.get("К перечислению за товар, руб.")),
+                current_stock=safe_int(row.get("Текущий остаток, шт.")),
+                date=file_date,
+            )
+        )
+    return new_records
+
+
+def vectorized_records(df_raw, user, file_date):
+    records, _ = build_form12_records(aggregate_form12(df_raw), user, file_date)
+    return records
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк загрузки Формы 12: прежний iterrows-конвертер "
+        "против векторизованного (строк исходного листа в секунду, без записи в БД)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument(
+            "--articles",
+            type=int,
+            default=None,
+            help="Число различных артикулов (по умолчанию rows / 5)",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        articles = options["articles"] or max(rows // 5, 1)
+        df_raw = make_raw_sheet(rows, articles)
+        user = User(username="bench")
+        file_date = date.today()
+
+        self.stdout.write(
+            f"Лист: {rows} строк, {articles} артикулов, повторов: {options['repeat']}"
+        )
+
+        results = {}
+        for name, func in (
+            ("до (iterrows)", legacy_records),
+            ("после (numpy)", vectorized_records),
+        ):
+            best = None
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                records = func(df_raw, user, file_date)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (best, len(records))
+            self.stdout.write(
+                f"  {name:<15} {best * 1000:9.1f} мс  "
+                f"{rows / best:12,.0f} строк/с  ({len(records)} записей)"
+            )
+
+        before = results["до (iterrows)"][0]
+        after = results["после (numpy)"][0]
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: ×{before / after:.1f}"))
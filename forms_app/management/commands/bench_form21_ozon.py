@@ -0,0 +1,138 @@
+# forms_app/management/commands/bench_form21_ozon.py
+
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from forms_app.views.form21_view import (
+    add_prefix_column,
+    article_stats,
+    calculate_purchase_percentage,
+    extract_prefix,
+    prefix_stats,
+)
+
+ACCRUAL_TYPES = ["Выручка", "Логистика", "Обратная логистика", "Эквайринг"]
+
+
+def make_ozon_report(rows, articles, seed=0):
+    """Синтетический отчёт о начислениях Ozon: артикулы вида PREFIX_цвет_размер."""
+    rng = np.random.default_rng(seed)
+    article_ids = rng.integers(0, articles, rows)
+    prefixes = np.char.add("P", (article_ids % max(articles // 10, 1)).astype(str))
+    names = np.char.add(np.char.add(prefixes, "_"), article_ids.astype(str))
+    accrual_types = rng.choice(
+        ACCRUAL_TYPES + ["Оплата за клик"], rows, p=[0.35, 0.4, 0.1, 0.1, 0.05]
+    )
+    df = pd.DataFrame(
+        {
+            "Артикул": names.astype(object),
+            "Тип начисления": accrual_types,
+            "Сумма итого, руб.": (rng.random(rows) - 0.3) * 2000,
+        }
+    )
+    add_prefix_column(df)
+    return df[df["Тип начисления"] != "Оплата за клик"]
+
+
+def _legacy_row(part_df):
+    total_sum = part_df["Сумма итого, руб."].sum()
+    revenue_count = len(part_df[part_df["Тип начисления"] == "Выручка"])
+    logistics_count = len(part_df[part_df["Тип начисления"] == "Логистика"])
+    return {
+        "Общая сумма, руб": total_sum,
+        "Выручка, руб": part_df[part_df["Тип начисления"] == "Выручка"][
+            "Сумма итого, руб."
+        ].sum(),
+        "Логистика, руб": part_df[part_df["Тип начисления"] == "Логистика"][
+            "Сумма итого, руб."
+        ].sum(),
+        "Количество выкупов": revenue_count,
+        "Количество заказов": logistics_count,
+        "Процент выкупа, %": calculate_purchase_percentage(
+            revenue_count, logistics_count
+        ),
+    }
+
+
+def legacy_stats(df_non_ad):
+    """Прежняя реализация form21: фильтрация всей таблицы на каждый артикул и префикс."""
+    detailed_stats = []
+    for article in df_non_ad["Артикул"].unique():
+        article_df = df_non_ad[df_non_ad["Артикул"] == article]
+        detailed_stats.append(
+            {
+                "Артикул": article,
+                "Префикс": extract_prefix(article),
+                **_legacy_row(article_df),
+            }
+        )
+
+    group_stats = []
+    for prefix in df_non_ad["Префикс_артикула"].unique():
+        group_df = df_non_ad[df_non_ad["Префикс_артикула"] == prefix]
+        group_stats.append(
+            {
+                "Префикс_группы": prefix,
+                **_legacy_row(group_df),
+                "Количество артикулов в группе": group_df["Артикул"].nunique(),
+            }
+        )
+    return pd.DataFrame(detailed_stats), pd.DataFrame(group_stats)
+
+
+def grouped_stats(df_non_ad):
+    return article_stats(df_non_ad), prefix_stats(df_non_ad)
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк Формы 21 (Ozon): прежние циклы по артикулам и префиксам "
+        "против groupby по типу начисления (строк отчёта в секунду)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200000)
+        parser.add_argument(
+            "--articles",
+            type=int,
+            default=None,
+            help="Число различных артикулов (по умолчанию rows / 100)",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        articles = options["articles"] or max(rows // 100, 1)
+        df_non_ad = make_ozon_report(rows, articles)
+
+        self.stdout.write(
+            f"Отчёт: {rows} строк, {articles} артикулов, повторов: {options['repeat']}"
+        )
+
+        results = {}
+        for name, func in (
+            ("до (циклы)", legacy_stats),
+            ("после (groupby)", grouped_stats),
+        ):
+            best = None
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                detailed, groups = func(df_non_ad)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (best, detailed, groups)
+            self.stdout.write(
+                f"  {name:<17} {best * 1000:9.1f} мс  "
+                f"{rows / best:12,.0f} строк/с  "
+                f"({len(detailed)} артикулов, {len(groups)} групп)"
+            )
+
+        before, legacy_detailed, legacy_groups = results["до (циклы)"]
+        after, detailed, groups = results["после (groupby)"]
+        pd.testing.assert_frame_equal(detailed, legacy_detailed)
+        pd.testing.assert_frame_equal(groups, legacy_groups)
+        self.stdout.write("  Результаты совпадают")
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: ×{before / after:.1f}"))
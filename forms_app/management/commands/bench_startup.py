@@ -0,0 +1,101 @@
+# forms_app/management/commands/bench_startup.py
+
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+HEAVY_PACKAGES = ("pandas", "numpy", "matplotlib", "plotly", "openpyxl", "ortools")
+
+# То же, что делает воркер gunicorn/runserver до первого запроса
+STARTUP_SCRIPT = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_startup():
+    """
+    Запускает старт Django в отдельном интерпретаторе с `-X importtime`.
+    Возвращает список (модуль, собственное время, накопленное время, глубина)
+    в микросекундах.
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+        cwd=settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise CommandError(f"Не удалось запустить Django:\n{proc.stderr[-2000:]}")
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append((name, int(own), int(cumulative), len(indent) // 2))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Время старта воркера (django.setup() + загрузка URLconf) по данным "
+        "`python -X importtime`: самые дорогие импорты и загруженные тяжёлые пакеты"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=15,
+            help="Сколько самых дорогих импортов показать",
+        )
+        parser.add_argument(
+            "--fail-on-heavy",
+            action="store_true",
+            help="Завершиться с ошибкой, если при старте загружен тяжёлый пакет",
+        )
+
+    def handle(self, *args, **options):
+        modules = measure_startup()
+        total = sum(own for _, own, _, _ in modules)
+        self.stdout.write(
+            f"Импортов при старте: {len(modules)}, суммарно {total / 1e6:.2f} с"
+        )
+
+        # Верхний уровень (глубина 0) — чтобы вложенные импорты не считались дважды
+        top_level = sorted(
+            (m for m in modules if m[3] == 0), key=lambda m: m[2], reverse=True
+        )
+        self.stdout.write(f"Самые дорогие импорты (top {options['top']}):")
+        for name, _, cumulative, _ in top_level[: options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:9.1f} мс  {name}")
+
+        loaded = {name.split(".", 1)[0] for name, _, _, _ in modules}
+        heavy = [package for package in HEAVY_PACKAGES if package in loaded]
+        if not heavy:
+            self.stdout.write(
+                self.style.SUCCESS("Тяжёлые пакеты при старте не загружаются")
+            )
+            return
+
+        cumulative_by_name = {name: cumulative for name, _, cumulative, _ in modules}
+        for package in heavy:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"  загружен {package}: "
+                    f"{cumulative_by_name.get(package, 0) / 1000:.1f} мс"
+                )
+            )
+        if options["fail_on_heavy"]:
+            raise CommandError(
+                "При старте загружаются тяжёлые пакеты: " + ", ".join(heavy)
+            )
@@ -0,0 +1,40 @@
+# forms_app/management/commands/purge_ingest_cache.py
+
+from django.core.management.base import BaseCommand
+
+from forms_app import ingest_cache
+
+
+class Command(BaseCommand):
+    help = "Очищает кэш разобранных Excel-отчётов (INGEST_CACHE_DIR)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=float,
+            default=None,
+            metavar="DAYS",
+            help="Удалить только записи, к которым не обращались указанное число дней",
+        )
+        parser.add_argument(
+            "--max-mb",
+            type=float,
+            default=None,
+            help="Вместо полной очистки сократить кэш до указанного размера (МБ)",
+        )
+
+    def handle(self, *args, **options):
+        if options["max_mb"] is not None:
+            removed = ingest_cache.evict(limit=int(options["max_mb"] * 1024 * 1024))
+            self.stdout.write(self.style.SUCCESS(f"✅ Удалено записей: {removed}"))
+            return
+
+        older_than = options["older_than"]
+        removed, freed = ingest_cache.purge(
+            older_than=older_than * 86400 if older_than is not None else None
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Удалено записей: {removed}, освобождено {freed / 1024 / 1024:.1f} МБ"
+            )
+        )
@@ -0,0 +1,71 @@
+# forms_app/management/commands/run_report_workers.py
+
+import multiprocessing
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from forms_app import jobs
+
+
+def _worker_process(poll_interval, once):
+    django.setup()
+    jobs.work(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет фоновые задачи отчётов (ReportJob) из очереди в БД. "
+        "Внешний брокер не нужен; запускается рядом с веб-сервером."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Число процессов-обработчиков (по умолчанию 1)",
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=2.0,
+            metavar="SECONDS",
+            help="Пауза между проверками пустой очереди",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать задачи, которые уже в очереди, и выйти",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        poll_interval = options["poll"]
+        once = options["once"]
+        self.stdout.write(f"🚀 Обработчиков отчётов: {workers}")
+
+        if workers == 1:
+            try:
+                jobs.work(poll_interval=poll_interval, once=once)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        # Дочерним процессам нельзя делить соединение с БД родителя
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=_worker_process, args=(poll_interval, once), daemon=True
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,134 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:49
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forms_app", "0024_form20data"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("kind", models.CharField(max_length=50, verbose_name="Тип отчёта")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "В очереди"),
+                            ("running", "Выполняется"),
+                            ("done", "Готово"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "params",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Параметры"
+                    ),
+                ),
+                (
+                    "inputs",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Входные файлы"
+                    ),
+                ),
+                (
+                    "progress",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="Прогресс, %"
+                    ),
+                ),
+                (
+                    "stage",
+                    models.CharField(blank=True, max_length=255, verbose_name="Этап"),
+                ),
+                (
+                    "notes",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="Предупреждения"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Ошибка")),
+                (
+                    "result_file",
+                    models.FileField(
+                        blank=True,
+                        upload_to="report_jobs/results/%Y/%m/",
+                        verbose_name="Результат",
+                    ),
+                ),
+                (
+                    "result_name",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Имя файла"
+                    ),
+                ),
+                ("content_type", models.CharField(blank=True, max_length=100)),
+                (
+                    "worker",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Обработчик"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создана"),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Запущена"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Завершена"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="report_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Фоновая задача отчёта",
+                "verbose_name_plural": "Фоновые задачи отчётов",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"],
+                        name="forms_app_r_status_6651f9_idx",
+                    )
+                ],
+            },
+        ),
+    ]
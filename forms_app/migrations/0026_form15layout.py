@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forms_app", "0025_reportjob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Form15Layout",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64)),
+                (
+                    "fabric_width",
+                    models.IntegerField(verbose_name="Ширина полотна (мм)"),
+                ),
+                ("num_sets", models.IntegerField(verbose_name="Комплектов")),
+                ("solver_mode", models.CharField(max_length=20)),
+                ("placements", models.JSONField(default=list)),
+                ("min_length", models.IntegerField(verbose_name="Длина полотна (мм)")),
+                ("pdf_file", models.FileField(blank=True, upload_to="form15_layouts/")),
+                (
+                    "excel_file",
+                    models.FileField(blank=True, upload_to="form15_layouts/"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="form15_layouts",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Раскладка (Форма 15)",
+                "verbose_name_plural": "Раскладки (Форма 15)",
+                "unique_together": {("user", "key")},
+            },
+        ),
+    ]
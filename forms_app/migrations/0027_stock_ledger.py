@@ -0,0 +1,111 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:50
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forms_app", "0026_form15layout"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "article_group",
+                    models.CharField(max_length=50, verbose_name="Группа артикула"),
+                ),
+                ("size", models.CharField(max_length=50, verbose_name="Размер")),
+                ("quantity", models.IntegerField(default=0, verbose_name="Количество")),
+                (
+                    "article",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Артикул поставщика"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_balances",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Остаток (Форма 5)",
+                "verbose_name_plural": "Остатки (Форма 5)",
+                "unique_together": {("user", "article_group", "size")},
+            },
+        ),
+        migrations.CreateModel(
+            name="StockMovement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("batch", models.UUIDField(db_index=True, default=uuid.uuid4)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("opening", "Перенос из output_stock.xlsx"),
+                            ("receipt", "Поступление"),
+                            ("fbs", "Списание FBS"),
+                            ("fbo", "Списание FBO"),
+                            ("replace", "Полная перезапись"),
+                        ],
+                        max_length=10,
+                        verbose_name="Тип",
+                    ),
+                ),
+                (
+                    "article_group",
+                    models.CharField(max_length=50, verbose_name="Группа артикула"),
+                ),
+                ("size", models.CharField(max_length=50, verbose_name="Размер")),
+                ("delta", models.IntegerField(verbose_name="Изменение")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_movements",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Движение остатков (Форма 5)",
+                "verbose_name_plural": "Движения остатков (Форма 5)",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "created_at"],
+                        name="forms_app_s_user_id_c0a40f_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forms_app", "0027_stock_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockrecord",
+            name="version",
+            field=models.PositiveIntegerField(default=1, verbose_name="Версия"),
+        ),
+    ]
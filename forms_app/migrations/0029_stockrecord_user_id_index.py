@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forms_app", "0028_stockrecord_version"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="stockrecord",
+            index=models.Index(
+                fields=["user", "id"], name="forms_app_s_user_id_513862_idx"
+            ),
+        ),
+    ]
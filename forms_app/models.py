@@ -1,7 +1,10 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
+from django.core.files.storage import default_storage
 
 
 class UserReport(models.Model):
@@ -28,6 +31,9 @@ class StockRecord(models.Model):
         "Место хранения", max_length=100, blank=True, null=True, default="Не указано"
     )
     note = models.TextField("Примечание", blank=True, null=True)
+    # Растёт при каждой правке строки: сохранение таблицы редактирования
+    # не перезаписывает строку, изменённую после открытия страницы
+    version = models.PositiveIntegerField("Версия", default=1)
 
     def __str__(self):
         return f"{self.article_full_name} | {self.size} | {self.quantity}"
@@ -35,6 +41,69 @@ class StockRecord(models.Model):
     class Meta:
         verbose_name = "Складская запись"
         verbose_name_plural = "Складские записи"
+        # Постраничный просмотр остатков идёт по id внутри пользователя
+        indexes = [models.Index(fields=["user", "id"])]
+
+
+class StockMovement(models.Model):
+    """
+    Движение остатков Формы 5: изменение количества группы артикула и
+    размера одной загрузкой (см. forms_app/stock_ledger.py).
+    """
+
+    KIND_OPENING = "opening"
+    KIND_RECEIPT = "receipt"
+    KIND_FBS = "fbs"
+    KIND_FBO = "fbo"
+    KIND_REPLACE = "replace"
+    KIND_CHOICES = (
+        (KIND_OPENING, "Перенос из output_stock.xlsx"),
+        (KIND_RECEIPT, "Поступление"),
+        (KIND_FBS, "Списание FBS"),
+        (KIND_FBO, "Списание FBO"),
+        (KIND_REPLACE, "Полная перезапись"),
+    )
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="stock_movements"
+    )
+    # Все движения одной загрузки
+    batch = models.UUIDField(default=uuid.uuid4, db_index=True)
+    kind = models.CharField("Тип", max_length=10, choices=KIND_CHOICES)
+    article_group = models.CharField("Группа артикула", max_length=50)
+    size = models.CharField("Размер", max_length=50)
+    delta = models.IntegerField("Изменение")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Движение остатков (Форма 5)"
+        verbose_name_plural = "Движения остатков (Форма 5)"
+        indexes = [models.Index(fields=["user", "created_at"])]
+
+    def __str__(self):
+        return f"{self.article_group} | {self.size} | {self.delta:+d}"
+
+
+class StockBalance(models.Model):
+    """Текущий остаток Формы 5 по группе артикула и размеру."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="stock_balances"
+    )
+    article_group = models.CharField("Группа артикула", max_length=50)
+    size = models.CharField("Размер", max_length=50)
+    quantity = models.IntegerField("Количество", default=0)
+    # Полный артикул, последним встреченный в загрузках для этой группы
+    article = models.CharField("Артикул поставщика", max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Остаток (Форма 5)"
+        verbose_name_plural = "Остатки (Форма 5)"
+        unique_together = ("user", "article_group", "size")
+
+    def __str__(self):
+        return f"{self.article_group} | {self.size} | {self.quantity}"
 
 
 class WeeklyReport(models.Model):
@@ -254,6 +323,42 @@ class Pattern15(models.Model):
         super().save(*args, **kwargs)
 
 
+class Form15Layout(models.Model):
+    """
+    Кэш рассчитанных раскладок Формы 15. Ключ — SHA-256 от отсортированных
+    размеров лекал, ширины полотна, числа комплектов, режима и версии
+    решателя. Записи пользователя удаляются при любом изменении его лекал
+    (forms_app/signals.py).
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="form15_layouts"
+    )
+    key = models.CharField(max_length=64)
+    fabric_width = models.IntegerField(verbose_name="Ширина полотна (мм)")
+    num_sets = models.IntegerField(verbose_name="Комплектов")
+    solver_mode = models.CharField(max_length=20)
+    # Раскладка в каноническом порядке лекал (по размерам)
+    placements = models.JSONField(default=list)
+    min_length = models.IntegerField(verbose_name="Длина полотна (мм)")
+    pdf_file = models.FileField(upload_to="form15_layouts/", blank=True)
+    excel_file = models.FileField(upload_to="form15_layouts/", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Раскладка (Форма 15)"
+        verbose_name_plural = "Раскладки (Форма 15)"
+        unique_together = ("user", "key")
+
+    def __str__(self):
+        return f"{self.fabric_width} мм × {self.num_sets} компл. → {self.min_length} мм"
+
+    def delete_files(self):
+        for field in (self.pdf_file, self.excel_file):
+            if field:
+                field.delete(save=False)
+
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -500,3 +605,82 @@ class Form20Data(models.Model):
 
     def __str__(self):
         return f"{self.code} - {self.date} ({self.user.username})"
+
+
+class ReportJob(models.Model):
+    """Фоновая задача формирования отчёта (см. forms_app/jobs.py)"""
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_RUNNING, "Выполняется"),
+        (STATUS_DONE, "Готово"),
+        (STATUS_FAILED, "Ошибка"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="report_jobs",
+        verbose_name="Пользователь",
+    )
+    kind = models.CharField("Тип отчёта", max_length=50)
+    status = models.CharField(
+        "Статус", max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    # Параметры формы и загруженные файлы (поле формы → путь в MEDIA_ROOT)
+    params = models.JSONField("Параметры", default=dict, blank=True)
+    inputs = models.JSONField("Входные файлы", default=dict, blank=True)
+
+    progress = models.PositiveSmallIntegerField("Прогресс, %", default=0)
+    stage = models.CharField("Этап", max_length=255, blank=True)
+    notes = models.JSONField("Предупреждения", default=list, blank=True)
+    error = models.TextField("Ошибка", blank=True)
+
+    result_file = models.FileField(
+        "Результат", upload_to="report_jobs/results/%Y/%m/", blank=True
+    )
+    result_name = models.CharField("Имя файла", max_length=255, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+
+    worker = models.CharField("Обработчик", max_length=100, blank=True)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+    started_at = models.DateTimeField("Запущена", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершена", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача отчёта"
+        verbose_name_plural = "Фоновые задачи отчётов"
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"{self.kind} [{self.get_status_display()}] {self.created_at:%d.%m.%Y %H:%M}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def open_input(self, field):
+        """Открывает загруженный файл задачи (имя поля формы)."""
+        return default_storage.open(self.inputs[field]["path"], "rb")
+
+    def input_name(self, field):
+        """Исходное имя загруженного файла."""
+        return self.inputs[field]["name"]
+
+    def set_progress(self, progress, stage=""):
+        self.progress = progress
+        self.stage = stage
+        ReportJob.objects.filter(pk=self.pk).update(progress=progress, stage=stage)
+
+    def add_note(self, text):
+        """Предупреждение, которое увидит пользователь вместе с результатом."""
+        self.notes.append(text)
+        ReportJob.objects.filter(pk=self.pk).update(notes=self.notes)
@@ -0,0 +1,175 @@
+# forms_app/search.py
+"""
+Поиск по остаткам и артикулам через полнотекстовый индекс SQLite FTS5.
+
+`icontains` превращается в LIKE '%...%', который не использует индексы и
+просматривает все строки пользователя — с ростом склада поиск замедляется.
+Для каждой модели из SEARCH_FIELDS рядом с таблицей заводится виртуальная
+таблица <db_table>_fts (external content: текст хранится только в исходной
+таблице, в FTS — сам индекс). Токенизатор trigram ищет подстроку в любом
+месте значения, как icontains, и без учёта регистра в том числе для
+кириллицы.
+
+Индекс синхронизируют триггеры SQLite, а не сигналы Django: остатки пишутся
+через bulk_create и QuerySet.update, которые сигналов не посылают.
+Таблицы и триггеры создаёт install() после каждого `migrate`: когда Django
+пересоздаёт таблицу при изменении полей, её триггеры удаляются вместе с ней,
+и install() ставит их заново и перестраивает индекс.
+
+На других СУБД, на SQLite без FTS5 и для запросов короче трёх символов
+(trigram их не индексирует) search() работает через icontains.
+"""
+
+from functools import reduce
+from operator import or_
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import CharField, Q, TextField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from forms_app.models import ArticleCost, Form4Data, StockRecord
+
+# Модель → поля, по которым ищет search() по умолчанию
+SEARCH_FIELDS = {
+    StockRecord: ("article_full_name", "size", "quantity", "location", "note"),
+    ArticleCost: ("wb_article", "seller_article"),
+    Form4Data: ("code", "article"),
+}
+
+# trigram находит только подстроки от трёх символов
+MIN_FTS_QUERY = 3
+
+
+def fts_table(model):
+    return f"{model._meta.db_table}_fts"
+
+
+def _columns(model, fields):
+    return [model._meta.get_field(field).column for field in fields]
+
+
+def schema(model):
+    """SQL виртуальной таблицы и триггеров модели — {имя: CREATE ...}."""
+    table, content = fts_table(model), model._meta.db_table
+    columns = _columns(model, SEARCH_FIELDS[model])
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    delete = (
+        f"INSERT INTO {table}({table}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    insert = f"INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new});"
+    # SQLite хранит текст CREATE как есть — install() сравнивает его
+    # с sqlite_master посимвольно
+    return {
+        table: (
+            f"CREATE VIRTUAL TABLE {table} USING fts5({names}, "
+            f"content='{content}', content_rowid='id', tokenize='trigram')"
+        ),
+        f"{table}_ai": (
+            f"CREATE TRIGGER {table}_ai AFTER INSERT ON {content} BEGIN {insert} END"
+        ),
+        f"{table}_ad": (
+            f"CREATE TRIGGER {table}_ad AFTER DELETE ON {content} BEGIN {delete} END"
+        ),
+        # Только при изменении индексируемых полей (не, например, version)
+        f"{table}_au": (
+            f"CREATE TRIGGER {table}_au AFTER UPDATE OF {names} ON {content} "
+            f"BEGIN {delete} {insert} END"
+        ),
+    }
+
+
+def install(using="default"):
+    """
+    Создаёт или обновляет FTS-таблицы и триггеры. Если схема уже совпадает,
+    ничего не делает; иначе пересоздаёт всё и перестраивает индекс по
+    текущим данным. Возвращает список перестроенных таблиц.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return []
+
+    rebuilt = []
+    with connection.cursor() as cursor:
+        existing_tables = set(connection.introspection.table_names(cursor))
+        cursor.execute("SELECT name, sql FROM sqlite_master")
+        current = dict(cursor.fetchall())
+        for model in SEARCH_FIELDS:
+            table = fts_table(model)
+            if model._meta.db_table not in existing_tables:
+                # Таблицу модели откатили миграцией — индекс ей больше не нужен
+                if table in current:
+                    cursor.execute(f"DROP TABLE {table}")
+                continue
+
+            statements = schema(model)
+            if all(current.get(name) == sql for name, sql in statements.items()):
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    for name in statements:
+                        if name != table:
+                            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                    for sql in statements.values():
+                        cursor.execute(sql)
+                    cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            except DatabaseError as e:
+                # Например, SQLite собран без FTS5 — останется поиск через icontains
+                print(f"⚠️ Не удалось создать поисковый индекс {table}: {e}")
+                continue
+            rebuilt.append(table)
+    return rebuilt
+
+
+def has_index(model, using="default"):
+    connection = connections[using]
+    if connection.vendor != "sqlite" or model not in SEARCH_FIELDS:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [fts_table(model)],
+        )
+        return cursor.fetchone() is not None
+
+
+def search(queryset, query, fields=None):
+    """
+    Оставляет в queryset строки, где query встречается хотя бы в одном из
+    fields (по умолчанию — все поля модели из SEARCH_FIELDS). Пустой
+    query — без фильтра.
+    """
+    if not query:
+        return queryset
+    model = queryset.model
+    fields = fields or SEARCH_FIELDS[model]
+
+    indexed = set(fields) <= set(SEARCH_FIELDS.get(model, ()))
+    if indexed and len(query) >= MIN_FTS_QUERY and has_index(model, queryset.db):
+        table = fts_table(model)
+        columns = " ".join(_columns(model, fields))
+        phrase = '"' + query.replace('"', '""') + '"'
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH %s",
+                [f"{{{columns}}} : {phrase}"],
+            )
+        )
+    return contains(queryset, query, fields)
+
+
+def contains(queryset, query, fields):
+    """Тот же поиск через icontains (нетекстовые поля приводятся к тексту)."""
+    conditions = []
+    for field in fields:
+        if not isinstance(
+            queryset.model._meta.get_field(field), (CharField, TextField)
+        ):
+            queryset = queryset.annotate(**{f"{field}_text": Cast(field, CharField())})
+            field = f"{field}_text"
+        conditions.append(Q(**{f"{field}__icontains": query}))
+    return queryset.filter(reduce(or_, conditions))
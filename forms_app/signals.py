@@ -0,0 +1,22 @@
+# forms_app/signals.py
+
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from forms_app.models import Form15Layout, Pattern15
+from forms_app.search import install as install_search_index
+
+
+@receiver([post_save, post_delete], sender=Pattern15)
+def invalidate_form15_layouts(sender, instance, **kwargs):
+    """Любое изменение лекал делает сохранённые раскладки пользователя неактуальными."""
+    for layout in Form15Layout.objects.filter(user_id=instance.user_id):
+        layout.delete_files()
+        layout.delete()
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    """FTS-индекс и триггеры (forms_app/search.py) после каждого migrate."""
+    if sender.name == "forms_app":
+        install_search_index(using)
@@ -0,0 +1,244 @@
+# forms_app/stock_ledger.py
+"""
+Складские остатки Формы 5 в БД.
+
+Раньше каждая загрузка перечитывала media/user_stock/<id>/output_stock.xlsx,
+пересчитывала весь каталог и записывала файл заново. Теперь состояние —
+две таблицы: StockMovement (журнал изменений каждой загрузки) и
+StockBalance (текущий остаток по группе артикула и размеру). Загрузка
+в одной транзакции пишет свои движения и обновляет только затронутые
+строки остатков.
+
+output_stock.xlsx стал кэшем: он удаляется при любом изменении остатков
+и строится заново из StockBalance только при скачивании (stock_xlsx).
+"""
+
+import os
+import tempfile
+import uuid
+from io import BytesIO
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from forms_app.models import StockBalance, StockMovement, UserReport
+
+STOCK_FILENAME = "output_stock.xlsx"
+
+GROUP = "Группа артикула"
+SIZE = "Размер"
+QUANTITY = "Количество"
+ARTICLE = "Артикул поставщика"
+OUTPUT_COLUMNS = [ARTICLE, SIZE, QUANTITY]
+
+
+def stock_path(user):
+    """Путь к output_stock.xlsx относительно MEDIA_ROOT."""
+    return os.path.join("user_stock", str(user.id), STOCK_FILENAME)
+
+
+def full_stock_path(user):
+    return os.path.join(settings.MEDIA_ROOT, stock_path(user))
+
+
+def has_ledger(user):
+    return StockMovement.objects.filter(user=user).exists()
+
+
+def apply_movements(user, movements, articles=None):
+    """
+    Применяет загрузку к остаткам. movements — DataFrame с колонками
+    kind, «Группа артикула», «Размер», delta; articles — {группа: полный
+    артикул} из загруженных файлов (для выгрузки в output_stock.xlsx).
+    Возвращает число изменённых строк остатков.
+    """
+    articles = articles or {}
+    movements = movements[movements["delta"] != 0]
+    changes = movements.groupby([GROUP, SIZE])["delta"].sum()
+    if changes.empty and not articles:
+        return 0
+
+    groups = set(changes.index.get_level_values(0)) | set(articles)
+    with transaction.atomic():
+        _record(user, movements)
+        # Читаем только группы, которых касается загрузка, а не весь каталог
+        balances = {
+            (b.article_group, b.size): b
+            for b in StockBalance.objects.select_for_update().filter(
+                user=user, article_group__in=groups
+            )
+        }
+        for (group, size), delta in changes.items():
+            balance = balances.get((group, size))
+            if balance is None:
+                balance = balances[(group, size)] = StockBalance(
+                    user=user, article_group=group, size=size
+                )
+            balance.quantity += int(delta)
+        for balance in balances.values():
+            balance.article = articles.get(balance.article_group, balance.article)
+        _upsert(list(balances.values()))
+        _changed(user)
+    return len(balances)
+
+
+def replace_balances(user, stock, articles=None, kind=StockMovement.KIND_REPLACE):
+    """
+    Полная замена остатков: stock — DataFrame «Группа артикула», «Размер»,
+    «Количество». В журнал пишется разница с прежними остатками, строки,
+    которых нет в новом файле, удаляются.
+    """
+    articles = articles or {}
+    new = stock.set_index([GROUP, SIZE])[QUANTITY].astype(int)
+    with transaction.atomic():
+        current = {
+            (b.article_group, b.size): b
+            for b in StockBalance.objects.select_for_update().filter(user=user)
+        }
+        old = pd.DataFrame(
+            [(group, size, b.quantity) for (group, size), b in current.items()],
+            columns=[GROUP, SIZE, QUANTITY],
+        ).set_index([GROUP, SIZE])[QUANTITY]
+        delta = new.sub(old, fill_value=0)
+        delta = delta[delta != 0]
+        _record(
+            user,
+            delta.rename("delta").reset_index().assign(kind=kind),
+        )
+
+        removed = [b.pk for key, b in current.items() if key not in new.index]
+        StockBalance.objects.filter(pk__in=removed).delete()
+        _upsert(
+            [
+                StockBalance(
+                    user=user,
+                    article_group=group,
+                    size=size,
+                    quantity=int(quantity),
+                    article=articles.get(group, ""),
+                )
+                for (group, size), quantity in new.items()
+            ]
+        )
+        _changed(user)
+    return len(delta)
+
+
+def _record(user, movements):
+    batch = uuid.uuid4()
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(
+                user=user,
+                batch=batch,
+                kind=kind,
+                article_group=group,
+                size=size,
+                delta=int(delta),
+            )
+            for kind, group, size, delta in movements[
+                ["kind", GROUP, SIZE, "delta"]
+            ].itertuples(index=False)
+        ],
+        batch_size=1000,
+    )
+
+
+def _upsert(balances):
+    StockBalance.objects.bulk_create(
+        balances,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["user", "article_group", "size"],
+        update_fields=["quantity", "article", "updated_at"],
+    )
+
+
+def _changed(user):
+    """Остатки изменились: сбрасываем кэш файла, обновляем запись «Мои отчёты»."""
+    UserReport.objects.update_or_create(
+        user=user,
+        file_name=STOCK_FILENAME,
+        defaults={"file_path": stock_path(user), "report_type": "form5"},
+    )
+    path = full_stock_path(user)
+    transaction.on_commit(lambda: _remove(path))
+
+
+def balances_frame(user):
+    """Текущие остатки в формате output_stock.xlsx (порядок — группа, размер)."""
+    rows = StockBalance.objects.filter(user=user).order_by("article_group", "size")
+    df = pd.DataFrame(
+        list(rows.values_list("article", "size", "quantity")),
+        columns=OUTPUT_COLUMNS,
+    )
+    df[ARTICLE] = df[ARTICLE].mask(df[ARTICLE] == "")
+    df[QUANTITY] = df[QUANTITY].astype(int)
+    return df
+
+
+def balance_articles(user, groups):
+    """
+    Артикулы текущих остатков групп groups — столбец «Артикул поставщика»
+    в порядке output_stock.xlsx. Раньше выбор артикула группы шёл по этому
+    файлу вместе с загрузкой, поэтому он и сейчас идёт первым.
+    """
+    rows = (
+        StockBalance.objects.filter(user=user, article_group__in=groups)
+        .exclude(article="")
+        .order_by("article_group", "size")
+    )
+    return pd.DataFrame(
+        {ARTICLE: list(rows.values_list("article", flat=True))}, dtype=object
+    )
+
+
+def stock_xlsx(user):
+    """
+    Содержимое output_stock.xlsx: готовый файл из кэша или собранный заново
+    из StockBalance, если остатки менялись после последнего скачивания.
+    """
+    path = full_stock_path(user)
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        pass
+
+    version = _version(user)
+    buf = BytesIO()
+    balances_frame(user).to_excel(buf, index=False, engine="openpyxl")
+    content = buf.getvalue()
+    # Остатки изменились, пока собирался файл, — такой файл не кэшируем
+    if _version(user) == version:
+        _store(path, content)
+    return content
+
+
+def _version(user):
+    return (
+        UserReport.objects.filter(user=user, file_name=STOCK_FILENAME)
+        .values_list("last_updated", flat=True)
+        .first()
+    )
+
+
+def _store(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить {path}: {e}")
+        _remove(tmp_path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -1,3 +1,130 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+import pandas as pd
+
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from forms_app import jobs
+from forms_app.ingest import read_sheet
+from forms_app.models import ReportJob, StockRecord
+
+
+class TempMediaMixin:
+    """MEDIA_ROOT во временном каталоге на время теста."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+class ReportJobCleanupTests(TempMediaMixin, TestCase):
+    def test_purge_removes_inputs_of_stale_job(self):
+        user = User.objects.create_user("worker", password="pw")
+        job = jobs.enqueue(
+            "form2",
+            user,
+            params={"mode": "single"},
+            files={"file_single": SimpleUploadedFile("report.xlsx", b"data")},
+        )
+        input_path = default_storage.path(job.inputs["file_single"]["path"])
+        job_dir = default_storage.path(f"report_jobs/inputs/{job.pk}")
+        self.assertTrue(os.path.exists(input_path))
+
+        # Обработчик забрал задачу и умер, не дойдя до удаления входных файлов
+        ReportJob.objects.filter(pk=job.pk).update(
+            status=ReportJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(hours=2),
+        )
+        self.assertEqual(jobs.fail_stale(timeout=60), 1)
+        self.assertEqual(jobs.purge(0), 1)
+
+        self.assertFalse(ReportJob.objects.filter(pk=job.pk).exists())
+        self.assertFalse(os.path.exists(input_path))
+        self.assertFalse(os.path.exists(job_dir))
+
+
+class SaveStockSqlTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("stock", password="pw")
+        self.client.force_login(self.user)
+        self.record = StockRecord.objects.create(
+            user=self.user, article_full_name="ABC-1", size="42", quantity=5
+        )
+
+    def post_edit(self, record, quantity):
+        response = self.client.post(
+            reverse("forms_app:save_stock_sql"),
+            {
+                "row": str(record.pk),
+                f"version_{record.pk}": str(record.version),
+                f"quantity_{record.pk}": str(quantity),
+                f"location_{record.pk}": "Не указано",
+                f"note_{record.pk}": "",
+            },
+        )
+        return [str(m) for m in get_messages(response.wsgi_request)]
+
+    def test_edit_is_saved(self):
+        version = self.record.version
+        notes = self.post_edit(self.record, 7)
+        self.record.refresh_from_db()
+        self.assertEqual((self.record.quantity, self.record.version), (7, version + 1))
+        self.assertEqual(notes, ["✅ Сохранено строк: 1"])
+
+    def test_edit_of_deleted_row_is_a_conflict(self):
+        # Другая вкладка перезагрузила остатки: строки удалены и созданы заново
+        StockRecord.objects.filter(user=self.user).delete()
+        StockRecord.objects.create(
+            user=self.user, article_full_name="ABC-1", size="42", quantity=5
+        )
+
+        notes = self.post_edit(self.record, 7)
+
+        self.assertEqual(len(notes), 1)
+        self.assertIn("удалены или заменены", notes[0])
+        self.assertIn(f"№{self.record.pk}", notes[0])
+        self.assertEqual(StockRecord.objects.get(user=self.user).quantity, 5)
+
+
+class ReadSheetParityTests(TestCase):
+    """read_sheet должен возвращать то же, что pd.read_excel."""
+
+    def setUp(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["Артикул", "Кол-во", "Цена", "Комментарий"])
+        ws.append(["ABC-1", 5, 10.5, "ок"])
+        ws.append([1001, 7, 3.0, None])
+        ws.append(["ABC-3", None, "нет", "брак"])
+        buffer = BytesIO()
+        wb.save(buffer)
+        self.data = buffer.getvalue()
+
+    def assertParity(self, **kwargs):
+        expected = pd.read_excel(BytesIO(self.data), **kwargs)
+        actual = read_sheet(BytesIO(self.data), use_cache=False, **kwargs)
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_default(self):
+        self.assertParity()
+
+    def test_dtype_per_column(self):
+        self.assertParity(dtype={"Артикул": str, "Кол-во": "float64"})
+
+    def test_scalar_dtype_applies_to_all_columns(self):
+        self.assertParity(dtype=str)
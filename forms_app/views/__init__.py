@@ -1,4 +1,19 @@
 # forms_app/views/__init__.py
 
-from .form5_view import form5
-from .stock_replace_view import replace_stock, preview_output_stock
+from importlib import import_module
+
+# Модули представлений импортируются по первому обращению: иначе импорт
+# любого forms_app.views.* (например, success_view из mysite/urls.py)
+# тянет за собой pandas и openpyxl через form5_view.
+_LAZY_EXPORTS = {
+    "form5": "form5_view",
+    "replace_stock": "stock_replace_view",
+    "preview_output_stock": "stock_replace_view",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        module = import_module(f"{__name__}.{_LAZY_EXPORTS[name]}")
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
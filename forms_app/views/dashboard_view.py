@@ -3,14 +3,63 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.db.utils import OperationalError
-import matplotlib
-
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import io, base64
-import pandas as pd
+import base64
 from datetime import timedelta
 
+from forms_app.charts import invalidate, render_png
+
+
+def dashboard_namespace(user):
+    """Префикс графиков дашборда пользователя в кэше forms_app.charts."""
+    return f"dashboard-{user.pk}"
+
+
+def invalidate_dashboard_charts(user):
+    """Сбрасывает графики дашборда — вызывается при изменении Form14Data."""
+    invalidate(dashboard_namespace(user))
+
+
+def trend_7d_spec(records):
+    """График «Заказы vs Выкуплено» по записям Form14Data за неделю."""
+    dates = [r.date.strftime("%d.%m") for r in records]
+    return {
+        "figsize": (8, 4),
+        "series": [
+            # Линия 1: Заказы (синяя)
+            {
+                "x": dates,
+                "y": [r.total_orders_qty or 0 for r in records],
+                "options": {
+                    "marker": "o",
+                    "color": "#007bff",
+                    "linewidth": 2,
+                    "label": "Заказы",
+                    "markersize": 5,
+                },
+            },
+            # Линия 2: Выкуплено (зелёная)
+            {
+                "x": dates,
+                "y": [r.total_sold_qty or 0 for r in records],
+                "options": {
+                    "marker": "s",
+                    "color": "#28a745",
+                    "linewidth": 2,
+                    "label": "Выкуплено",
+                    "markersize": 5,
+                },
+            },
+        ],
+        "title": "📦 Заказы vs 🛍️ Выкуплено (7 дней)",
+        "title_options": {"fontsize": 12, "fontweight": "bold"},
+        "xlabel": "Дата",
+        "ylabel": "Количество, шт.",
+        "xticks": {"rotation": 45, "ha": "right"},
+        "legend": {"fontsize": 9},
+        "grid": {"alpha": 0.3, "linestyle": "--"},
+        "savefig": {"dpi": 100, "bbox_inches": "tight"},
+    }
+
 
 @login_required
 def dashboard(request):
@@ -71,56 +120,11 @@ def dashboard(request):
             user=user, date__range=[week_ago, target_date]
         ).order_by("date")
 
-        if weekly_qs.exists():
-            # Готовим данные
-            data = [
-                {
-                    "date": r.date,
-                    "orders": r.total_orders_qty or 0,
-                    "sold": r.total_sold_qty or 0,
-                }
-                for r in weekly_qs
-            ]
-            df = pd.DataFrame(data)
-            df["date_str"] = pd.to_datetime(df["date"]).dt.strftime("%d.%m")
-
-            buf = io.BytesIO()
-            plt.figure(figsize=(8, 4))
-
-            # Линия 1: Заказы (синяя)
-            plt.plot(
-                df["date_str"],
-                df["orders"],
-                marker="o",
-                color="#007bff",
-                linewidth=2,
-                label="Заказы",
-                markersize=5,
-            )
-            # Линия 2: Выкуплено (зелёная)
-            plt.plot(
-                df["date_str"],
-                df["sold"],
-                marker="s",
-                color="#28a745",
-                linewidth=2,
-                label="Выкуплено",
-                markersize=5,
-            )
-
-            plt.title(
-                "📦 Заказы vs 🛍️ Выкуплено (7 дней)", fontsize=12, fontweight="bold"
-            )
-            plt.xlabel("Дата")
-            plt.ylabel("Количество, шт.")
-            plt.xticks(rotation=45, ha="right")
-            plt.legend(fontsize=9)
-            plt.grid(alpha=0.3, linestyle="--")
-            plt.tight_layout()
-            plt.savefig(buf, format="png", dpi=100, bbox_inches="tight")
-            buf.seek(0)
-            charts["trend_7d"] = base64.b64encode(buf.read()).decode("utf-8")
-            plt.close()
+        records = list(weekly_qs)
+        if records:
+            # PNG берётся из кэша, пока данные недели не изменились
+            png = render_png(trend_7d_spec(records), dashboard_namespace(user))
+            charts["trend_7d"] = base64.b64encode(png).decode("utf-8")
     except Exception:
         pass
 
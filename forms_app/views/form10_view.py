@@ -7,6 +7,7 @@ from django.shortcuts import render
 from django.http import HttpResponse
 from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
 from openpyxl.utils import get_column_letter
+from forms_app.ingest import read_sheet
 
 
 def form10_view(request):
@@ -22,7 +23,7 @@ def form10_view(request):
         else:
             try:
                 # Чтение Excel-файла
-                df_raw = pd.read_excel(uploaded_file, header=1)
+                df_raw = read_sheet(uploaded_file, header=1)
                 df_raw = df_raw.reset_index(drop=True)
 
                 # === Лист 1: Статистика по размерам (уже есть) ===
@@ -10,7 +10,7 @@ from django.http import FileResponse
 import logging
 import tempfile
 import os
-import re  # Добавляем импорт re
+from forms_app.ingest import read_sheet
 
 logger = logging.getLogger(__name__)
 
@@ -80,71 +80,55 @@ fo_sort_order = {
 }
 
 
-def get_federal_district(warehouse_name):
+def warehouse_dimension(warehouses):
     """
-    Определяет федеральный округ по названию склада (уже с префиксом)
-    Берет ПЕРВЫЕ ДВЕ цифры из префикса склада
+    Справочник складов отчёта: для каждого уникального склада — название с
+    префиксом из склад_mapping, федеральный округ, его номер и порядок
+    сортировки. Номер ФО — ПЕРВЫЕ ДВЕ цифры префикса до подчеркивания.
     """
-    if pd.isna(warehouse_name):
-        return "Не определено", "Не определено"
-
-    warehouse_str = str(warehouse_name)
-    print(f"Определяем ФО для склада: {warehouse_str}")  # Для отладки
-
-    # Ищем первые цифры перед подчеркиванием (префикс уже есть из склад_mapping)
-    if "_" in warehouse_str:
-        prefix = warehouse_str.split("_")[0]
-        print(f"Префикс: {prefix}")  # Для отладки
-
-        # Извлекаем только цифры из начала строки
-        digits_match = re.match(r"^(\d+)", prefix)
-        if digits_match:
-            digits = digits_match.group(1)
-            print(f"Цифры: {digits}")  # Для отладки
-
-            # Берем ПЕРВЫЕ ДВЕ цифры для определения ФО
-            if len(digits) >= 2:
-                fo_number = digits[:2]  # Всегда берем первые две цифры!
-            else:
-                fo_number = digits  # Для случаев типа "0"
-
-            print(f"Номер ФО: {fo_number}")  # Для отладки
-
-            if fo_number in fo_mapping:
-                result = fo_mapping[fo_number]
-                print(f"Результат: {result}")  # Для отладки
-                return result, fo_number
-
-    print(f"Не удалось определить ФО для: {warehouse_str}")  # Для отладки
-    return "Не определено", "Не определено"
+    raw = pd.Series(warehouses.dropna().unique())
+    names = raw.map(склад_mapping).fillna(raw)
+
+    # Цифры в начале префикса (до первого "_"); берем первые две
+    fo_number = names.astype(str).str.extract(r"^(\d+)[^_]*_", expand=False).str[:2]
+    district = fo_number.map(fo_mapping)
+    fo_number = fo_number.where(district.notna(), "Не определено")
+
+    return pd.DataFrame(
+        {
+            "Склад": names.values,
+            "Федеральный округ": district.fillna("Не определено").values,
+            "Номер ФО": fo_number.values,
+            "Сортировка ФО": fo_number.map(fo_sort_order).fillna(10).astype(int).values,
+        },
+        index=raw.values,
+    )
 
 
-def get_fo_sort_key(warehouse_name):
+def join_warehouse_dimension(df):
     """
-    Возвращает ключ сортировки для федерального округа
+    Подставляет в отчёт склады с префиксом и добавляет колонки
+    "Федеральный округ", "Номер ФО", "Сортировка ФО" из справочника складов.
+    Склады без названия относятся к "Не определено".
     """
-    _, fo_number = get_federal_district(warehouse_name)
-    return fo_sort_order.get(fo_number, 10)
+    warehouses = warehouse_dimension(df["Склад"])
+    df = df.copy()
+    for column in ("Федеральный округ", "Номер ФО"):
+        df[column] = df["Склад"].map(warehouses[column]).fillna("Не определено")
+    df["Сортировка ФО"] = df["Склад"].map(warehouses["Сортировка ФО"]).fillna(10)
+    df["Сортировка ФО"] = df["Сортировка ФО"].astype(int)
+    df["Склад"] = df["Склад"].map(warehouses["Склад"])
+    return df
 
 
 def process_sales_data_by_federal_district(df):
     """
-    Агрегирует данные по федеральным округам
+    Агрегирует данные по федеральным округам.
+    Ожидает колонки справочника складов (см. join_warehouse_dimension).
     """
-    # Создаем копию исходных данных
-    df_fo = df.copy()
-
-    # ПЕРВОЕ: применяем mapping к складам (как в основной функции)
-    df_fo["Склад"] = df_fo["Склад"].map(склад_mapping).fillna(df_fo["Склад"])
-
-    # ВТОРОЕ: определяем федеральный округ для каждого склада (уже с префиксом)
-    df_fo[["Федеральный округ", "Номер ФО"]] = df_fo["Склад"].apply(
-        lambda x: pd.Series(get_federal_district(x))
-    )
-
     # Группируем по артикулу WB, артикулу продавца, размеру и федеральному округу
     grouped = (
-        df_fo.groupby(
+        df.groupby(
             [
                 "Артикул WB",
                 "Артикул продавца",
@@ -210,6 +194,7 @@ def process_sales_data_by_federal_district(df):
 def process_sales_data(df):
     """
     Обрабатывает DataFrame с данными о продажах согласно вашей логике.
+    Ожидает колонки справочника складов (см. join_warehouse_dimension).
     """
     # Удалить несколько колонок
     df = df.drop(
@@ -226,13 +211,8 @@ def process_sales_data(df):
         ]
     )
 
-    # --- Новый код для замены названий складов ---
-    df["Склад"] = df["Склад"].map(склад_mapping).fillna(df["Склад"])
-
     # === Сортировка: сначала по 'Артикул продавца', затем внутри — по 'Склад', 'Размер' ===
-    # Добавляем колонку для сортировки по федеральным округам
-    df["Сортировка ФО"] = df["Склад"].apply(get_fo_sort_key)
-
+    # Порядок федеральных округов — колонка "Сортировка ФО" справочника складов
     отсортированный_df_артикулы = df.sort_values(
         by=["Артикул продавца", "Сортировка ФО", "Склад", "Размер"],
         ascending=[True, True, True, True],
@@ -527,8 +507,10 @@ def form11_view(request):
             return render(request, "forms_app/form11.html", context)
 
         try:
-            df = pd.read_excel(uploaded_file, header=1)
+            df = read_sheet(uploaded_file, header=1)
             df = df.rename(columns={"шт.": "Заказы шт."})
+            # Склады с префиксом и федеральные округа — один раз на склад
+            df = join_warehouse_dimension(df)
             processed_df = process_sales_data(df)
 
             # Создаем данные по федеральным округам
@@ -9,11 +9,109 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 from django.contrib import messages
+from django.db import transaction
 from forms_app.forms import UploadFileForm12, Form12DataForm
 from forms_app.models import Form12Data
+from forms_app.ingest import read_sheets, format_parse_times
 from openpyxl.styles import Alignment, Font, NamedStyle
 from openpyxl.utils import get_column_letter
 
+# Колонки исходного отчёта WB, которые нужны для группировки
+FORM12_COLUMNS = [
+    "Артикул WB",
+    "Артикул продавца",
+    "Размер",
+    "шт.",
+    "Сумма заказов минус комиссия WB, руб.",
+    "Выкупили, шт.",
+    "К перечислению за товар, руб.",
+    "Текущий остаток, шт.",
+]
+
+BULK_BATCH_SIZE = 1000
+
+
+def aggregate_form12(df_raw):
+    """Группировка по артикулам (как в Form10 - лист 2) за один проход groupby."""
+    return (
+        df_raw.groupby(["Артикул WB", "Артикул продавца"], as_index=False)
+        .agg(
+            **{
+                "Заказы, шт.": ("шт.", "sum"),
+                "Сумма заказов минус комиссия WB, руб.": (
+                    "Сумма заказов минус комиссия WB, руб.",
+                    "sum",
+                ),
+                "Выкупили, шт.": ("Выкупили, шт.", "sum"),
+                "К перечислению за товар, руб.": (
+                    "К перечислению за товар, руб.",
+                    "sum",
+                ),
+                "Текущий остаток, шт.": ("Текущий остаток, шт.", "sum"),
+            }
+        )
+        .round(0)
+    )
+
+
+def _column_array(df, column, integer=False):
+    """Колонка → numpy-массив Python-значений, NaN/ошибки → None."""
+    if column not in df.columns:
+        return np.full(len(df), None, dtype=object)
+    values = pd.to_numeric(df[column], errors="coerce")
+    values = values.replace([np.inf, -np.inf], np.nan)
+    if integer:
+        values = np.trunc(values).astype("Int64")
+    return values.astype(object).where(values.notna(), None).to_numpy()
+
+
+def build_form12_records(df_processed, user, file_date):
+    """
+    Создаёт объекты Form12Data напрямую из numpy-массивов колонок.
+    Возвращает (список объектов, число пропущенных артикулов).
+    """
+    wb_articles = df_processed["Артикул WB"].astype(str).str.strip().to_numpy()
+    valid = (wb_articles != "") & (wb_articles != "0")
+
+    df_valid = df_processed[valid]
+    seller_articles = df_valid["Артикул продавца"].astype(str).str.strip()
+    seller_articles = seller_articles.where(seller_articles != "", None)
+
+    columns = zip(
+        wb_articles[valid],
+        seller_articles.to_numpy(),
+        _column_array(df_valid, "Заказы, шт.", integer=True),
+        _column_array(df_valid, "Сумма заказов минус комиссия WB, руб."),
+        _column_array(df_valid, "Выкупили, шт.", integer=True),
+        _column_array(df_valid, "К перечислению за товар, руб."),
+        _column_array(df_valid, "Текущий остаток, шт.", integer=True),
+    )
+    records = [
+        Form12Data(
+            user=user,
+            wb_article=wb_article,
+            barcode=None,  # Не сохраняем баркод при группировке по артикулам
+            seller_article=seller_article,
+            size=None,  # Не сохраняем размер при группировке по артикулам
+            orders_qty=orders_qty,
+            order_amount_net=order_amount_net,
+            sold_qty=sold_qty,
+            transfer_amount=transfer_amount,
+            current_stock=current_stock,
+            date=file_date,
+        )
+        for (
+            wb_article,
+            seller_article,
+            orders_qty,
+            order_amount_net,
+            sold_qty,
+            transfer_amount,
+            current_stock,
+        ) in columns
+    ]
+    return records, int((~valid).sum())
+
 
 @login_required
 def upload_file12(request):
@@ -32,23 +130,36 @@ def upload_file12(request):
         total_uploaded = 0
         total_skipped = 0
 
+        xlsx_files = []
         for uploaded_file in uploaded_files:
-            print(f"📄 Обработка файла: {uploaded_file.name}")
-
             if not uploaded_file.name.lower().endswith(".xlsx"):
                 messages.error(request, f"❌ {uploaded_file.name} — не .xlsx")
                 total_skipped += 1
                 continue
+            xlsx_files.append(uploaded_file)
+
+        # === ОБРАБОТКА КАК В ФОРМЕ 10 ===
+        # Читаем все исходные файлы сразу (параллельно, см. INGEST_WORKERS)
+        parsed_files = read_sheets(
+            xlsx_files,
+            header=1,
+            usecols=FORM12_COLUMNS,
+            dtype={"Артикул WB": str, "Артикул продавца": str},
+        )
+
+        all_records = []
+        for uploaded_file, parsed in zip(xlsx_files, parsed_files):
+            print(f"📄 Обработка файла: {uploaded_file.name}")
 
             try:
-                file_data = BytesIO(uploaded_file.read())
+                if parsed.error is not None:
+                    raise parsed.error
 
-                # === ОБРАБОТКА КАК В ФОРМЕ 10 ===
-                # Читаем исходный файл (как в Form10)
-                df_raw = pd.read_excel(file_data, header=1)
-                df_raw = df_raw.reset_index(drop=True)
+                df_raw = parsed.df.reset_index(drop=True)
 
-                print(f"   ✅ Прочитано строк из исходного файла: {len(df_raw)}")
+                print(
+                    f"   ✅ Прочитано строк из исходного файла: {len(df_raw)} за {parsed.seconds:.2f} с"
+                )
                 print(f"   📊 Колонки в исходном файле: {list(df_raw.columns)}")
 
                 # Проверяем наличие необходимых колонок в исходном файле
@@ -69,25 +180,7 @@ def upload_file12(request):
                     continue
 
                 # Группируем по артикулам (как в Form10 - лист 2)
-                df_processed = (
-                    df_raw.groupby(
-                        ["Артикул WB", "Артикул продавца"],
-                        as_index=False,
-                    )
-                    .agg(
-                        {
-                            "шт.": "sum",
-                            "Сумма заказов минус комиссия WB, руб.": "sum",
-                            "Выкупили, шт.": "sum",
-                            "К перечислению за товар, руб.": "sum",
-                            "Текущий остаток, шт.": "sum",
-                        }
-                    )
-                    .round(0)
-                )
-
-                # Переименовываем колонку как в Form10
-                df_processed = df_processed.rename(columns={"шт.": "Заказы, шт."})
+                df_processed = aggregate_form12(df_raw)
 
                 print(
                     f"   ✅ Обработано записей после группировки: {len(df_processed)}"
@@ -110,71 +203,42 @@ def upload_file12(request):
                 file_date = datetime.now().date()
             print(f"   📅 Извлечена дата: {file_date}")
 
-            # Подготовка записей для сохранения в БД
-            new_records = []
-            for idx, row in df_processed.iterrows():
-                wb_article = str(row["Артикул WB"]).strip()
-                if not wb_article or wb_article == "0":
-                    print(f"   ⚠️ Пропущен Артикул WB: '{wb_article}' (строка {idx})")
-                    continue
-
-                # Логируем первую валидную строку
-                if len(new_records) == 0:
-                    seller_article_sample = row.get("Артикул продавца", "")
-                    print(
-                        f"   ✅ Первый валидный Артикул WB: {wb_article}, Артикул продавца: {seller_article_sample}"
-                    )
-
-                def safe_float(val):
-                    try:
-                        return float(val) if pd.notna(val) else None
-                    except:
-                        return None
-
-                def safe_int(val):
-                    try:
-                        return int(val) if pd.notna(val) else None
-                    except:
-                        return None
-
-                new_records.append(
-                    Form12Data(
-                        user=request.user,
-                        wb_article=wb_article,
-                        barcode=None,  # Не сохраняем баркод при группировке по артикулам
-                        seller_article=str(row.get("Артикул продавца", "")).strip()
-                        or None,
-                        size=None,  # Не сохраняем размер при группировке по артикулам
-                        orders_qty=safe_int(row.get("Заказы, шт.")),
-                        order_amount_net=safe_float(
-                            row.get("Сумма заказов минус комиссия WB, руб.")
-                        ),
-                        sold_qty=safe_int(row.get("Выкупили, шт.")),
-                        transfer_amount=safe_float(
-                            row.get("К перечислению за товар, руб.")
-                        ),
-                        current_stock=safe_int(row.get("Текущий остаток, шт.")),
-                        date=file_date,
-                    )
+            # Подготовка записей для сохранения в БД (по колонкам, без iterrows)
+            new_records, skipped_rows = build_form12_records(
+                df_processed, request.user, file_date
+            )
+            if skipped_rows:
+                print(f"   ⚠️ Пропущено строк с пустым Артикулом WB: {skipped_rows}")
+            if new_records:
+                print(
+                    f"   ✅ Первый валидный Артикул WB: {new_records[0].wb_article}, Артикул продавца: {new_records[0].seller_article}"
                 )
+            all_records.extend(new_records)
 
-            # Сохраняем в БД
-            try:
-                created = Form12Data.objects.bulk_create(new_records)
-                print(f"   ✅ Сохранено записей в БД: {len(created)}")
-                total_uploaded += len(created)
-            except Exception as e:
-                print(f"   ❌ Ошибка сохранения в БД: {e}")
-                # Пробуем сохранить по одной записи
-                created_count = 0
-                for record in new_records:
-                    try:
-                        record.save()
-                        created_count += 1
-                    except Exception as e2:
-                        print(f"      ❌ Ошибка сохранения записи: {e2}")
-                print(f"   ✅ Сохранено записей (по одной): {created_count}")
-                total_uploaded += created_count
+        # Сохраняем записи всех файлов одной транзакцией
+        try:
+            with transaction.atomic():
+                created = Form12Data.objects.bulk_create(
+                    all_records, batch_size=BULK_BATCH_SIZE
+                )
+            print(f"   ✅ Сохранено записей в БД: {len(created)}")
+            total_uploaded += len(created)
+        except Exception as e:
+            print(f"   ❌ Ошибка сохранения в БД: {e}")
+            # Пробуем сохранить по одной записи
+            created_count = 0
+            for record in all_records:
+                try:
+                    record.save()
+                    created_count += 1
+                except Exception as e2:
+                    print(f"      ❌ Ошибка сохранения записи: {e2}")
+            print(f"   ✅ Сохранено записей (по одной): {created_count}")
+            total_uploaded += created_count
+
+        parse_times = format_parse_times(parsed_files)
+        if parse_times:
+            messages.info(request, f"⏱ Время разбора: {parse_times}")
 
         # 📢 Итоговые сообщения
         if total_uploaded:
@@ -10,6 +10,7 @@ from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.utils import get_column_letter
+from forms_app.ingest import read_sheet
 
 
 def form13_simple_upload(request):
@@ -19,7 +20,7 @@ def form13_simple_upload(request):
             file = request.FILES["file"]
 
             # Загрузка данных (точно как в оригинале)
-            df = pd.read_excel(
+            df = read_sheet(
                 file,
                 sheet_name="Детальная информация",
                 header=1,
@@ -7,11 +7,24 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
+from django.db import transaction
 from forms_app.forms import UploadFileForm14
 from forms_app.models import Form14Data
+from forms_app.ingest import read_sheets, format_parse_times
+from forms_app.views.dashboard_view import invalidate_dashboard_charts
 from openpyxl.styles import Alignment, Font, NamedStyle
 from openpyxl.utils import get_column_letter
 
+# Колонки исходного отчёта WB, которые суммируются за день
+FORM14_COLUMNS = [
+    "Артикул WB",
+    "шт.",
+    "Сумма заказов минус комиссия WB, руб.",
+    "Выкупили, шт.",
+    "К перечислению за товар, руб.",
+    "Текущий остаток, шт.",
+]
+
 
 @login_required
 def upload_file14(request):
@@ -31,23 +44,30 @@ def upload_file14(request):
         total_uploaded = 0
         total_skipped = 0
 
+        xlsx_files = []
         for uploaded_file in uploaded_files:
-            print(f"📄 Form14: Обработка файла: {uploaded_file.name}")
-
             if not uploaded_file.name.lower().endswith(".xlsx"):
                 messages.error(request, f"❌ {uploaded_file.name} — не .xlsx")
                 total_skipped += 1
                 continue
+            xlsx_files.append(uploaded_file)
+
+        # Читаем все исходные файлы сразу (параллельно, см. INGEST_WORKERS)
+        parsed_files = read_sheets(xlsx_files, header=1, usecols=FORM14_COLUMNS)
+
+        # Итоги по дням; при нескольких файлах за один день побеждает последний
+        day_records = {}
+        for uploaded_file, parsed in zip(xlsx_files, parsed_files):
+            print(f"📄 Form14: Обработка файла: {uploaded_file.name}")
 
             try:
-                file_data = BytesIO(uploaded_file.read())
+                if parsed.error is not None:
+                    raise parsed.error
 
-                # Читаем исходный файл (такой же как в Form12)
-                df_raw = pd.read_excel(file_data, header=1)
-                df_raw = df_raw.reset_index(drop=True)
+                df_raw = parsed.df.reset_index(drop=True)
 
                 print(
-                    f"   ✅ Form14: Прочитано строк из исходного файла: {len(df_raw)}"
+                    f"   ✅ Form14: Прочитано строк из исходного файла: {len(df_raw)} за {parsed.seconds:.2f} с"
                 )
                 print(f"   📊 Form14: Колонки в исходном файле: {list(df_raw.columns)}")
 
@@ -100,35 +120,16 @@ def upload_file14(request):
                     file_date = datetime.now().date()
                 print(f"   📅 Form14: Извлечена дата: {file_date}")
 
-                # Проверяем, существует ли уже запись за эту дату
-                existing_record = Form14Data.objects.filter(
-                    user=request.user, date=file_date
-                ).first()
-
-                if existing_record:
-                    # Обновляем существующую запись
-                    existing_record.total_orders_qty = int(total_orders)
-                    existing_record.total_order_amount_net = float(total_order_amount)
-                    existing_record.total_sold_qty = int(total_sold)
-                    existing_record.total_transfer_amount = float(total_transfer)
-                    existing_record.total_current_stock = int(total_stock)
-                    existing_record.save()
-                    print(f"   🔄 Form14: Обновлена запись за {file_date}")
-                    total_uploaded += 1
-                else:
-                    # Создаем новую запись
-                    new_record = Form14Data(
-                        user=request.user,
-                        date=file_date,
-                        total_orders_qty=int(total_orders),
-                        total_order_amount_net=float(total_order_amount),
-                        total_sold_qty=int(total_sold),
-                        total_transfer_amount=float(total_transfer),
-                        total_current_stock=int(total_stock),
-                    )
-                    new_record.save()
-                    print(f"   ✅ Form14: Создана новая запись за {file_date}")
-                    total_uploaded += 1
+                day_records[file_date] = Form14Data(
+                    user=request.user,
+                    date=file_date,
+                    total_orders_qty=int(total_orders),
+                    total_order_amount_net=float(total_order_amount),
+                    total_sold_qty=int(total_sold),
+                    total_transfer_amount=float(total_transfer),
+                    total_current_stock=int(total_stock),
+                )
+                total_uploaded += 1
 
             except Exception as e:
                 print(f"   ❌ Form14: Ошибка обработки: {e}")
@@ -138,6 +139,28 @@ def upload_file14(request):
                 total_skipped += 1
                 continue
 
+        # Создаём или обновляем записи всех дней одной транзакцией
+        with transaction.atomic():
+            Form14Data.objects.bulk_create(
+                list(day_records.values()),
+                update_conflicts=True,
+                unique_fields=["user", "date"],
+                update_fields=[
+                    "total_orders_qty",
+                    "total_order_amount_net",
+                    "total_sold_qty",
+                    "total_transfer_amount",
+                    "total_current_stock",
+                    "updated_at",
+                ],
+            )
+        print(f"   ✅ Form14: Сохранено дней: {len(day_records)}")
+        invalidate_dashboard_charts(request.user)
+
+        parse_times = format_parse_times(parsed_files)
+        if parse_times:
+            messages.info(request, f"⏱ Время разбора: {parse_times}")
+
         # 📢 Итоговые сообщения
         if total_uploaded:
             messages.success(
@@ -273,6 +296,7 @@ def clear_form14_data(request):
     """Очистка всех данных формы 14"""
     if request.method == "POST":
         deleted, _ = Form14Data.objects.filter(user=request.user).delete()
+        invalidate_dashboard_charts(request.user)
         messages.success(
             request, f"✅ Удалено {deleted} записей. Данные формы 14 обнулены."
         )
@@ -304,6 +328,7 @@ def form14_delete_by_date(request):
         deleted_count = Form14Data.objects.filter(
             user=request.user, date=delete_date
         ).delete()[0]
+        invalidate_dashboard_charts(request.user)
 
         if deleted_count:
             messages.success(
@@ -1,17 +1,21 @@
 # views.py - СОВМЕСТНАЯ ВЕРСИЯ (старые функции + новый алгоритм)
 
+import hashlib
+import json
 import os
 import tempfile
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+import matplotlib.colors as mcolors
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, FileResponse
 from django.contrib import messages
+from django.core.files.base import ContentFile
+from django.http import FileResponse
 from django.conf import settings
 from forms_app.forms import PatternForm, CuttingForm
-from forms_app.models import Pattern15
+from forms_app.models import Form15Layout, Pattern15
 
 # ==================== ИМПОРТ ДЛЯ НОВОГО АЛГОРИТМА ====================
 import numpy as np
@@ -20,6 +24,9 @@ from ortools.sat.python import cp_model
 from io import BytesIO
 import time
 import random
+from forms_app.ingest import read_sheet
+from forms_app.jobs import ReportJobError, ReportResult, XLSX_CONTENT_TYPE
+from forms_app.views.report_jobs_view import submit_report_job
 
 # ==================== СТАРЫЕ ФУНКЦИИ (БЕЗ ИЗМЕНЕНИЙ) ====================
 
@@ -57,6 +64,9 @@ def form15_view(request):
                 request.session["fabric_width"] = fabric_width
                 request.session["num_sets"] = num_sets
                 request.session["output_format"] = output_format
+                request.session["solver_mode"] = cutting_form.cleaned_data[
+                    "solver_mode"
+                ]
 
                 # Перенаправляем на страницу расчета
                 return redirect("forms_app:form15_calculate")
@@ -64,7 +74,12 @@ def form15_view(request):
     else:
         pattern_form = PatternForm()
         cutting_form = CuttingForm(
-            initial={"fabric_width": 1500, "num_sets": 1, "output_format": "pdf"}
+            initial={
+                "fabric_width": 1500,
+                "num_sets": 1,
+                "output_format": "pdf",
+                "solver_mode": "hint",
+            }
         )
 
     return render(
@@ -138,7 +153,7 @@ def form15_import_excel(request):
 
         try:
             # Читаем Excel
-            df = pd.read_excel(excel_file)
+            df = read_sheet(excel_file)
 
             # Проверяем обязательные колонки
             required_cols = ["имя", "ширина", "высота"]
@@ -275,6 +290,367 @@ def optimize_packing(patterns, fabric_width, time_limit=180):
     return placements, min_length
 
 
+def shelf_length(patterns, fabric_width):
+    """
+    Длина полотна при простой укладке полками (лекала по убыванию высоты,
+    слева направо, новая полка — когда ряд заполнен). Быстрая верхняя
+    граница для CP-SAT.
+    """
+    length = 0
+    shelf_height = 0
+    x = 0
+    for w, h in sorted(patterns, key=lambda p: -p[1]):
+        if x + w > fabric_width:
+            length += shelf_height
+            shelf_height = 0
+            x = 0
+        shelf_height = max(shelf_height, h)
+        x += w
+    return length + shelf_height
+
+
+def optimize_packing_2d(patterns, fabric_width, time_limit=30, hint=None):
+    """
+    Та же задача, что и optimize_packing, но через интервальные переменные:
+    одно ограничение add_no_overlap_2d вместо четырёх булевых на каждую пару
+    лекал, поэтому модель растёт линейно и справляется со 100+ деталями.
+
+    Дополнительно:
+    - длина зажата между суммарной площадью / ширину и укладкой полками;
+    - избыточное cumulative по длине (в каждом сечении сумма ширин ≤ ширины);
+    - одинаковые лекала (повторы из разных комплектов) упорядочены по y —
+      их перестановки дают те же раскладки;
+    - поиск «снизу-влево»: сначала минимальные y, затем x.
+    hint — готовая раскладка (например, от pack_skyline): она становится
+    стартовым решением и верхней границей длины.
+    Возвращает (placements, min_length) в формате optimize_packing.
+    """
+    n = len(patterns)
+    if n == 0:
+        return None, None
+
+    total_area = sum(w * h for w, h in patterns)
+    lower_bound = max(
+        max(h for _, h in patterns), -(-total_area // fabric_width)
+    )  # округление вверх
+    upper_bound = shelf_length(patterns, fabric_width)
+    if hint is not None:
+        upper_bound = min(upper_bound, hint[1])
+
+    model = cp_model.CpModel()
+
+    x = []
+    y = []
+    x_intervals = []
+    y_intervals = []
+    for i, (w, h) in enumerate(patterns):
+        x.append(model.new_int_var(0, fabric_width - w, f"x_{i}"))
+        y.append(model.new_int_var(0, upper_bound - h, f"y_{i}"))
+        x_intervals.append(model.new_fixed_size_interval_var(x[i], w, f"xi_{i}"))
+        y_intervals.append(model.new_fixed_size_interval_var(y[i], h, f"yi_{i}"))
+
+    model.add_no_overlap_2d(x_intervals, y_intervals)
+    # Избыточное ограничение: сильно ускоряет отсечение по длине
+    model.add_cumulative(y_intervals, [w for w, _ in patterns], fabric_width)
+
+    length = model.new_int_var(lower_bound, upper_bound, "length")
+    for i, (_, h) in enumerate(patterns):
+        model.add(length >= y[i] + h)
+
+    # Нарушение симметрии для одинаковых лекал
+    same_size = {}
+    for i, size in enumerate(patterns):
+        same_size.setdefault(tuple(size), []).append(i)
+    for indices in same_size.values():
+        for a, b in zip(indices, indices[1:]):
+            model.add(y[a] <= y[b])
+
+    model.add_decision_strategy(
+        y, cp_model.CHOOSE_LOWEST_MIN, cp_model.SELECT_MIN_VALUE
+    )
+    model.add_decision_strategy(
+        x, cp_model.CHOOSE_LOWEST_MIN, cp_model.SELECT_MIN_VALUE
+    )
+
+    model.minimize(length)
+
+    if hint is not None:
+        _add_layout_hint(model, x, y, length, same_size, hint)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.num_workers = 8
+
+    status = solver.solve(model)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None, None
+
+    min_length = solver.value(length)
+    print(
+        f"CP-SAT (no_overlap_2d): {solver.status_name(status)}, длина {min_length} мм, "
+        f"нижняя граница {int(solver.best_objective_bound)} мм, "
+        f"{solver.wall_time:.1f} с"
+    )
+
+    placements = []
+    for i, (w, h) in enumerate(patterns):
+        placements.append(
+            {
+                "id": i,
+                "x": solver.value(x[i]),
+                "y": solver.value(y[i]),
+                "width": w,
+                "height": h,
+                "rotated": False,
+            }
+        )
+
+    # Сортируем по Y (снизу вверх), затем по X (слева направо)
+    placements.sort(key=lambda p: (p["y"], p["x"]))
+
+    return placements, min_length
+
+
+def _add_layout_hint(model, x, y, length, same_size, hint):
+    """
+    Передаёт готовую раскладку в CP-SAT как стартовое решение. Позиции
+    одинаковых лекал раздаются по возрастанию y, чтобы подсказка не
+    нарушала ограничения симметрии.
+    """
+    placements, hint_length = hint
+    by_id = {p["id"]: p for p in placements}
+    for indices in same_size.values():
+        positions = sorted((by_id[i]["y"], by_id[i]["x"]) for i in indices)
+        for i, (py, px) in zip(indices, positions):
+            model.add_hint(x[i], px)
+            model.add_hint(y[i], py)
+    model.add_hint(length, hint_length)
+
+
+def pack_skyline(patterns, fabric_width):
+    """
+    Эвристика «skyline, снизу-влево»: лекала по очереди ставятся туда, где
+    их верх окажется ниже всего (при равенстве — левее). Верхний контур
+    уложенных деталей хранится списком отрезков [x, ширина, высота].
+    Пробуются несколько порядков (по высоте, площади, ширине), берётся
+    самая короткая раскладка. Работает за миллисекунды даже для сотен
+    деталей; формат результата как у optimize_packing.
+    """
+    n = len(patterns)
+    if n == 0:
+        return None, None
+
+    orders = [
+        sorted(range(n), key=lambda i: (-patterns[i][1], -patterns[i][0])),
+        sorted(range(n), key=lambda i: -patterns[i][0] * patterns[i][1]),
+        sorted(range(n), key=lambda i: (-patterns[i][0], -patterns[i][1])),
+    ]
+
+    best = None
+    for order in orders:
+        layout = _skyline_layout(patterns, fabric_width, order)
+        if layout is not None and (best is None or layout[1] < best[1]):
+            best = layout
+    if best is None:
+        return None, None
+
+    placements, min_length = best
+    placements.sort(key=lambda p: (p["y"], p["x"]))
+    return placements, min_length
+
+
+def _skyline_layout(patterns, fabric_width, order):
+    skyline = [[0, fabric_width, 0]]  # [x, ширина, высота]
+    placements = []
+    min_length = 0
+
+    for i in order:
+        w, h = patterns[i]
+        if w > fabric_width:
+            return None
+
+        best_top = None
+        best_x = best_y = best_start = None
+        for start in range(len(skyline)):
+            x = skyline[start][0]
+            if x + w > fabric_width:
+                break
+            # Высота опоры — максимум контура под всей шириной лекала
+            y = 0
+            covered = 0
+            j = start
+            while covered < w:
+                y = max(y, skyline[j][2])
+                covered += skyline[j][1]
+                j += 1
+            if best_top is None or (y + h, x) < (best_top, best_x):
+                best_top, best_x, best_y, best_start = y + h, x, y, start
+
+        placements.append(
+            {
+                "id": i,
+                "x": best_x,
+                "y": best_y,
+                "width": w,
+                "height": h,
+                "rotated": False,
+            }
+        )
+        min_length = max(min_length, best_top)
+        _raise_skyline(skyline, best_start, w, best_top)
+
+    return placements, min_length
+
+
+def _raise_skyline(skyline, start, width, top):
+    """Поднимает контур на участке [x, x + width) до высоты top."""
+    x = skyline[start][0]
+    end = x + width
+    j = start
+    # Отрезки, целиком закрытые новой деталью, удаляются
+    while j < len(skyline) and skyline[j][0] + skyline[j][1] <= end:
+        j += 1
+    tail = []
+    if j < len(skyline) and skyline[j][0] < end:
+        # Частично закрытый отрезок укорачивается слева
+        seg_x, seg_w, seg_h = skyline[j]
+        tail = [[end, seg_x + seg_w - end, seg_h]]
+        j += 1
+    skyline[start:j] = [[x, width, top]] + tail
+
+    # Соседние отрезки одной высоты сливаются
+    merged = [skyline[0]]
+    for seg in skyline[1:]:
+        if seg[2] == merged[-1][2]:
+            merged[-1] = [merged[-1][0], merged[-1][1] + seg[1], seg[2]]
+        else:
+            merged.append(seg)
+    skyline[:] = merged
+
+
+SOLVER_MODES = ("hint", "heuristic", "cpsat")
+
+
+def solve_layout(patterns, fabric_width, mode="hint", time_limit=30):
+    """
+    Раскладка выбранным способом:
+    heuristic — только pack_skyline (мгновенно);
+    cpsat — только optimize_packing_2d;
+    hint — pack_skyline как стартовое решение для CP-SAT. CP-SAT не даст
+    результата хуже подсказки, а если не успеет — остаётся эвристика.
+    """
+    if mode == "cpsat":
+        return optimize_packing_2d(patterns, fabric_width, time_limit=time_limit)
+
+    start = time.time()
+    heuristic = pack_skyline(patterns, fabric_width)
+    print(
+        f"Эвристика skyline: длина {heuristic[1]} мм, "
+        f"{(time.time() - start) * 1000:.0f} мс"
+    )
+    if mode == "heuristic" or heuristic[0] is None:
+        return heuristic
+
+    placements, min_length = optimize_packing_2d(
+        patterns, fabric_width, time_limit=time_limit, hint=heuristic
+    )
+    if placements is None or min_length > heuristic[1]:
+        return heuristic
+    return placements, min_length
+
+
+# Меняется при любой правке алгоритмов раскладки: старые записи Form15Layout
+# перестают совпадать по ключу
+SOLVER_VERSION = "no_overlap_2d+skyline/1"
+
+
+def layout_cache_key(base_patterns, fabric_width, num_sets, solver_mode):
+    """SHA-256 от канонического описания задачи раскроя."""
+    payload = json.dumps(
+        [
+            SOLVER_VERSION,
+            sorted([w, h] for w, h in base_patterns),
+            fabric_width,
+            num_sets,
+            solver_mode,
+        ]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def solve_layout_cached(
+    user, base_patterns, fabric_width, num_sets, solver_mode, time_limit=30
+):
+    """
+    solve_layout с кэшем в Form15Layout. Решатель получает лекала в
+    каноническом порядке (по размерам), поэтому сохранённая раскладка
+    подходит для любой нумерации тех же лекал; id деталей переводятся
+    обратно в порядок base_patterns * num_sets.
+    Возвращает (placements, min_length, запись кэша).
+    """
+    key = layout_cache_key(base_patterns, fabric_width, num_sets, solver_mode)
+    order = sorted(range(len(base_patterns)), key=lambda i: base_patterns[i])
+
+    layout = Form15Layout.objects.filter(user=user, key=key).first()
+    if layout is not None:
+        print(f"Раскладка взята из кэша: длина {layout.min_length} мм")
+    else:
+        canonical = [base_patterns[i] for i in order] * num_sets
+        placements, min_length = solve_layout(
+            canonical, fabric_width, mode=solver_mode, time_limit=time_limit
+        )
+        if not placements:
+            return None, None, None
+        layout, _ = Form15Layout.objects.update_or_create(
+            user=user,
+            key=key,
+            defaults={
+                "fabric_width": fabric_width,
+                "num_sets": num_sets,
+                "solver_mode": solver_mode,
+                "placements": placements,
+                "min_length": min_length,
+            },
+        )
+
+    count = len(base_patterns)
+    placements = []
+    for p in layout.placements:
+        set_index, canonical_index = divmod(p["id"], count)
+        placements.append({**p, "id": set_index * count + order[canonical_index]})
+    return placements, layout.min_length, layout
+
+
+def _layout_file(layout, output_format):
+    return layout.pdf_file if output_format == "pdf" else layout.excel_file
+
+
+def cached_layout_result(layout, num_sets, output_format):
+    """Готовый PDF/Excel из кэша или None."""
+    stored = _layout_file(layout, output_format)
+    if not stored:
+        return None
+    try:
+        with stored.open("rb") as f:
+            content = f.read()
+    except OSError:
+        return None
+    if output_format == "pdf":
+        return ReportResult(
+            content, f"cutting_layout_{num_sets}_sets.pdf", "application/pdf"
+        )
+    return ReportResult(
+        content, f"cutting_layout_{num_sets}_sets.xlsx", XLSX_CONTENT_TYPE
+    )
+
+
+def store_layout_result(layout, output_format, result):
+    extension = "pdf" if output_format == "pdf" else "xlsx"
+    _layout_file(layout, output_format).save(
+        f"{layout.key[:32]}.{extension}", ContentFile(result.content)
+    )
+
+
 def create_visualization(
     placements,
     fabric_width,
@@ -328,7 +704,7 @@ def create_visualization(
     else:
         # Генерируем цвета для большего количества комплектов
         colors = plt.cm.Set3(np.linspace(0, 1, num_sets))
-        set_colors = [plt.colors.to_hex(c) for c in colors]
+        set_colors = [mcolors.to_hex(c) for c in colors]
 
     # ===== РИСУЕМ ЛЕКАЛА =====
     for idx, p in enumerate(placements):
@@ -601,7 +977,7 @@ def create_visualization(
     return fig
 
 
-def generate_pdf_response_new(
+def generate_pdf_new(
     placements,
     fabric_width,
     min_length,
@@ -636,15 +1012,10 @@ def generate_pdf_response_new(
     buffer.seek(0)
 
     filename = f"cutting_layout_{num_sets}_sets.pdf"
-    return FileResponse(
-        buffer,
-        as_attachment=True,
-        filename=filename,
-        content_type="application/pdf",
-    )
+    return ReportResult(buffer.getvalue(), filename, "application/pdf")
 
 
-def generate_excel_response_new(
+def generate_excel_new(
     placements, display_numbers, all_names, fabric_width, min_length, num_sets
 ):
     """
@@ -711,14 +1082,170 @@ def generate_excel_response_new(
     output.seek(0)
 
     filename = f"cutting_layout_{num_sets}_sets.xlsx"
-    response = FileResponse(
-        output,
-        as_attachment=True,
-        filename=filename,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    return ReportResult(output.getvalue(), filename, XLSX_CONTENT_TYPE)
+
+
+def run_form15_job(job):
+    """Фоновая задача формы 15 (см. forms_app/jobs.py)"""
+    fabric_width = job.params["fabric_width"]
+    num_sets = job.params["num_sets"]
+    output_format = job.params["output_format"]
+    solver_mode = job.params.get("solver_mode", "hint")
+    patterns = Pattern15.objects.filter(user=job.user).order_by("pattern_number")
+    if not patterns.exists():
+        raise ReportJobError("Добавьте хотя бы одно лекало для расчета")
+
+    # Подготавливаем данные лекал
+    base_patterns = []
+    base_numbers = []
+    base_names = []
+    is_mirrored_list = []  # Новый список: является ли лекало зеркальным
+
+    for pattern in patterns:
+        base_patterns.append((pattern.width, pattern.height))
+        base_numbers.append(pattern.pattern_number)
+        base_names.append(pattern.name)
+
+        # Проверяем, является ли лекало зеркальным
+        is_mirrored = any(
+            keyword.lower() in pattern.name.lower()
+            for keyword in [
+                "зеркало",
+                "зеркальное",
+                "зеркальная",
+                "mirror",
+                "mirrored",
+            ]
+        )
+        is_mirrored_list.append(is_mirrored)
+
+        print(
+            f"Лекало #{pattern.pattern_number}: {pattern.name} - {pattern.width}x{pattern.height} мм"
+            f"{' [ЗЕРКАЛО]' if is_mirrored else ''}"
+        )
+
+    # Формируем полный список лекал для всех комплектов
+    all_patterns = base_patterns * num_sets
+    all_numbers = base_numbers * num_sets  # Номера будут повторяться
+    all_names = base_names * num_sets
+    all_mirrored = is_mirrored_list * num_sets  # Признаки зеркальности тоже повторяются
+
+    print(f"Всего лекал для раскроя: {len(all_patterns)}")
+    print(f"Уникальных лекал: {len(base_patterns)}")
+    print(f"Номера для первого комплекта: {base_numbers}")
+    print(
+        f"Зеркальные лекала: {[name for name, is_mirrored in zip(base_names, is_mirrored_list) if is_mirrored]}"
+    )
+
+    # Проверяем ширину
+    for i, (w, h) in enumerate(all_patterns):
+        if w > fabric_width:
+            error_msg = (
+                f"Лекало '{all_names[i]}' ({w} мм) шире полотна ({fabric_width} мм)!"
+            )
+            print(f"ОШИБКА: {error_msg}")
+            raise ReportJobError(error_msg)
+
+    # ===== ИСПОЛЬЗУЕМ НОВЫЙ АЛГОРИТМ =====
+    print(f"Начинаем оптимизацию (режим: {solver_mode})...")
+    job.set_progress(
+        10,
+        (
+            "Эвристическая раскладка"
+            if solver_mode == "heuristic"
+            else "Поиск раскладки (до 30 с)"
+        ),
+    )
+    placements, min_length, layout = solve_layout_cached(
+        job.user, base_patterns, fabric_width, num_sets, solver_mode, time_limit=30
     )
 
-    return response
+    if not placements:
+        print("Не удалось найти решение")
+        raise ReportJobError("Не удалось найти решение за отведенное время")
+
+    cached = cached_layout_result(layout, num_sets, output_format)
+    if cached is not None:
+        print("=== form15_calculate: Файл взят из кэша ===")
+        return cached
+
+    print(f"Упаковка завершена. Минимальная длина: {min_length} мм")
+    print(f"Количество упакованных элементов: {len(placements)}")
+
+    # ===== ПРОСТАЯ СИСТЕМА: НОМЕРА ТОЛЬКО ИЗ ПЕРВОГО КОМПЛЕКТА =====
+    # Каждому размещенному лекалу назначаем номер из первого комплекта
+    for p in placements:
+        idx = p["id"]  # индекс в all_patterns
+        if idx < len(all_numbers):
+            # Берем номер из первого комплекта (модульная арифметика)
+            base_idx = idx % len(base_numbers)
+            p["display_number"] = base_numbers[base_idx]  # номер из первого комплекта
+            p["base_name"] = base_names[base_idx]  # имя из первого комплекта
+            p["is_mirrored"] = is_mirrored_list[base_idx]  # является ли зеркальным
+            p["set_number"] = (
+                idx // len(base_numbers)
+            ) + 1  # номер комплекта (1, 2, ...)
+        else:
+            p["display_number"] = idx + 1
+            p["base_name"] = f"Лекало_{idx+1}"
+            p["is_mirrored"] = False
+            p["set_number"] = 1
+
+    # ===== ПОДГОТОВКА ДАННЫХ ДЛЯ ЛЕГЕНДЫ =====
+    # В легенде показываем ТОЛЬКО уникальные лекала первого комплекта
+    legend_numbers = base_numbers.copy()  # Номера из первого комплекта
+    legend_names = base_names.copy()  # Имена из первого комплекта
+
+    # Создаем информацию для легенды
+    legend_info = {}
+    for i, (num, name) in enumerate(zip(base_numbers, base_names)):
+        legend_info[num] = {
+            "name": name,
+            "display_name": name,  # Без указания комплекта
+            "width": base_patterns[i][0],
+            "height": base_patterns[i][1],
+            "is_mirrored": is_mirrored_list[i],  # Добавляем информацию о зеркальности
+        }
+
+    print(f"Номера в легенде: {legend_numbers}")
+    print(f"Всего записей в легенде: {len(legend_numbers)}")
+    print(
+        f"Зеркальные лекала в легенде: {[num for num, info in legend_info.items() if info['is_mirrored']]}"
+    )
+
+    # ===== СОБИРАЕМ ДАННЫЕ ДЛЯ РИСУНКА =====
+    # На рисунке будут те же номера, что и в легенде (повторяющиеся)
+    display_numbers_on_chart = [p["display_number"] for p in placements]
+    print(f"Пример номеров на рисунке: {display_numbers_on_chart[:15]}")
+
+    # Генерация файла
+    if output_format == "pdf":
+        print("Генерация PDF файла...")
+        result = generate_pdf_new(
+            placements,
+            fabric_width,
+            min_length,
+            num_sets,
+            display_numbers_on_chart,  # номера для рисунка (из первого комплекта)
+            legend_numbers,  # номера для легенды (только первый комплект)
+            legend_names,  # имена для легенды (только первый комплект)
+            legend_info,  # информация о лекалах
+        )
+    else:
+        print("Генерация Excel файла...")
+        # Для Excel можно сохранить полную информацию
+        result = generate_excel_new(
+            placements,
+            [p["display_number"] for p in placements],
+            [p["base_name"] for p in placements],
+            fabric_width,
+            min_length,
+            num_sets,
+        )
+
+    store_layout_result(layout, output_format, result)
+    print("=== form15_calculate: Файл успешно сгенерирован ===")
+    return result
 
 
 @login_required
@@ -731,9 +1258,13 @@ def form15_calculate(request):
         fabric_width = int(request.POST.get("fabric_width", 1500))
         num_sets = int(request.POST.get("num_sets", 1))
         output_format = request.POST.get("output_format", "pdf")
+        solver_mode = request.POST.get("solver_mode", "hint")
+        if solver_mode not in SOLVER_MODES:
+            solver_mode = "hint"
 
         print(
-            f"Параметры: ширина={fabric_width}, комплектов={num_sets}, формат={output_format}"
+            f"Параметры: ширина={fabric_width}, комплектов={num_sets}, формат={output_format}, "
+            f"режим={solver_mode}"
         )
     except (ValueError, TypeError) as e:
         print(f"Ошибка получения параметров: {e}")
@@ -748,155 +1279,30 @@ def form15_calculate(request):
         messages.error(request, "Добавьте хотя бы одно лекало для расчета")
         return redirect("forms_app:form15_view")
 
-    try:
-        # Подготавливаем данные лекал
-        base_patterns = []
-        base_numbers = []
-        base_names = []
-        is_mirrored_list = []  # Новый список: является ли лекало зеркальным
-
-        for pattern in patterns:
-            base_patterns.append((pattern.width, pattern.height))
-            base_numbers.append(pattern.pattern_number)
-            base_names.append(pattern.name)
-
-            # Проверяем, является ли лекало зеркальным
-            is_mirrored = any(
-                keyword.lower() in pattern.name.lower()
-                for keyword in [
-                    "зеркало",
-                    "зеркальное",
-                    "зеркальная",
-                    "mirror",
-                    "mirrored",
-                ]
-            )
-            is_mirrored_list.append(is_mirrored)
-
-            print(
-                f"Лекало #{pattern.pattern_number}: {pattern.name} - {pattern.width}x{pattern.height} мм"
-                f"{' [ЗЕРКАЛО]' if is_mirrored else ''}"
-            )
-
-        # Формируем полный список лекал для всех комплектов
-        all_patterns = base_patterns * num_sets
-        all_numbers = base_numbers * num_sets  # Номера будут повторяться
-        all_names = base_names * num_sets
-        all_mirrored = (
-            is_mirrored_list * num_sets
-        )  # Признаки зеркальности тоже повторяются
-
-        print(f"Всего лекал для раскроя: {len(all_patterns)}")
-        print(f"Уникальных лекал: {len(base_patterns)}")
-        print(f"Номера для первого комплекта: {base_numbers}")
-        print(
-            f"Зеркальные лекала: {[name for name, is_mirrored in zip(base_names, is_mirrored_list) if is_mirrored]}"
-        )
-
-        # Проверяем ширину
-        for i, (w, h) in enumerate(all_patterns):
-            if w > fabric_width:
-                error_msg = f"Лекало '{all_names[i]}' ({w} мм) шире полотна ({fabric_width} мм)!"
-                print(f"ОШИБКА: {error_msg}")
-                messages.error(request, error_msg)
-                return redirect("forms_app:form15_view")
-
-        # ===== ИСПОЛЬЗУЕМ НОВЫЙ АЛГОРИТМ =====
-        print("Начинаем оптимизацию с OR-Tools...")
-        placements, min_length = optimize_packing(
-            all_patterns, fabric_width, time_limit=30
+    # Та же задача уже решалась и файл сохранён — отдаём сразу
+    base_patterns = [(p.width, p.height) for p in patterns]
+    layout = Form15Layout.objects.filter(
+        user=request.user,
+        key=layout_cache_key(base_patterns, fabric_width, num_sets, solver_mode),
+    ).first()
+    cached = cached_layout_result(layout, num_sets, output_format) if layout else None
+    if cached is not None:
+        print("=== form15_calculate: Файл взят из кэша ===")
+        return FileResponse(
+            BytesIO(cached.content),
+            as_attachment=True,
+            filename=cached.filename,
+            content_type=cached.content_type,
         )
 
-        if not placements:
-            print("Не удалось найти решение")
-            messages.error(request, "Не удалось найти решение за отведенное время")
-            return redirect("forms_app:form15_view")
-
-        print(f"Упаковка завершена. Минимальная длина: {min_length} мм")
-        print(f"Количество упакованных элементов: {len(placements)}")
-
-        # ===== ПРОСТАЯ СИСТЕМА: НОМЕРА ТОЛЬКО ИЗ ПЕРВОГО КОМПЛЕКТА =====
-        # Каждому размещенному лекалу назначаем номер из первого комплекта
-        for p in placements:
-            idx = p["id"]  # индекс в all_patterns
-            if idx < len(all_numbers):
-                # Берем номер из первого комплекта (модульная арифметика)
-                base_idx = idx % len(base_numbers)
-                p["display_number"] = base_numbers[
-                    base_idx
-                ]  # номер из первого комплекта
-                p["base_name"] = base_names[base_idx]  # имя из первого комплекта
-                p["is_mirrored"] = is_mirrored_list[base_idx]  # является ли зеркальным
-                p["set_number"] = (
-                    idx // len(base_numbers)
-                ) + 1  # номер комплекта (1, 2, ...)
-            else:
-                p["display_number"] = idx + 1
-                p["base_name"] = f"Лекало_{idx+1}"
-                p["is_mirrored"] = False
-                p["set_number"] = 1
-
-        # ===== ПОДГОТОВКА ДАННЫХ ДЛЯ ЛЕГЕНДЫ =====
-        # В легенде показываем ТОЛЬКО уникальные лекала первого комплекта
-        legend_numbers = base_numbers.copy()  # Номера из первого комплекта
-        legend_names = base_names.copy()  # Имена из первого комплекта
-
-        # Создаем информацию для легенды
-        legend_info = {}
-        for i, (num, name) in enumerate(zip(base_numbers, base_names)):
-            legend_info[num] = {
-                "name": name,
-                "display_name": name,  # Без указания комплекта
-                "width": base_patterns[i][0],
-                "height": base_patterns[i][1],
-                "is_mirrored": is_mirrored_list[
-                    i
-                ],  # Добавляем информацию о зеркальности
-            }
-
-        print(f"Номера в легенде: {legend_numbers}")
-        print(f"Всего записей в легенде: {len(legend_numbers)}")
-        print(
-            f"Зеркальные лекала в легенде: {[num for num, info in legend_info.items() if info['is_mirrored']]}"
-        )
-
-        # ===== СОБИРАЕМ ДАННЫЕ ДЛЯ РИСУНКА =====
-        # На рисунке будут те же номера, что и в легенде (повторяющиеся)
-        display_numbers_on_chart = [p["display_number"] for p in placements]
-        print(f"Пример номеров на рисунке: {display_numbers_on_chart[:15]}")
-
-        # Генерация файла
-        if output_format == "pdf":
-            print("Генерация PDF файла...")
-            response = generate_pdf_response_new(
-                placements,
-                fabric_width,
-                min_length,
-                num_sets,
-                display_numbers_on_chart,  # номера для рисунка (из первого комплекта)
-                legend_numbers,  # номера для легенды (только первый комплект)
-                legend_names,  # имена для легенды (только первый комплект)
-                legend_info,  # информация о лекалах
-            )
-        else:
-            print("Генерация Excel файла...")
-            # Для Excel можно сохранить полную информацию
-            response = generate_excel_response_new(
-                placements,
-                [p["display_number"] for p in placements],
-                [p["base_name"] for p in placements],
-                fabric_width,
-                min_length,
-                num_sets,
-            )
-
-        print("=== form15_calculate: Файл успешно сгенерирован ===")
-        return response
-
-    except Exception as e:
-        print(f"=== КРИТИЧЕСКАЯ ОШИБКА: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
-        messages.error(request, f"Ошибка при расчете: {str(e)}")
-        return redirect("forms_app:form15_view")
+    # Сам расчёт выполняется в фоне (run_report_workers)
+    return submit_report_job(
+        request,
+        "form15",
+        params={
+            "fabric_width": fabric_width,
+            "num_sets": num_sets,
+            "output_format": output_format,
+            "solver_mode": solver_mode,
+        },
+    )
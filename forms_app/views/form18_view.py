@@ -2,44 +2,281 @@
 
 import pandas as pd
 import numpy as np
+from django.http import FileResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
 from io import BytesIO
 from openpyxl.styles import Alignment, Font, NamedStyle
 from openpyxl.utils import get_column_letter
 
 from forms_app.models import ArticleCost
 from forms_app.forms import ArticleCostForm
+from forms_app.ingest import read_sheet
+from forms_app.wb_finance import (
+    PROFIT_GROUPS,
+    aggregate_report,
+    apply_parameters,
+    article_prefix,
+    cost_params,
+    last_upload,
+    load_aggregates,
+    profit_groups,
+    recalc_context,
+    store_aggregates,
+)
+from forms_app.jobs import ReportResult, XLSX_CONTENT_TYPE
+from forms_app.search import search
+from forms_app.views.report_jobs_view import submit_report_job
+
+REPORT_FILENAME = "form18_financial_report.xlsx"
+
+
+def article_cost_map(user):
+    """Индивидуальная себестоимость из базы: {WB артикул: себестоимость}"""
+    return {
+        str(ac.wb_article): float(ac.cost)
+        for ac in ArticleCost.objects.filter(user=user)
+    }
+
+
+def write_form18_report(report, nalog_procent):
+    """
+    Формирует Excel-отчёт формы 18 из FinancialReport (см. wb_finance);
+    возвращает BytesIO.
+    """
+    third_merged, deductions = report
+
+    # Порядок колонок
+    desired_columns_order = [
+        "Код номенклатуры",
+        "Артикул поставщика",
+        "Чистые продажи Наши",
+        "Чистая реализация ВБ",
+        "Чистое Перечисление",
+        "Чистое Перечисление без Логистики",
+        "Себестоимость за 1 шт",
+        "Себес Продаж",
+        "Прибыль",
+        "Наша цена Средняя",
+        "Реализация ВБ Средняя",
+        "К перечислению Среднее",
+        "Прибыль на 1 Юбку",
+        "Заказы",
+        "Чистые продажи, шт",
+        "%Выкупа",
+        "СПП Средняя",
+        "% СПП",
+        "Логистика/1 Продажа",
+        "% Рентабельности(Приб/ЧП_без_Л)",
+        "План на неделю",
+        "План по доходу",
+        "Сумма Продаж Наша Цена",
+        "Сумма Продаж по цене ВБ",
+        "Сумма Продаж Перечисление С Лог",
+        "Логистика",
+        "К Перечислению без Логистики",
+        "Сумма СПП",
+        "% Лог/рс",
+        "% Лог/Наша Цена",
+        "Возвраты Наша цена",
+        "Возвраты реализация ВБ",
+        "Возвраты к перечислению",
+        "Логистика Средняя",
+        "К Перечислению без Логистики Средняя",
+        "% Лог/Перечисление с Лог Средний",
+        "% Лог/Наша цена Средний",
+        "Возвраты, шт",
+        "Отмена",
+        "Маржа",
+        "Налоги",
+        "Доп удержание на кол-во заказов 1 Артикула",
+    ]
+
+    existing_columns = [
+        col for col in desired_columns_order if col in third_merged.columns
+    ]
+    third_merged = third_merged[existing_columns].copy()
+
+    # =============== СОРТИРОВКА ПО ПРИБЫЛИ (УЖЕ С ДОП. УДЕРЖАНИЯМИ) ===============
+    third_merged.sort_values(by="Прибыль", ascending=False, inplace=True)
+
+    # =============== ГРУППИРОВКА ПО ПРИБЫЛИ (УЖЕ С ДОП. УДЕРЖАНИЯМИ) ===============
+    third_merged["Группа по прибыли"] = profit_groups(third_merged["Прибыль"])
+
+    # Удаляем строки с нулевой прибылью
+    third_merged = third_merged[third_merged["Прибыль"] != 0].copy()
+
+    # =============== ИТОГОВАЯ СВОДКА ===============
+    totall_summary = pd.DataFrame(
+        {
+            "Колонка": [
+                "Логистика",
+                "Сумма СПП",
+                "Сумма Чистых перечислений без Возвратов и Логистики",
+                "Чистые продажи, шт",
+                "Заказы",
+                "Себестоимость продаж",
+                "Процент налога",
+                "Налоги",
+                "Прибыль без налога - маржа",
+                "Штрафы",
+                "Хранение",
+                "Удержания",
+                "Операции на приемке",
+                "Прибыль (с учетом доп. удержаний)",
+            ],
+            "Общая сумма": [
+                third_merged["Логистика"].sum(),
+                third_merged["Сумма СПП"].sum(),
+                third_merged["Чистое Перечисление без Логистики"].sum(),
+                third_merged["Чистые продажи, шт"].sum(),
+                third_merged["Заказы"].sum(),
+                third_merged["Себес Продаж"].sum(),
+                f"{round(nalog_procent * 100, 1)}%",
+                third_merged["Налоги"].sum(),
+                third_merged["Маржа"].sum(),
+                deductions["Общая сумма штрафов"],
+                deductions["Хранение"],
+                deductions["Удержания"],
+                deductions["Операции на приемке"],
+                third_merged["Прибыль"].sum(),
+            ],
+        }
+    )
 
+    # =============== ГРУППИРОВКА ПО ПРЕФИКСАМ АРТИКУЛОВ ===============
+    third_merged["Префикс"] = article_prefix(third_merged["Артикул поставщика"])
+
+    # Определяем категории и соответствующие им префиксы артикула
+    categories = {
+        # fmt: off
+        "Лето": ["422", "423", "424", "425"],
+        "Новые": ["400", "401", "402", "403", "404", "405", "406", "407", "408", "409", 
+                    "410", "411", "412", "413", "414", "415", "416", "417", "418", "419", 
+                    "420", "421"],
+        "Экокожа черная": ["051", "054", "072", "079", "085", "395", "403", "404"],
+        "Джерси черная": ["001", "002", "003", "004", "005", "050", "122", "400", "401", "402", "408"],
+        "Экокожа цветная": ["052", "053", "056", "057", "058", "059", "060", "061", "062", "063", "064",
+                            "065", "066", "067", "068", "069", "070", "071", "073", "074", "075", "076",
+                            "077", "078", "080", "081", "082", "083", "084", "093", "100", "102",
+                            "103", "123", "101", "405" , "406", "407"],
+        "Джерси цветная": ["006", "007", "008", "009", "010", "011", "012", "013", "014", "015", "016",
+                        "017", "018", "019", "020", "021", "022", "023", "024", "025", "026", "027",
+                        "028", "029", "030", "031", "032", "033", "034", "035", "036", "037", "038",
+                        "039", "040", "041", "042", "043", "044", "045", "046", "047", "048", "049",
+                        "055", "086", "087", "088", "089", "090", "091", "092", "094", "095", "096",
+                        "097", "098", "099", "104", "105", "106", "107", "108", "109", "110", "111",
+                        "112", "113", "114", "115", "116", "117", "118", "119", "120", "121", "131",
+                        "132", "133", "281", "341", "342", "343", "344", "345", "346", "347", "348",
+                        "349", "350", "351", "354", "355", "356", "357", "358", "387"],
+        "Джерси Короткая Черная (40)": ["395"],
+        # fmt: on
+        # Можно добавлять новые категории здесь
+    }
+
+    # =============== ЭКСПОРТ В EXCEL ===============
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        # Лист "Основные данные"
+        third_merged.to_excel(
+            writer,
+            sheet_name="Основные данные",
+            index=False,
+            columns=existing_columns,
+        )
+
+        # Лист "Итоговая сводка"
+        totall_summary.to_excel(writer, sheet_name="Итоговая сводка", index=False)
+
+        # Листы с категориями артикулов
+        for category, prefixes in categories.items():
+            filtered = third_merged[third_merged["Префикс"].isin(prefixes)].drop(
+                columns=["Префикс"]
+            )
+            safe_sheet_name = category[:31]
+            filtered.to_excel(writer, sheet_name=safe_sheet_name, index=False)
+
+            # Специальная обработка для "Джерси Короткая..."
+            if category == "Джерси Короткая Черная (40,50)":
+                ws = writer.sheets[safe_sheet_name]
+                col_names = {col: idx for idx, col in enumerate(filtered.columns, 1)}
+                try:
+                    qty_col = col_names["Чистые продажи, шт"]
+                    cost_col = col_names["Себес Продаж"]
+                    margin_col = col_names["Маржа"]
+                    tax_col = col_names["Налоги"]
+                    extra_col = col_names["Доп удержание на кол-во заказов 1 Артикула"]
+                    profit_col = col_names["Прибыль"]
+
+                    cost_letter = get_column_letter(cost_col)
+                    ws[f"{cost_letter}1"] = "Себес Продаж (400р)"
+
+                    for row_idx in range(2, len(filtered) + 2):
+                        qty_cell = f"{get_column_letter(qty_col)}{row_idx}"
+                        cost_cell = f"{get_column_letter(cost_col)}{row_idx}"
+                        margin_cell = f"{get_column_letter(margin_col)}{row_idx}"
+                        tax_cell = f"{get_column_letter(tax_col)}{row_idx}"
+                        extra_cell = f"{get_column_letter(extra_col)}{row_idx}"
+                        profit_cell = f"{get_column_letter(profit_col)}{row_idx}"
+
+                        ws[cost_cell] = f"={qty_cell}*400"
+                        ws[margin_cell] = (
+                            f"={get_column_letter(col_names['Чистое Перечисление без Логистики'])}{row_idx}-{cost_cell}"
+                        )
+                        ws[profit_cell] = f"={margin_cell}-{tax_cell}-{extra_cell}"
+                except KeyError:
+                    pass
+
+        # Листы с группами по прибыли
+        for category in PROFIT_GROUPS:
+            filtered = third_merged[third_merged["Группа по прибыли"] == category]
+            safe_sheet_name = category[:31]
+            filtered.to_excel(writer, sheet_name=safe_sheet_name, index=False)
+
+        # Форматирование заголовков
+        header_style = NamedStyle(
+            name="header_style",
+            alignment=Alignment(wrap_text=True, horizontal="center", vertical="center"),
+            font=Font(bold=True),
+        )
+        for sheet in writer.sheets.values():
+            for cell in sheet[1]:
+                cell.style = header_style
+            for column in sheet.columns:
+                max_length = max(
+                    (len(str(cell.value)) if cell.value else 0 for cell in column[1:]),
+                    default=0,
+                )
+                sheet.column_dimensions[column[0].column_letter].width = min(
+                    max_length + 10, 65
+                )
 
-def safe_convert_to_int(value):
-    try:
-        if isinstance(value, (pd.Series, pd.DataFrame)):
-            return pd.to_numeric(value, errors="coerce").fillna(0).astype(int)
-        return int(float(value))
-    except (ValueError, TypeError):
-        return 0
-
-
-def safe_convert_to_float(value):
-    try:
-        if isinstance(value, (pd.Series, pd.DataFrame)):
-            return pd.to_numeric(value, errors="coerce").fillna(0.0)
-        return float(value)
-    except (ValueError, TypeError):
-        return 0.0
-
-
-def safe_mean_calculation(x, decimals=1):
-    try:
-        filtered = x[x != 0]
-        if len(filtered) > 0:
-            return round(float(filtered.mean()), decimals)
-        return 0.0
-    except Exception:
-        return 0.0
+    output.seek(0)
+    return output
+
+
+def run_form18_job(job):
+    """Фоновая задача формы 18 (см. forms_app/jobs.py)"""
+    params = job.params
+    job.set_progress(5, "Чтение файла")
+    with job.open_input("report_file") as f:
+        df = read_sheet(f)
+    # Код номенклатуры — строка, как WB артикул в ArticleCost
+    df["Код номенклатуры"] = df["Код номенклатуры"].astype(str).str.strip()
+
+    job.set_progress(30, "Расчёт показателей")
+    # Агрегаты сохраняются для пересчёта без повторной загрузки
+    aggregates = aggregate_report(df)
+    store_aggregates(job, aggregates)
+    report = apply_parameters(
+        aggregates,
+        params["nalog_procent"],
+        params["sebestoimost"],
+        cost_map=article_cost_map(job.user),
+    )
+    output = write_form18_report(report, params["nalog_procent"])
+    return ReportResult(output.getvalue(), REPORT_FILENAME, XLSX_CONTENT_TYPE)
 
 
 @login_required
@@ -56,742 +293,19 @@ def form18_list(request):
                     return redirect("forms_app:form18_list")
 
                 # Параметры из формы
-                try:
-                    sebestoimost = float(request.POST.get("sebestoimost", 600))
-                except (ValueError, TypeError):
-                    sebestoimost = 600.0
-
-                try:
-                    nalog_str = request.POST.get("nalog_procent", "7").replace(",", ".")
-                    nalog_procent = float(nalog_str) / 100
-                    nalog_procent = max(0.0, min(1.0, nalog_procent))
-                except (ValueError, TypeError):
-                    nalog_procent = 0.07
-
-                df = pd.read_excel(file)
-
-                # =============== ИСПРАВЛЕНИЕ: Приведение названий колонок ===============
-                # Приводим названия колонок к стандартному виду
-                if (
-                    "Платная приемка" in df.columns
-                    and "Операции на приемке" not in df.columns
-                ):
-                    df = df.rename(columns={"Платная приемка": "Операции на приемке"})
-
-                # Приводим Код номенклатуры к строке сразу
-                df["Код номенклатуры"] = df["Код номенклатуры"].astype(str).str.strip()
-
-                # Список числовых колонок
-                numeric_cols = [
-                    "Цена розничная",
-                    "Вайлдберриз реализовал Товар (Пр)",
-                    "К перечислению Продавцу за реализованный Товар",
-                    "Услуги по доставке товара покупателю",
-                ]
-
-                for col in numeric_cols:
-                    if col in df.columns:
-                        df[col] = df[col].apply(safe_convert_to_float)
-
-                # Агрегация по коду номенклатуры
-                sums1_per_category = (
-                    df.groupby("Код номенклатуры")
-                    .agg(
-                        {
-                            "Артикул поставщика": "first",
-                            "Цена розничная": "sum",
-                            "Вайлдберриз реализовал Товар (Пр)": "sum",
-                            "К перечислению Продавцу за реализованный Товар": "sum",
-                            "Услуги по доставке товара покупателю": "sum",
-                        }
-                    )
-                    .reset_index()
-                    .query("`Код номенклатуры` != 0")
-                )
-
-                for col in numeric_cols:
-                    sums1_per_category[col] = sums1_per_category[col].apply(
-                        safe_convert_to_int
-                    )
-
-                sums1_per_category["К Перечислению без Логистики"] = (
-                    sums1_per_category["К перечислению Продавцу за реализованный Товар"]
-                    - sums1_per_category["Услуги по доставке товара покупателю"]
-                ).apply(safe_convert_to_int)
-
-                sums1_per_category["Сумма СПП"] = (
-                    sums1_per_category["Цена розничная"]
-                    - sums1_per_category["Вайлдберриз реализовал Товар (Пр)"]
-                ).apply(safe_convert_to_int)
-
-                # Расчет процентов с обработкой деления на 0
-                sums1_per_category["% Лог/рс"] = (
-                    np.where(
-                        sums1_per_category[
-                            "К перечислению Продавцу за реализованный Товар"
-                        ]
-                        == 0,
-                        0,
-                        (
-                            sums1_per_category["Услуги по доставке товара покупателю"]
-                            / sums1_per_category[
-                                "К перечислению Продавцу за реализованный Товар"
-                            ]
-                        )
-                        * 100,
-                    )
-                ).round(1)
-
-                sums1_per_category["% Лог/Наша Цена"] = (
-                    np.where(
-                        sums1_per_category["Цена розничная"] == 0,
-                        0,
-                        (
-                            sums1_per_category["Услуги по доставке товара покупателю"]
-                            / sums1_per_category["Цена розничная"]
-                        )
-                        * 100,
-                    )
-                ).round(1)
-
-                # Возвраты
-                returns_by_code = (
-                    df[df["Тип документа"] == "Возврат"]
-                    .groupby("Код номенклатуры")
-                    .agg(
-                        {
-                            "Цена розничная": "sum",
-                            "Вайлдберриз реализовал Товар (Пр)": "sum",
-                            "К перечислению Продавцу за реализованный Товар": "sum",
-                        }
-                    )
-                    .reset_index()
-                    .rename(
-                        columns={
-                            "Цена розничная": "Возвраты Наша цена",
-                            "Вайлдберриз реализовал Товар (Пр)": "Возвраты реализация ВБ",
-                            "К перечислению Продавцу за реализованный Товар": "Возвраты к перечислению",
-                        }
-                    )
-                )
-
-                for col in [
-                    "Возвраты Наша цена",
-                    "Возвраты реализация ВБ",
-                    "Возвраты к перечислению",
-                ]:
-                    returns_by_code[col] = returns_by_code[col].apply(
-                        safe_convert_to_int
-                    )
-
-                first_merged = sums1_per_category.merge(
-                    returns_by_code, on="Код номенклатуры", how="left"
-                ).fillna(0)
-
-                # Расчет чистых продаж
-                first_merged["Чистые продажи Наши"] = (
-                    first_merged["Цена розничная"] - first_merged["Возвраты Наша цена"]
-                ).apply(safe_convert_to_int)
-
-                first_merged["Чистая реализация ВБ"] = (
-                    first_merged["Вайлдберриз реализовал Товар (Пр)"]
-                    - (first_merged["Возвраты реализация ВБ"] * 2)
-                ).apply(safe_convert_to_int)
-
-                first_merged["Чистое Перечисление"] = (
-                    first_merged["К перечислению Продавцу за реализованный Товар"]
-                    - first_merged["Возвраты к перечислению"]
-                ).apply(safe_convert_to_int)
-
-                first_merged["Чистое Перечисление без Логистики"] = (
-                    first_merged["Чистое Перечисление"]
-                    - first_merged["Услуги по доставке товара покупателю"]
-                ).apply(safe_convert_to_int)
-
-                # Средние значения
-                cost_per_category = (
-                    df.groupby("Код номенклатуры")
-                    .agg(
-                        {
-                            "Артикул поставщика": "first",
-                            "Цена розничная": safe_mean_calculation,
-                            "Вайлдберриз реализовал Товар (Пр)": safe_mean_calculation,
-                            "К перечислению Продавцу за реализованный Товар": safe_mean_calculation,
-                            "Услуги по доставке товара покупателю": lambda x: round(
-                                safe_convert_to_float(x.mean() * 2), 1
-                            ),
-                        }
-                    )
-                    .reset_index()
-                )
-
-                cost_per_category["СПП Средняя"] = (
-                    cost_per_category["Цена розничная"]
-                    - cost_per_category["Вайлдберриз реализовал Товар (Пр)"]
-                ).round(1)
-
-                cost_per_category["К Перечислению без Логистики Средняя"] = (
-                    cost_per_category["К перечислению Продавцу за реализованный Товар"]
-                    - cost_per_category["Услуги по доставке товара покупателю"]
-                ).round(1)
-
-                cost_per_category["% Лог/Перечисление с Лог Средний"] = (
-                    np.where(
-                        cost_per_category[
-                            "К перечислению Продавцу за реализованный Товар"
-                        ]
-                        == 0,
-                        0,
-                        (
-                            cost_per_category["Услуги по доставке товара покупателю"]
-                            / cost_per_category[
-                                "К перечислению Продавцу за реализованный Товар"
-                            ]
-                        )
-                        * 100,
-                    )
-                ).round(1)
-
-                cost_per_category["% Лог/Наша цена Средний"] = (
-                    np.where(
-                        cost_per_category["Цена розничная"] == 0,
-                        0,
-                        (
-                            cost_per_category["Услуги по доставке товара покупателю"]
-                            / cost_per_category["Цена розничная"]
-                        )
-                        * 100,
-                    )
-                ).round(1)
-
-                second_merged = first_merged.merge(
-                    cost_per_category,
-                    on="Код номенклатуры",
-                    how="left",
-                    suffixes=("", "_Среднее"),
-                ).fillna(0)
-
-                # === ОБРАБОТКА ЛОГИСТИКИ И СЕБЕСТОИМОСТИ ===
-                log_col = next(
-                    (col for col in df.columns if "Виды логистики" in col), None
-                )
-                if log_col:
-                    df_exploded = df.explode(log_col)
-                    df_exploded[log_col] = df_exploded[log_col].fillna("Не указано")
-
-                    status_log = (
-                        df_exploded.groupby("Код номенклатуры")
-                        .agg(
-                            {
-                                log_col: lambda x: x.value_counts().to_dict(),
-                                "Артикул поставщика": "first",
-                            }
-                        )
-                        .reset_index()
-                    )
-
-                    status_log = pd.concat(
-                        [
-                            status_log.drop(log_col, axis=1),
-                            status_log[log_col].apply(pd.Series).fillna(0),
-                        ],
-                        axis=1,
-                    )
-
-                    required_events = [
-                        "К клиенту при продаже",
-                        "От клиента при возврате",
-                        "От клиента при отмене",
-                    ]
-                    for event in required_events:
-                        if event not in status_log.columns:
-                            status_log[event] = 0
-                        status_log[event] = (
-                            pd.to_numeric(status_log[event], errors="coerce")
-                            .fillna(0)
-                            .astype(float)
-                        )
-
-                    numerator = status_log["К клиенту при продаже"]
-                    denominator = (
-                        status_log["К клиенту при продаже"]
-                        + status_log["От клиента при возврате"]
-                        + status_log["От клиента при отмене"]
-                    )
-
-                    with np.errstate(divide="ignore", invalid="ignore"):
-                        buyout_rate = np.where(
-                            denominator == 0, 0.0, (numerator / denominator) * 100
-                        )
-                    status_log["%Выкупа"] = np.round(buyout_rate.astype(float), 1)
-
-                    # === ИНДИВИДУАЛЬНАЯ СЕБЕСТОИМОСТЬ ИЗ БАЗЫ ===
-                    cost_map = {
-                        str(ac.wb_article): float(ac.cost)
-                        for ac in ArticleCost.objects.filter(user=request.user)
-                    }
-
-                    # Себестоимость за 1 шт
-                    status_log["Себестоимость за 1 шт"] = (
-                        status_log["Код номенклатуры"]
-                        .map(cost_map)
-                        .fillna(sebestoimost)
-                        .astype(float)
-                    )
-
-                    # Себестоимость продаж
-                    status_log["Себес Продаж"] = (
-                        status_log["К клиенту при продаже"]
-                        * status_log["Себестоимость за 1 шт"]
-                    ).round(0)
-
-                    status_log["Чистые продажи, шт"] = numerator
-                    status_log["Заказы"] = denominator
-
-                    third_merged = second_merged.merge(
-                        status_log[
-                            [
-                                "Код номенклатуры",
-                                "%Выкупа",
-                                "Себес Продаж",
-                                "Себестоимость за 1 шт",
-                                "Чистые продажи, шт",
-                                "Заказы",
-                                "От клиента при возврате",
-                                "От клиента при отмене",
-                            ]
-                        ],
-                        on="Код номенклатуры",
-                        how="left",
-                    ).fillna(0)
-                else:
-                    # Если нет колонки логистики — нельзя определить продажи
-                    third_merged = second_merged.copy()
-                    third_merged["Себес Продаж"] = 0
-                    third_merged["Себестоимость за 1 шт"] = sebestoimost
-                    third_merged["Чистые продажи, шт"] = 0
-                    third_merged["Заказы"] = 0
-                    third_merged["%Выкупа"] = 0.0
-                    third_merged["От клиента при возврате"] = 0
-                    third_merged["От клиента при отмене"] = 0
-
-                # Переименование столбцов
-                third_merged = third_merged.rename(
-                    columns={
-                        "Цена розничная": "Сумма Продаж Наша Цена",
-                        "Вайлдберриз реализовал Товар (Пр)": "Сумма Продаж по цене ВБ",
-                        "К перечислению Продавцу за реализованный Товар": "Сумма Продаж Перечисление С Лог",
-                        "Услуги по доставке товара покупателю": "Логистика",
-                        "От клиента при возврате": "Возвраты, шт",
-                        "От клиента при отмене": "Отмена",
-                        "Цена розничная_Среднее": "Наша цена Средняя",
-                        "Вайлдберриз реализовал Товар (Пр)_Среднее": "Реализация ВБ Средняя",
-                        "К перечислению Продавцу за реализованный Товар_Среднее": "К перечислению Среднее",
-                        "Услуги по доставке товара покупателю_Среднее": "Логистика Средняя",
-                    }
+                sebestoimost, nalog_procent = cost_params(request.POST)
+
+                # Сам расчёт выполняется в фоне (run_report_workers)
+                return submit_report_job(
+                    request,
+                    "form18",
+                    params={
+                        "sebestoimost": sebestoimost,
+                        "nalog_procent": nalog_procent,
+                    },
+                    files={"report_file": file},
                 )
 
-                # =============== ВЫЧИСЛЕНИЕ МАРЖИ И НАЛОГОВ ===============
-                third_merged["Маржа"] = (
-                    third_merged["Чистое Перечисление без Логистики"]
-                    - third_merged["Себес Продаж"]
-                ).round(1)
-
-                third_merged["Налоги"] = (
-                    third_merged["Чистая реализация ВБ"] * nalog_procent
-                ).round(1)
-
-                # =============== ВЫЧИСЛЕНИЕ ДОПОЛНИТЕЛЬНЫХ УДЕРЖАНИЙ ===============
-                # Проверяем, какое название колонки присутствует в данных
-                operacii_column = None
-                if "Операции на приемке" in df.columns:
-                    operacii_column = "Операции на приемке"
-                elif "Платная приемка" in df.columns:
-                    operacii_column = "Платная приемка"
-
-                # Если есть соответствующая колонка, выполняем агрегацию
-                if operacii_column:
-                    all_add_log = (
-                        df.groupby("Обоснование для оплаты")
-                        .agg(
-                            {
-                                "Услуги по доставке товара покупателю": "sum",
-                                "Общая сумма штрафов": "sum",
-                                "Хранение": "sum",
-                                "Удержания": "sum",
-                                operacii_column: "sum",
-                            }
-                        )
-                        .reset_index()
-                    )
-
-                    # Переименовываем для единообразия
-                    all_add_log = all_add_log.rename(
-                        columns={operacii_column: "Операции на приемке"}
-                    )
-                else:
-                    # Если нет ни одной из колонок, создаем пустую
-                    all_add_log = (
-                        df.groupby("Обоснование для оплаты")
-                        .agg(
-                            {
-                                "Услуги по доставке товара покупателю": "sum",
-                                "Общая сумма штрафов": "sum",
-                                "Хранение": "sum",
-                                "Удержания": "sum",
-                            }
-                        )
-                        .reset_index()
-                    )
-                    all_add_log["Операции на приемке"] = 0
-
-                sum_dop_uderzhany = (
-                    all_add_log["Общая сумма штрафов"].sum()
-                    + all_add_log["Хранение"].sum()
-                    + all_add_log["Удержания"].sum()
-                    + all_add_log["Операции на приемке"].sum()
-                )
-
-                sum_zakaz = third_merged["Заказы"].sum()
-
-                # Распределяем доп. удержания пропорционально заказам
-                third_merged["Доп удержание на кол-во заказов 1 Артикула"] = (
-                    (sum_dop_uderzhany / sum_zakaz) * third_merged["Заказы"]
-                ).round(1)
-
-                # =============== ПРАВИЛЬНАЯ ПРИБЫЛЬ С УЧЕТОМ ДОП. УДЕРЖАНИЙ ===============
-                third_merged["Прибыль"] = (
-                    third_merged["Маржа"]
-                    - third_merged["Налоги"]
-                    - third_merged["Доп удержание на кол-во заказов 1 Артикула"]
-                ).round(1)
-
-                # =============== ДОПОЛНИТЕЛЬНЫЕ ПОКАЗАТЕЛИ ===============
-                # Прибыль на 1 юбку
-                third_merged["Прибыль на 1 Юбку"] = (
-                    third_merged.apply(
-                        lambda row: (
-                            (row["Прибыль"] / row["Чистые продажи, шт"])
-                            if row["Чистые продажи, шт"] > 0
-                            else (
-                                row["Прибыль"] / row["Заказы"]
-                                if row["Заказы"] > 0
-                                else 0
-                            )
-                        ),
-                        axis=1,
-                    )
-                    .replace([np.inf, -np.inf], 0)
-                    .fillna(0)
-                    .round(1)
-                )
-
-                # % СПП
-                third_merged["% СПП"] = (
-                    (third_merged["СПП Средняя"] / third_merged["Наша цена Средняя"])
-                    * 100
-                ).round(1)
-
-                # Доп. колонки
-                third_merged["План на неделю"] = ""
-                third_merged["План по доходу"] = ""
-
-                # нагрузка логистики на Одну проданную юбку
-                third_merged["Логистика/1 Продажа"] = np.where(
-                    third_merged["Чистые продажи, шт"] == 0,
-                    -third_merged["Логистика"],
-                    (
-                        third_merged["Логистика"] / third_merged["Чистые продажи, шт"]
-                    ).round(1),
-                )
-
-                # Рентабельность Общих продаж
-                def calculate_rentability(row):
-                    payment = row["Чистое Перечисление без Логистики"]
-                    profit = row["Прибыль"]
-
-                    if payment == 0:
-                        return profit
-
-                    # Рассчитываем рентабельность
-                    result = profit / payment * 100
-
-                    # Если оба числа отрицательные, результат будет положительным,
-                    # но это неправильно, так как это убыток
-                    if profit < 0:
-                        result = -abs(result)
-
-                    return round(result, 1)
-
-                third_merged["% Рентабельности(Приб/ЧП_без_Л)"] = third_merged.apply(
-                    calculate_rentability, axis=1
-                ).fillna(0)
-
-                # Порядок колонок
-                desired_columns_order = [
-                    "Код номенклатуры",
-                    "Артикул поставщика",
-                    "Чистые продажи Наши",
-                    "Чистая реализация ВБ",
-                    "Чистое Перечисление",
-                    "Чистое Перечисление без Логистики",
-                    "Себестоимость за 1 шт",
-                    "Себес Продаж",
-                    "Прибыль",
-                    "Наша цена Средняя",
-                    "Реализация ВБ Средняя",
-                    "К перечислению Среднее",
-                    "Прибыль на 1 Юбку",
-                    "Заказы",
-                    "Чистые продажи, шт",
-                    "%Выкупа",
-                    "СПП Средняя",
-                    "% СПП",
-                    "Логистика/1 Продажа",
-                    "% Рентабельности(Приб/ЧП_без_Л)",
-                    "План на неделю",
-                    "План по доходу",
-                    "Сумма Продаж Наша Цена",
-                    "Сумма Продаж по цене ВБ",
-                    "Сумма Продаж Перечисление С Лог",
-                    "Логистика",
-                    "К Перечислению без Логистики",
-                    "Сумма СПП",
-                    "% Лог/рс",
-                    "% Лог/Наша Цена",
-                    "Возвраты Наша цена",
-                    "Возвраты реализация ВБ",
-                    "Возвраты к перечислению",
-                    "Логистика Средняя",
-                    "К Перечислению без Логистики Средняя",
-                    "% Лог/Перечисление с Лог Средний",
-                    "% Лог/Наша цена Средний",
-                    "Возвраты, шт",
-                    "Отмена",
-                    "Маржа",
-                    "Налоги",
-                    "Доп удержание на кол-во заказов 1 Артикула",
-                ]
-
-                existing_columns = [
-                    col for col in desired_columns_order if col in third_merged.columns
-                ]
-                third_merged = third_merged[existing_columns]
-
-                # =============== СОРТИРОВКА ПО ПРИБЫЛИ (УЖЕ С ДОП. УДЕРЖАНИЯМИ) ===============
-                third_merged.sort_values(by="Прибыль", ascending=False, inplace=True)
-
-                # =============== ГРУППИРОВКА ПО ПРИБЫЛИ (УЖЕ С ДОП. УДЕРЖАНИЯМИ) ===============
-                conditions = [
-                    third_merged["Прибыль"] > 10000,
-                    (third_merged["Прибыль"] >= 5000)
-                    & (third_merged["Прибыль"] <= 10000),
-                    (third_merged["Прибыль"] > 0) & (third_merged["Прибыль"] < 5000),
-                    third_merged["Прибыль"] < 0,
-                ]
-                categories_profit = [
-                    "1. >10 000",
-                    "2. 5 000 - 10 000",
-                    "3. 0 - 5 000",
-                    "4. <0 (убытки)",
-                ]
-                third_merged["Группа по прибыли"] = np.select(
-                    conditions, categories_profit, default="Не попал"
-                )
-
-                # Удаляем строки с нулевой прибылью
-                third_merged = third_merged[third_merged["Прибыль"] != 0].copy()
-
-                # =============== ИТОГОВАЯ СВОДКА ===============
-                totall_summary = pd.DataFrame(
-                    {
-                        "Колонка": [
-                            "Логистика",
-                            "Сумма СПП",
-                            "Сумма Чистых перечислений без Возвратов и Логистики",
-                            "Чистые продажи, шт",
-                            "Заказы",
-                            "Себестоимость продаж",
-                            "Процент налога",
-                            "Налоги",
-                            "Прибыль без налога - маржа",
-                            "Штрафы",
-                            "Хранение",
-                            "Удержания",
-                            "Операции на приемке",
-                            "Прибыль (с учетом доп. удержаний)",
-                        ],
-                        "Общая сумма": [
-                            third_merged["Логистика"].sum(),
-                            third_merged["Сумма СПП"].sum(),
-                            third_merged["Чистое Перечисление без Логистики"].sum(),
-                            third_merged["Чистые продажи, шт"].sum(),
-                            third_merged["Заказы"].sum(),
-                            third_merged["Себес Продаж"].sum(),
-                            f"{round(nalog_procent * 100, 1)}%",
-                            third_merged["Налоги"].sum(),
-                            third_merged["Маржа"].sum(),
-                            all_add_log["Общая сумма штрафов"].sum(),
-                            all_add_log["Хранение"].sum(),
-                            all_add_log["Удержания"].sum(),
-                            all_add_log["Операции на приемке"].sum(),
-                            third_merged["Прибыль"].sum(),
-                        ],
-                    }
-                )
-
-                # =============== ГРУППИРОВКА ПО ПРЕФИКСАМ АРТИКУЛОВ ===============
-                def get_prefix(article):
-                    try:
-                        return str(article).split("_")[0][:3]
-                    except:
-                        return ""
-
-                third_merged["Префикс"] = third_merged["Артикул поставщика"].apply(
-                    get_prefix
-                )
-
-                # Определяем категории и соответствующие им префиксы артикула
-                categories = {
-                    # fmt: off
-                    "Лето": ["422", "423", "424", "425"],
-                    "Новые": ["400", "401", "402", "403", "404", "405", "406", "407", "408", "409", 
-                                "410", "411", "412", "413", "414", "415", "416", "417", "418", "419", 
-                                "420", "421"],
-                    "Экокожа черная": ["051", "054", "072", "079", "085", "395", "403", "404"],
-                    "Джерси черная": ["001", "002", "003", "004", "005", "050", "122", "400", "401", "402", "408"],
-                    "Экокожа цветная": ["052", "053", "056", "057", "058", "059", "060", "061", "062", "063", "064",
-                                        "065", "066", "067", "068", "069", "070", "071", "073", "074", "075", "076",
-                                        "077", "078", "080", "081", "082", "083", "084", "093", "100", "102",
-                                        "103", "123", "101", "405" , "406", "407"],
-                    "Джерси цветная": ["006", "007", "008", "009", "010", "011", "012", "013", "014", "015", "016",
-                                    "017", "018", "019", "020", "021", "022", "023", "024", "025", "026", "027",
-                                    "028", "029", "030", "031", "032", "033", "034", "035", "036", "037", "038",
-                                    "039", "040", "041", "042", "043", "044", "045", "046", "047", "048", "049",
-                                    "055", "086", "087", "088", "089", "090", "091", "092", "094", "095", "096",
-                                    "097", "098", "099", "104", "105", "106", "107", "108", "109", "110", "111",
-                                    "112", "113", "114", "115", "116", "117", "118", "119", "120", "121", "131",
-                                    "132", "133", "281", "341", "342", "343", "344", "345", "346", "347", "348",
-                                    "349", "350", "351", "354", "355", "356", "357", "358", "387"],
-                    "Джерси Короткая Черная (40)": ["395"],
-                    # fmt: on
-                    # Можно добавлять новые категории здесь
-                }
-
-                # =============== ЭКСПОРТ В EXCEL ===============
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                    # Лист "Основные данные"
-                    third_merged.to_excel(
-                        writer,
-                        sheet_name="Основные данные",
-                        index=False,
-                        columns=existing_columns,
-                    )
-
-                    # Лист "Итоговая сводка"
-                    totall_summary.to_excel(
-                        writer, sheet_name="Итоговая сводка", index=False
-                    )
-
-                    # Листы с категориями артикулов
-                    for category, prefixes in categories.items():
-                        filtered = third_merged[
-                            third_merged["Префикс"].isin(prefixes)
-                        ].drop(columns=["Префикс"])
-                        safe_sheet_name = category[:31]
-                        filtered.to_excel(
-                            writer, sheet_name=safe_sheet_name, index=False
-                        )
-
-                        # Специальная обработка для "Джерси Короткая..."
-                        if category == "Джерси Короткая Черная (40,50)":
-                            ws = writer.sheets[safe_sheet_name]
-                            col_names = {
-                                col: idx for idx, col in enumerate(filtered.columns, 1)
-                            }
-                            try:
-                                qty_col = col_names["Чистые продажи, шт"]
-                                cost_col = col_names["Себес Продаж"]
-                                margin_col = col_names["Маржа"]
-                                tax_col = col_names["Налоги"]
-                                extra_col = col_names[
-                                    "Доп удержание на кол-во заказов 1 Артикула"
-                                ]
-                                profit_col = col_names["Прибыль"]
-
-                                cost_letter = get_column_letter(cost_col)
-                                ws[f"{cost_letter}1"] = "Себес Продаж (400р)"
-
-                                for row_idx in range(2, len(filtered) + 2):
-                                    qty_cell = f"{get_column_letter(qty_col)}{row_idx}"
-                                    cost_cell = (
-                                        f"{get_column_letter(cost_col)}{row_idx}"
-                                    )
-                                    margin_cell = (
-                                        f"{get_column_letter(margin_col)}{row_idx}"
-                                    )
-                                    tax_cell = f"{get_column_letter(tax_col)}{row_idx}"
-                                    extra_cell = (
-                                        f"{get_column_letter(extra_col)}{row_idx}"
-                                    )
-                                    profit_cell = (
-                                        f"{get_column_letter(profit_col)}{row_idx}"
-                                    )
-
-                                    ws[cost_cell] = f"={qty_cell}*400"
-                                    ws[margin_cell] = (
-                                        f"={get_column_letter(col_names['Чистое Перечисление без Логистики'])}{row_idx}-{cost_cell}"
-                                    )
-                                    ws[profit_cell] = (
-                                        f"={margin_cell}-{tax_cell}-{extra_cell}"
-                                    )
-                            except KeyError:
-                                pass
-
-                    # Листы с группами по прибыли
-                    for category in categories_profit:
-                        filtered = third_merged[
-                            third_merged["Группа по прибыли"] == category
-                        ]
-                        safe_sheet_name = category[:31]
-                        filtered.to_excel(
-                            writer, sheet_name=safe_sheet_name, index=False
-                        )
-
-                    # Форматирование заголовков
-                    header_style = NamedStyle(
-                        name="header_style",
-                        alignment=Alignment(
-                            wrap_text=True, horizontal="center", vertical="center"
-                        ),
-                        font=Font(bold=True),
-                    )
-                    for sheet in writer.sheets.values():
-                        for cell in sheet[1]:
-                            cell.style = header_style
-                        for column in sheet.columns:
-                            max_length = max(
-                                (
-                                    len(str(cell.value)) if cell.value else 0
-                                    for cell in column[1:]
-                                ),
-                                default=0,
-                            )
-                            sheet.column_dimensions[column[0].column_letter].width = (
-                                min(max_length + 10, 65)
-                            )
-
-                output.seek(0)
-                response = HttpResponse(
-                    output.getvalue(),
-                    content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                )
-                response["Content-Disposition"] = (
-                    'attachment; filename="form18_financial_report.xlsx"'
-                )
-                return response
-
             except Exception as e:
                 import traceback
 
@@ -799,6 +313,34 @@ def form18_list(request):
                 messages.error(request, f"Ошибка при обработке: {str(e)}")
                 return redirect("forms_app:form18_list")
 
+        # === Пересчёт последнего отчёта с текущей себестоимостью ===
+        elif action == "recalculate":
+            job = last_upload("form18", request)
+            aggregates = load_aggregates(job) if job is not None else None
+            if aggregates is None:
+                messages.error(
+                    request,
+                    "Нет сохранённого отчёта для пересчёта — загрузите файл заново.",
+                )
+                return redirect("forms_app:form18_list")
+
+            sebestoimost, nalog_procent = cost_params(request.POST)
+            report = apply_parameters(
+                aggregates,
+                nalog_procent,
+                sebestoimost,
+                cost_map=article_cost_map(request.user),
+            )
+            output = write_form18_report(report, nalog_procent)
+            response = FileResponse(
+                output,
+                as_attachment=True,
+                filename=REPORT_FILENAME,
+                content_type=XLSX_CONTENT_TYPE,
+            )
+            response["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+            return response
+
         # === Добавление артикула ===
         elif action == "add_article":
             form = ArticleCostForm(request.POST)
@@ -819,8 +361,19 @@ def form18_list(request):
 
     # === GET-запрос ===
     form = ArticleCostForm()
-    records = ArticleCost.objects.filter(user=request.user).order_by("-id")
-    return render(request, "forms_app/form18.html", {"form": form, "records": records})
+    query = request.GET.get("q", "").strip()
+    records = search(ArticleCost.objects.filter(user=request.user), query)
+    records = records.order_by("-id")
+    return render(
+        request,
+        "forms_app/form18.html",
+        {
+            "form": form,
+            "records": records,
+            "query": query,
+            **recalc_context("form18", request),
+        },
+    )
 
 
 @login_required
@@ -1,20 +1,29 @@
+import hashlib
+import json
+import re
+from collections import namedtuple
 import pandas as pd
 import numpy as np
+from pandas.api.types import is_numeric_dtype
 from io import BytesIO
 from datetime import datetime
 import time
 import uuid
 import warnings
 from django import forms
+from django.core.cache import cache
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
+from copy import copy
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
 from django.views.decorators.csrf import csrf_protect
-from urllib.parse import quote
+from forms_app.ingest import read_sheet
+from forms_app.jobs import ReportJobError, ReportResult, XLSX_CONTENT_TYPE
+from forms_app.views.report_jobs_view import submit_report_job
 
 warnings.filterwarnings("ignore")
 
@@ -50,134 +59,220 @@ class Form19AdvancedUploadForm(forms.Form):
 
 
 # ===== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ =====
-def find_region_columns(df):
-    """Находит колонки 'Регион отправки' и 'Регион прибытия' по названию."""
-    region_from_col = None
-    region_to_col = None
-
-    for col_name in df.columns:
-        # Приводим к строке и нижнему регистру для поиска
-        name_lower = str(col_name).lower()
-        if "регион" in name_lower and "отправ" in name_lower:
-            region_from_col = col_name
-        elif "регион" in name_lower and (
-            "прибыт" in name_lower or "назнач" in name_lower
-        ):
-            region_to_col = col_name
-
-    return region_from_col, region_to_col
-
-
-def find_city_columns(df):
-    """Находит колонки 'Город отправки' и 'Город прибытия' по ключевым словам в неназванных колонках."""
-    city_from_col = None
-    city_to_col = None
-
-    # Известные города отправки и прибытия (в нижнем регистре для сравнения)
-    known_cities_from_lower = {"электросталь", "коледино"}
-    known_cities_to_lower = {
-        "москва",
-        "санкт-петербург",
-        "омск",
-        "челябинск",
-        "самара",
-        "деревня",
-        "посёлок",
-        "село",
-        "тула",
-    }
-
-    for col_name in df.columns:
-        col_name_str = str(col_name).strip()
-
-        # Проверяем, является ли колонка неназванной
-        is_unnamed = col_name_str.startswith("Unnamed:") or col_name_str == ""
-
-        if not is_unnamed:
-            continue  # Пропускаем колонки с названиями
-
-        # Получаем образец данных из этой колонки
-        non_null_data = df[col_name].dropna()
-
-        if len(non_null_data) == 0:
-            continue
-
-        # Получаем образец данных и приводим к нижнему регистру
-        sample_data = non_null_data.head(20).astype(str).str.strip()
-        sample_data_lower = sample_data.str.lower().tolist()
-
-        # Проверяем, содержит ли колонка известные города отправки
-        found_from_cities = []
-        for city_word in known_cities_from_lower:
-            for data_item in sample_data_lower:
-                if city_word in data_item:
-                    found_from_cities.append(city_word)
-                    break
+# Определение колонок: один проход по заголовку и образцам значений,
+# все роли сопоставляются заранее скомпилированными выражениями.
+REGION_FROM_RE = re.compile(r"(?=.*регион)(?=.*отправ)")
+REGION_TO_RE = re.compile(r"(?=.*регион)(?=.*(?:прибыт|назнач))")
+
+# Известные города отправки и прибытия (в нижнем регистре)
+CITY_FROM_RE = re.compile("электросталь|коледино")
+CITY_TO_RE = re.compile(
+    "москва|санкт-петербург|омск|челябинск|самара|деревня|посёлок|село|тула"
+)
+
+# Товарные колонки: обязательные (Артикул WB, Артикул продавца, Размер) и
+# опциональные; варианты названий в нижнем регистре
+PRODUCT_COLUMN_PATTERNS = {
+    "Артикул WB": ["артикул wb", "артикул вб", "арт wb"],
+    "Артикул продавца": ["артикул продавца", "артикул поставщика", "артикул"],
+    "Размер": ["размер", "size", "размер товара"],
+    "Бренд": ["бренд", "brand", "марка"],
+}
+PRODUCT_COLUMN_RES = {
+    name: re.compile("|".join(re.escape(v) for v in variants))
+    for name, variants in PRODUCT_COLUMN_PATTERNS.items()
+}
+
+# Сколько непустых значений неназванной колонки смотреть при поиске городов
+CITY_SAMPLE_SIZE = 20
+
+# Версия формата записи в кэше (роли по заголовку) и срок хранения
+SCHEMA_CACHE_VERSION = 2
+SCHEMA_CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+ColumnSchema = namedtuple(
+    "ColumnSchema",
+    ["region_from", "region_to", "city_from", "city_to", "product_columns"],
+)
+
+
+def column_profile(df):
+    """
+    Профиль колонок за один проход по заголовку: имя в нижнем регистре,
+    признак неназванной колонки и числового типа — строка на колонку.
+    """
+    stripped = [str(col).strip() for col in df.columns]
+    return pd.DataFrame(
+        {
+            "name": [str(col).lower() for col in df.columns],
+            "unnamed": [name.startswith("Unnamed:") or name == "" for name in stripped],
+            "numeric": [is_numeric_dtype(dtype) for dtype in df.dtypes],
+        }
+    )
 
-        if found_from_cities:
-            if city_from_col is None:
-                city_from_col = col_name
-        else:
-            # Проверяем, содержит ли колонка известные города прибытия
-            found_to_cities = []
-            for city_word in known_cities_to_lower:
-                for data_item in sample_data_lower:
-                    if city_word in data_item:
-                        found_to_cities.append(city_word)
-                        break
 
-            if found_to_cities:
-                if city_to_col is None:
-                    city_to_col = col_name
+def detect_schema(df):
+    """Находит колонки регионов, городов и товаров по профилю колонок."""
+    profile = column_profile(df)
+    columns = list(df.columns)
 
-    return city_from_col, city_to_col
+    # Регионы: по названию колонки, при нескольких совпадениях — последняя
+    region_from = region_to = None
+    is_from = profile["name"].str.contains(REGION_FROM_RE).to_numpy()
+    is_to = profile["name"].str.contains(REGION_TO_RE).to_numpy() & ~is_from
+    if is_from.any():
+        region_from = columns[is_from.nonzero()[0][-1]]
+    if is_to.any():
+        region_to = columns[is_to.nonzero()[0][-1]]
 
+    # Города: неназванные текстовые колонки, по образцам значений
+    city_from, city_to = detect_city_columns(df, profile)
 
-def find_product_columns(df):
-    """Находит колонки с товарной информацией - обязательные: Артикул WB, Артикул продавца, Размер"""
+    # Товары: первая подходящая колонка, ещё не занятая другой ролью
+    # (иначе «Артикул WB» подходил и под вариант «артикул» продавца)
     product_columns = {}
-
-    # Обязательные колонки для анализа товаров
-    mandatory_columns = {
-        "Артикул WB": ["артикул wb", "артикул вб", "арт wb"],
-        "Артикул продавца": ["артикул продавца", "артикул поставщика", "артикул"],
-        "Размер": ["размер", "size", "размер товара"],
-    }
-
-    # Опциональные колонки
-    optional_columns = {
-        "Бренд": ["бренд", "brand", "марка"],
-    }
-
-    # Сначала ищем обязательные колонки
-    found_mandatory = []
-    for standard_name, possible_variants in mandatory_columns.items():
-        found = False
-        for col in df.columns:
-            col_lower = str(col).lower()
-            for variant in possible_variants:
-                if variant in col_lower:
-                    product_columns[standard_name] = col
-                    found_mandatory.append(standard_name)
-                    found = True
-                    break
-            if found:
+    used = set()
+    for name, pattern in PRODUCT_COLUMN_RES.items():
+        for i in profile["name"].str.contains(pattern).to_numpy().nonzero()[0]:
+            if i not in used:
+                product_columns[name] = columns[i]
+                used.add(i)
                 break
 
-    # Затем ищем опциональные колонки
-    for standard_name, possible_variants in optional_columns.items():
-        found = False
-        for col in df.columns:
-            col_lower = str(col).lower()
-            for variant in possible_variants:
-                if variant in col_lower and standard_name not in product_columns:
-                    product_columns[standard_name] = col
-                    found = True
-                    break
-            if found:
-                break
+    return ColumnSchema(region_from, region_to, city_from, city_to, product_columns)
+
+
+def detect_city_columns(df, profile):
+    """
+    Колонки 'Город отправки' и 'Город прибытия' среди неназванных: образцы
+    всех таких колонок собираются в одну серию и проверяются одним
+    str.contains на каждую роль. Числовые колонки пропускаются.
+    """
+    candidates = (profile["unnamed"] & ~profile["numeric"]).to_numpy().nonzero()[0]
+    samples = {}
+    for i in candidates:
+        sample = df.iloc[:, i].dropna().head(CITY_SAMPLE_SIZE)
+        if len(sample):
+            samples[i] = sample
+    if not samples:
+        return None, None
+
+    values = pd.concat(samples.values(), keys=samples.keys())
+    values = values.astype(str).str.strip().str.lower()
+    positions = values.index.get_level_values(0)
+    has_from = values.str.contains(CITY_FROM_RE).groupby(positions).any()
+    has_to = values.str.contains(CITY_TO_RE).groupby(positions).any() & ~has_from
+
+    columns = df.columns
+    city_from = columns[has_from.idxmax()] if has_from.any() else None
+    city_to = columns[has_to.idxmax()] if has_to.any() else None
+    return city_from, city_to
+
+
+def schema_cache_key(columns):
+    """Ключ кэша по подписи заголовка (имена колонок по порядку)."""
+    signature = json.dumps(
+        [SCHEMA_CACHE_VERSION, [str(col) for col in columns]], ensure_ascii=False
+    )
+    return "form19_schema:" + hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+
+def detect_schema_cached(df):
+    """
+    detect_schema с кэшем по подписи заголовка. Из кэша берутся только роли,
+    найденные по именам колонок (регионы, товары). Города определяются по
+    значениям неназванных колонок, поэтому ищутся в каждом файле заново —
+    иначе файл с пустыми городами отключал бы их анализ для всех следующих
+    выгрузок того же формата.
+    """
+    key = schema_cache_key(df.columns)
+    cached = cache.get(key)
+    if cached is None:
+        schema = detect_schema(df)
+        cache.set(
+            key,
+            (schema.region_from, schema.region_to, schema.product_columns),
+            SCHEMA_CACHE_TIMEOUT,
+        )
+        return schema
+
+    print("Форма 19: колонки регионов и товаров взяты из кэша по заголовку файла")
+    region_from, region_to, product_columns = cached
+    city_from, city_to = detect_city_columns(df, column_profile(df))
+    return ColumnSchema(region_from, region_to, city_from, city_to, product_columns)
+
+
+# Товарные колонки таблицы маршрут × товар в порядке вывода
+ROUTE_PRODUCT_KEYS = ["Артикул WB", "Артикул продавца", "Размер"]
+
+# Строк CSV в одном куске при потоковом чтении
+CSV_CHUNK_ROWS = 100_000
+
+
+def count_routes(df, from_col, to_col, product_columns):
+    """
+    Счётчики одного куска данных: заказы по маршрутам (откуда, куда) и по
+    маршрутам × товарам. Точки маршрута приводятся к обрезанным строкам,
+    пустые отбрасываются. Возвращает (route_counts, product_counts);
+    product_counts = None, если товары по маршрутам не различить.
+    """
+    route_from = df[from_col].astype(str).str.strip()
+    route_to = df[to_col].astype(str).str.strip()
+    valid = (
+        (route_from != "nan")
+        & (route_to != "nan")
+        & (route_from != "")
+        & (route_to != "")
+    )
+    data = pd.DataFrame({from_col: route_from[valid], to_col: route_to[valid]})
+    route_counts = data.groupby([from_col, to_col]).size()
 
-    return product_columns
+    key_columns = [
+        name
+        for name in ROUTE_PRODUCT_KEYS
+        if name in product_columns and product_columns[name] in df.columns
+    ]
+    # Без артикула продавца товары не различаем — остаются только итоги маршрутов
+    if "Артикул продавца" not in key_columns:
+        return route_counts, None
+
+    # Товары сравниваем как обрезанные строки — так они выводятся в отчёт
+    for name in key_columns:
+        data[name] = df.loc[valid, product_columns[name]].astype(str).str.strip()
+    product_counts = data.groupby([from_col, to_col] + key_columns).size()
+    return route_counts, product_counts
+
+
+def merge_counts(total, counts):
+    """Складывает счётчики count_routes двух кусков данных."""
+    if total is None:
+        return counts
+    if counts is None:
+        return total
+    levels = list(range(counts.index.nlevels))
+    return pd.concat([total, counts]).groupby(level=levels).sum()
+
+
+def count_routes_in_chunks(chunks, routes, product_columns):
+    """
+    Проходит по кускам данных один раз и накапливает счётчики для каждого
+    анализа из routes ({ключ: (from_col, to_col, название)}). Память
+    ограничена числом различных маршрутов и товаров, а не числом строк.
+    """
+    totals = {key: (None, None) for key in routes}
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        for key, (from_col, to_col, _) in routes.items():
+            route_counts, product_counts = count_routes(
+                chunk, from_col, to_col, product_columns
+            )
+            total_routes, total_products = totals[key]
+            totals[key] = (
+                merge_counts(total_routes, route_counts),
+                merge_counts(total_products, product_counts),
+            )
+    return totals, rows
 
 
 def analyze_traffic_with_products(df, from_col, to_col, analysis_name, product_columns):
@@ -186,36 +281,32 @@ def analyze_traffic_with_products(df, from_col, to_col, analysis_name, product_c
     if from_col not in df.columns or to_col not in df.columns:
         return None
 
-    # Очистка данных
-    df_clean = df.copy()
-    df_clean[from_col] = df_clean[from_col].astype(str).str.strip()
-    df_clean[to_col] = df_clean[to_col].astype(str).str.strip()
-
-    # Очищаем данные о товарах
-    for col_name, actual_col in product_columns.items():
-        if actual_col in df_clean.columns:
-            df_clean[col_name] = df_clean[actual_col].astype(str).str.strip()
+    route_counts, product_counts = count_routes(df, from_col, to_col, product_columns)
+    return analyze_traffic_counts(
+        route_counts, product_counts, from_col, to_col, analysis_name, product_columns
+    )
 
-    # Удаляем пустые значения
-    df_clean = df_clean[df_clean[from_col] != "nan"]
-    df_clean = df_clean[df_clean[to_col] != "nan"]
-    df_clean = df_clean[df_clean[from_col] != ""]
-    df_clean = df_clean[df_clean[to_col] != ""]
 
-    total_records = len(df_clean)
+def analyze_traffic_counts(
+    route_counts, product_counts, from_col, to_col, analysis_name, product_columns
+):
+    """Анализ трафика по готовым счётчикам count_routes"""
+    total_records = int(route_counts.sum())
     if total_records == 0:
         return None
 
     # 1. Группировка трафика (базовая статистика)
-    traffic_volume = (
-        df_clean.groupby([from_col, to_col]).size().reset_index(name="Количество")
+    traffic_volume = route_counts.sort_index().reset_index(name="Количество")
+    traffic_volume = traffic_volume.sort_values(
+        "Количество", ascending=False, kind="stable"
     )
-    traffic_volume = traffic_volume.sort_values("Количество", ascending=False)
 
-    # 2. Группировка трафика с информацией о товарах
-    traffic_with_products = analyze_products_by_route(
-        df_clean, from_col, to_col, product_columns
-    )
+    # 2. Таблица маршрут × товар
+    route_products = None
+    if product_columns:
+        route_products = analyze_products_by_route(
+            route_counts, product_counts, from_col, to_col
+        )
 
     # 3. Матрица трафика
     traffic_matrix = traffic_volume.pivot_table(
@@ -223,12 +314,14 @@ def analyze_traffic_with_products(df, from_col, to_col, analysis_name, product_c
     ).astype(int)
 
     # 4. Статистика
-    unique_sources = df_clean[from_col].nunique()
-    unique_destinations = df_clean[to_col].nunique()
+    sources = route_counts.index.get_level_values(from_col)
+    destinations = route_counts.index.get_level_values(to_col)
+    unique_sources = sources.nunique()
+    unique_destinations = destinations.nunique()
     unique_routes = len(traffic_volume)
 
     # 5. Внутренние/внешние перевозки
-    internal = df_clean[df_clean[from_col] == df_clean[to_col]].shape[0]
+    internal = int(route_counts[sources == destinations].sum())
     external = total_records - internal
     internal_pct = (internal / total_records * 100) if total_records > 0 else 0
     external_pct = (external / total_records * 100) if total_records > 0 else 0
@@ -238,13 +331,12 @@ def analyze_traffic_with_products(df, from_col, to_col, analysis_name, product_c
     top_routes = traffic_volume.head(top_n)
 
     return {
-        "df": df_clean,
         "from_col": from_col,
         "to_col": to_col,
         "analysis_name": analysis_name,
         "product_columns": product_columns,
         "traffic_volume": traffic_volume,
-        "traffic_with_products": traffic_with_products,
+        "route_products": route_products,
         "traffic_matrix": traffic_matrix,
         "total_records": total_records,
         "unique_sources": unique_sources,
@@ -258,82 +350,33 @@ def analyze_traffic_with_products(df, from_col, to_col, analysis_name, product_c
     }
 
 
-def analyze_products_by_route(df, from_col, to_col, product_columns):
-    """Анализирует какие товары перемещаются по каждому маршруту (все три обязательные колонки)"""
-    if not product_columns:
-        return {}
-
-    # Проверяем наличие обязательных колонок
-    has_wb_art = (
-        "Артикул WB" in product_columns and product_columns["Артикул WB"] in df.columns
-    )
-    has_seller_art = (
-        "Артикул продавца" in product_columns
-        and product_columns["Артикул продавца"] in df.columns
+def analyze_products_by_route(route_counts, product_counts, from_col, to_col):
+    """
+    Таблица маршрут × товар из счётчиков count_routes: Откуда, Куда, Маршрут,
+    найденные товарные колонки, Количество, Заказов по маршруту — маршруты
+    по убыванию заказов, внутри маршрута товары по убыванию.
+    """
+    if product_counts is not None:
+        table = product_counts.sort_index().reset_index(name="Количество")
+    else:
+        table = pd.DataFrame(columns=[from_col, to_col, "Количество"])
+    table = table.rename(columns={from_col: "Откуда", to_col: "Куда"})
+
+    route_totals = route_counts.rename("Заказов по маршруту")
+    route_totals.index.names = ["Откуда", "Куда"]
+    table = table.join(route_totals, on=["Откуда", "Куда"])
+    table.insert(2, "Маршрут", table["Откуда"] + " → " + table["Куда"])
+    return table.sort_values(
+        ["Заказов по маршруту", "Откуда", "Куда", "Количество"],
+        ascending=[False, True, True, False],
+        kind="stable",
+        ignore_index=True,
     )
-    has_size = "Размер" in product_columns and product_columns["Размер"] in df.columns
-
-    results = {}
-
-    # Сгруппируем данные по маршрутам
-    grouped = df.groupby([from_col, to_col])
-
-    for (source, destination), group in grouped:
-        route_key = f"{source} → {destination}"
-        route_data = {"total_orders": len(group), "products": {}}
-
-        # Анализируем товары по всем трем колонкам
-        if has_seller_art:
-            # Определяем группирующие колонки
-            group_columns = []
-            if has_wb_art:
-                group_columns.append(product_columns["Артикул WB"])
-            group_columns.append(product_columns["Артикул продавца"])
-            if has_size:
-                group_columns.append(product_columns["Размер"])
-
-            # Группируем данные
-            product_groups = (
-                group.groupby(group_columns).size().reset_index(name="Количество")
-            )
-
-            # Сортируем по количеству
-            product_groups = product_groups.sort_values("Количество", ascending=False)
 
-            for _, row in product_groups.iterrows():
-                # Формируем уникальный ключ для товара
-                product_parts = []
-                if has_wb_art:
-                    wb_art = str(row[product_columns["Артикул WB"]])
-                    product_parts.append(f"WB: {wb_art}")
 
-                seller_art = str(row[product_columns["Артикул продавца"]])
-                product_parts.append(f"Продавец: {seller_art}")
-
-                if has_size:
-                    size = str(row[product_columns["Размер"]])
-                    product_parts.append(f"Размер: {size}")
-
-                product_key = " | ".join(product_parts)
-
-                # Сохраняем информацию о товаре
-                product_info = {
-                    "количество": int(row["Количество"]),
-                    "артикул_wb": wb_art if has_wb_art else "",
-                    "артикул_продавца": seller_art,
-                    "размер": size if has_size else "",
-                    "артикул_продавца_колонка": product_columns["Артикул продавца"],
-                    "артикул_wb_колонка": (
-                        product_columns["Артикул WB"] if has_wb_art else None
-                    ),
-                    "размер_колонка": product_columns["Размер"] if has_size else None,
-                }
-
-                route_data["products"][product_key] = product_info
-
-        results[route_key] = route_data
-
-    return results
+def route_product_keys(route_products):
+    """Товарные колонки, которые есть в таблице маршрут × товар"""
+    return [name for name in ROUTE_PRODUCT_KEYS if name in route_products.columns]
 
 
 def analyze_destinations_by_sources(df, from_col, to_col, analysis_name):
@@ -342,33 +385,28 @@ def analyze_destinations_by_sources(df, from_col, to_col, analysis_name):
     if from_col not in df.columns or to_col not in df.columns:
         return None
 
-    # Очистка данных
-    df_clean = df.copy()
-    df_clean[from_col] = df_clean[from_col].astype(str).str.strip()
-    df_clean[to_col] = df_clean[to_col].astype(str).str.strip()
+    route_counts, _ = count_routes(df, from_col, to_col, {})
+    return analyze_destination_counts(route_counts, from_col, to_col, analysis_name)
 
-    # Удаляем пустые значения
-    df_clean = df_clean[df_clean[from_col] != "nan"]
-    df_clean = df_clean[df_clean[to_col] != "nan"]
-    df_clean = df_clean[df_clean[from_col] != ""]
-    df_clean = df_clean[df_clean[to_col] != ""]
 
-    total_records = len(df_clean)
+def analyze_destination_counts(route_counts, from_col, to_col, analysis_name):
+    """Анализ городов прибытия по готовым счётчикам маршрутов"""
+    total_records = int(route_counts.sum())
     if total_records == 0:
         return None
 
+    by_destination = route_counts.swaplevel().sort_index()
+
     # 1. Общее количество по городам прибытия
     destinations_total = (
-        df_clean.groupby(to_col).size().reset_index(name="Всего_поступлений")
+        by_destination.groupby(level=to_col).sum().reset_index(name="Всего_поступлений")
     )
     destinations_total = destinations_total.sort_values(
         "Всего_поступлений", ascending=False
     )
 
     # 2. Детализация по источникам для каждого города прибытия
-    pivot_table = (
-        df_clean.groupby([to_col, from_col]).size().reset_index(name="Количество")
-    )
+    pivot_table = by_destination.reset_index(name="Количество")
     pivot_table = pivot_table.sort_values(
         [to_col, "Количество"], ascending=[True, False]
     )
@@ -393,7 +431,6 @@ def analyze_destinations_by_sources(df, from_col, to_col, analysis_name):
         }
 
     return {
-        "df": df_clean,
         "from_col": from_col,
         "to_col": to_col,
         "analysis_name": analysis_name,
@@ -405,17 +442,121 @@ def analyze_destinations_by_sources(df, from_col, to_col, analysis_name):
 
 
 # ===== ФУНКЦИИ ДЛЯ СОЗДАНИЯ EXCEL ОТЧЕТА =====
-def create_excel_report_with_proper_names(df, all_analyses, all_destination_analyses):
-    """Создает Excel отчет с правильными названиями и информацией о товарах"""
-    from io import BytesIO
+# Книга пишется в режиме write-only: строки сразу уходят в файл, поэтому
+# стиль каждой ячейки известен в момент добавления строки, а ширины колонок
+# задаются до первой строки листа.
+THIN_BORDER = Border(
+    left=Side(style="thin"),
+    right=Side(style="thin"),
+    top=Side(style="thin"),
+    bottom=Side(style="thin"),
+)
+
+
+def solid_fill(color):
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+CELL_STYLES = {
+    "title": {
+        "font": Font(bold=True, size=16, color="1F4E79"),
+        "fill": solid_fill("E2EFDA"),
+        "alignment": Alignment(horizontal="center", vertical="center"),
+    },
+    "section": {
+        "font": Font(bold=True, size=14, color="2E75B6"),
+        "fill": solid_fill("FCE4D6"),
+        "alignment": Alignment(horizontal="center"),
+    },
+    "route_title": {
+        "font": Font(bold=True, size=11, color="1F4E79"),
+        "fill": solid_fill("E2EFDA"),
+        "alignment": Alignment(horizontal="left", vertical="center"),
+    },
+    "destination_title": {
+        "font": Font(bold=True, size=12, color="1F4E79"),
+        "fill": solid_fill("DDEBF7"),
+        "alignment": Alignment(horizontal="center", vertical="center"),
+    },
+    "column_header": {
+        "font": Font(bold=True, size=11),
+        "fill": solid_fill("E0E0E0"),
+    },
+    "table_header": {
+        "font": Font(bold=True),
+        "fill": solid_fill("F2F2F2"),
+        "alignment": Alignment(horizontal="center", vertical="center"),
+    },
+    "matrix_header": {
+        "font": Font(bold=True),
+        "fill": solid_fill("F0F0F0"),
+        "alignment": Alignment(horizontal="center", vertical="center"),
+    },
+    "info_header": {"font": Font(bold=True), "fill": solid_fill("FCE4D6")},
+    "label": {"font": Font(bold=True), "alignment": Alignment(vertical="center")},
+    "wrap": {"alignment": Alignment(wrap_text=True, vertical="center")},
+    "left": {"alignment": Alignment(horizontal="left", vertical="center")},
+    "center": {"alignment": Alignment(horizontal="center", vertical="center")},
+    "left_wrap": {
+        "alignment": Alignment(horizontal="left", vertical="center", wrap_text=True)
+    },
+    "border": {"border": THIN_BORDER},
+    "stripe": {"fill": solid_fill("F8F8F8")},
+    "info_stripe": {"fill": solid_fill("F2F2F2")},
+}
+
+
+class SheetRows:
+    """
+    Построчная запись write-only листа. Стиль ячейки — имя из CELL_STYLES
+    или кортеж имён (накладываются по порядку). Каждый набор стилей
+    регистрируется в книге один раз, ячейкам копируются готовые индексы.
+    """
+
+    def __init__(self, ws, widths=None):
+        self.ws = ws
+        self.row = 0
+        self._templates = {}
+        for letter, width in (widths or {}).items():
+            ws.column_dimensions[letter].width = width
+
+    def cell(self, value, style=None):
+        cell = WriteOnlyCell(self.ws, value=value)
+        if style:
+            template = self._templates.get(style)
+            if template is None:
+                template = WriteOnlyCell(self.ws)
+                names = (style,) if isinstance(style, str) else style
+                for name in names:
+                    for attr, obj in CELL_STYLES[name].items():
+                        setattr(template, attr, obj)
+                self._templates[style] = template
+            cell._style = copy(template._style)
+        return cell
+
+    def append(self, values, style=None, styles=None):
+        """Строка values: style — для всех ячеек, styles — для каждой своя."""
+        if styles is None:
+            styles = [style] * len(values)
+        self.ws.append([self.cell(v, s) for v, s in zip(values, styles)])
+        self.row += 1
+        return self.row
+
+    def merge(self, last_column):
+        """Объединяет последнюю строку от колонки A до last_column."""
+        self.ws.merged_cells.add(
+            f"A{self.row}:{get_column_letter(last_column)}{self.row}"
+        )
+
+    def skip(self, count=1):
+        for _ in range(count):
+            self.append([])
 
-    # Создаем рабочую книгу
-    wb = Workbook()
 
-    # Удаляем лист по умолчанию
-    if "Sheet" in wb.sheetnames:
-        ws_default = wb["Sheet"]
-        wb.remove(ws_default)
+def create_excel_report_with_proper_names(df, all_analyses, all_destination_analyses):
+    """Создает Excel отчет с правильными названиями и информацией о товарах"""
+    # Создаем рабочую книгу (потоковая запись, без листа по умолчанию)
+    wb = Workbook(write_only=True)
 
     # 1. Лист с исходными данными
     ws_source = wb.create_sheet("Исходные_данные")
@@ -430,10 +571,7 @@ def create_excel_report_with_proper_names(df, all_analyses, all_destination_anal
         add_traffic_sheet(ws_traffic, analysis_data)
 
         # Лист с товарами по маршрутам
-        if (
-            "traffic_with_products" in analysis_data
-            and analysis_data["traffic_with_products"]
-        ):
+        if analysis_data.get("route_products") is not None:
             ws_products = wb.create_sheet(f"Товары_{analysis_name}")
             add_products_by_route_sheet(ws_products, analysis_data)
 
@@ -506,274 +644,173 @@ def add_source_data_sheet(ws, df, all_analyses):
         if col in df.columns and col not in columns_to_save:
             columns_to_save.append(col)
 
+    rows = SheetRows(
+        ws,
+        widths={get_column_letter(i): 25 for i in range(1, len(columns_to_save) + 1)},
+    )
+
     # Записываем заголовки
-    ws.append(columns_to_save)
+    rows.append(columns_to_save, ("column_header", "wrap"))
 
     # Записываем данные (первые 1000 строк для производительности)
-    max_rows = min(1000, len(df))
-    for idx, row in df.head(max_rows).iterrows():
-        row_data = [row[col] if col in df.columns else "" for col in columns_to_save]
-        ws.append(row_data)
-
-    # Форматирование
-    for i, col in enumerate(columns_to_save, 1):
-        col_letter = get_column_letter(i)
-        ws.column_dimensions[col_letter].width = 25
-
-        for cell in ws[col_letter]:
-            if cell.row == 1:
-                cell.font = Font(bold=True, size=11)
-                cell.fill = PatternFill(
-                    start_color="E0E0E0", end_color="E0E0E0", fill_type="solid"
-                )
-            cell.alignment = Alignment(wrap_text=True, vertical="center")
+    for values in df.head(1000)[columns_to_save].itertuples(index=False):
+        rows.append(list(values), "wrap")
 
 
 def add_traffic_sheet(ws, analysis_data):
     """Добавляет лист с трафиком между точками"""
     analysis_name = analysis_data["analysis_name"]
+    rows = SheetRows(ws, widths={"A": 35, "B": 35, "C": 35})
 
-    ws.append(
+    rows.append(
         [
             f"{analysis_name} отправки",
             f"{analysis_name} прибытия",
             "Количество перевозок",
-        ]
+        ],
+        ("column_header", "wrap"),
     )
 
     # Ограничиваем количество строк для производительности
-    max_traffic_rows = min(500, len(analysis_data["traffic_volume"]))
-    for _, row in analysis_data["traffic_volume"].head(max_traffic_rows).iterrows():
-        ws.append(
-            [
-                row[analysis_data["from_col"]],
-                row[analysis_data["to_col"]],
-                row["Количество"],
-            ]
-        )
-
-    # Форматирование
-    for col in ["A", "B", "C"]:
-        ws.column_dimensions[col].width = 35
-        for cell in ws[col]:
-            if cell.row == 1:
-                cell.font = Font(bold=True, size=11)
-                cell.fill = PatternFill(
-                    start_color="E0E0E0", end_color="E0E0E0", fill_type="solid"
-                )
-            cell.alignment = Alignment(wrap_text=True, vertical="center")
+    traffic = analysis_data["traffic_volume"].head(500)
+    columns = [analysis_data["from_col"], analysis_data["to_col"], "Количество"]
+    for values in traffic[columns].itertuples(index=False):
+        rows.append(list(values), "wrap")
 
 
 def add_products_by_route_sheet(ws, analysis_data):
     """Добавляет лист с товарами по каждому маршруту (все три колонки)"""
-    if (
-        "traffic_with_products" not in analysis_data
-        or not analysis_data["traffic_with_products"]
-    ):
-        ws.append(["Нет данных о товарах по маршрутам"])
+    route_products = analysis_data.get("route_products")
+    if route_products is None:
+        SheetRows(ws).append(["Нет данных о товарах по маршрутам"])
         return
 
-    current_row = 1
-    products_data = analysis_data["traffic_with_products"]
-    analysis_name = analysis_data["analysis_name"]
+    from_col = analysis_data["from_col"]
+    to_col = analysis_data["to_col"]
+
+    # Товарные колонки, найденные в файле
+    key_columns = route_product_keys(route_products)
+
+    # Заголовки таблицы товаров и ширина колонок
+    headers = key_columns + ["Количество"]
+    product_widths = {"Артикул WB": 20, "Артикул продавца": 25, "Размер": 15}
+    widths = [product_widths[name] for name in key_columns] + [12]
+    if not key_columns:
+        headers = ["Артикул продавца", "Количество"]
+        widths = [25, 12]
+    rows = SheetRows(
+        ws, widths={get_column_letter(i): w for i, w in enumerate(widths, 1)}
+    )
+
+    # Выравнивание: текст слева, количество по центру
+    col_count = len(headers)
+    row_styles = [("left", "border")] * (col_count - 1) + [("center", "border")]
 
-    # Проверяем наличие товарных колонок
-    has_wb_art = "Артикул WB" in analysis_data["product_columns"]
-    has_size = "Размер" in analysis_data["product_columns"]
+    # Ограничим количество маршрутов для отображения: топ-50 по числу заказов
+    top_routes = analysis_data["traffic_volume"].head(50)
+    top_labels = top_routes[from_col] + " → " + top_routes[to_col]
 
-    # Сортируем маршруты по общему количеству товаров
-    sorted_routes = sorted(
-        products_data.items(), key=lambda x: x[1]["total_orders"], reverse=True
+    # Топ-20 товаров по каждому из этих маршрутов (таблица уже отсортирована)
+    shown = route_products[route_products["Маршрут"].isin(top_labels)]
+    products_by_route = dict(
+        tuple(shown.groupby("Маршрут", sort=False).head(20).groupby("Маршрут"))
     )
 
-    # Ограничим количество маршрутов для отображения
-    max_routes = min(50, len(sorted_routes))
+    for i, (route, total_orders) in enumerate(
+        zip(top_labels, top_routes["Количество"]), 1
+    ):
+        # Пустые строки между маршрутами
+        if i > 1:
+            rows.skip(2)
 
-    for i, (route, data) in enumerate(sorted_routes[:max_routes], 1):
         # Заголовок маршрута
-        ws.merge_cells(
-            start_row=current_row, start_column=1, end_row=current_row, end_column=4
-        )
-        title_cell = ws.cell(row=current_row, column=1)
-        title_cell.value = (
-            f"{i}. Маршрут: {route} (Всего заказов: {data['total_orders']})"
-        )
-        title_cell.font = Font(bold=True, size=11, color="1F4E79")
-        title_cell.fill = PatternFill(
-            start_color="E2EFDA", end_color="E2EFDA", fill_type="solid"
+        rows.append(
+            [f"{i}. Маршрут: {route} (Всего заказов: {total_orders})"],
+            "route_title",
         )
-        title_cell.alignment = Alignment(horizontal="left", vertical="center")
-        current_row += 1
-
-        if data["products"]:
-            # Заголовки таблицы товаров - все три колонки
-            headers = ["Артикул WB", "Артикул продавца", "Размер", "Количество"]
-            # Если нет артикула WB, убираем эту колонку
-            if not has_wb_art:
-                headers = ["Артикул продавца", "Размер", "Количество"]
-            # Если нет размера, убираем эту колонку
-            if not has_size:
-                headers = (
-                    ["Артикул WB", "Артикул продавца", "Количество"]
-                    if has_wb_art
-                    else ["Артикул продавца", "Количество"]
-                )
-
-            ws.append(headers)
-
-            # Форматирование заголовков
-            col_count = len(headers)
-            for col in range(1, col_count + 1):
-                cell = ws.cell(row=current_row, column=col)
-                cell.font = Font(bold=True)
-                cell.fill = PatternFill(
-                    start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                )
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                cell.border = Border(
-                    left=Side(style="thin"),
-                    right=Side(style="thin"),
-                    top=Side(style="thin"),
-                    bottom=Side(style="thin"),
-                )
-
-            current_row += 1
-
-            # Данные о товарах
-            sorted_products = sorted(
-                data["products"].items(), key=lambda x: x[1]["количество"], reverse=True
-            )
+        rows.merge(4)
+
+        products = products_by_route.get(route)
+        if products is not None:
+            rows.append(headers, ("table_header", "border"))
 
-            for product_key, product_info in sorted_products[
-                :20
-            ]:  # Топ-20 товаров по маршруту
-                # Заполняем строку в зависимости от наличия колонок
-                row_data = []
-                if has_wb_art:
-                    row_data.append(product_info.get("артикул_wb", ""))
-                row_data.append(product_info.get("артикул_продавца", ""))
-                if has_size:
-                    row_data.append(product_info.get("размер", ""))
-                row_data.append(product_info.get("количество", 0))
-
-                ws.append(row_data)
-
-                # Форматирование
-                for col in range(1, col_count + 1):
-                    cell = ws.cell(row=current_row, column=col)
-                    # Выравнивание: текст слева, числа по центру
-                    if col == col_count:  # Последняя колонка - количество
-                        cell.alignment = Alignment(
-                            horizontal="center", vertical="center"
-                        )
-                    else:
-                        cell.alignment = Alignment(horizontal="left", vertical="center")
-                    cell.border = Border(
-                        left=Side(style="thin"),
-                        right=Side(style="thin"),
-                        top=Side(style="thin"),
-                        bottom=Side(style="thin"),
-                    )
-
-                current_row += 1
+            # Данные о товарах (топ-20 товаров по маршруту)
+            for row_data in products[key_columns + ["Количество"]].itertuples(
+                index=False
+            ):
+                row_data = list(row_data)
+                row_data[-1] = int(row_data[-1])
+                rows.append(row_data, styles=row_styles)
         else:
-            ws.append(["Нет данных о товарах"])
-            current_row += 1
-
-        # Пустая строка между маршрутами
-        current_row += 2
-
-    # Настройка ширины колонок
-    if has_wb_art and has_size:
-        ws.column_dimensions["A"].width = 20  # Артикул WB
-        ws.column_dimensions["B"].width = 25  # Артикул продавца
-        ws.column_dimensions["C"].width = 15  # Размер
-        ws.column_dimensions["D"].width = 12  # Количество
-    elif has_wb_art:
-        ws.column_dimensions["A"].width = 20  # Артикул WB
-        ws.column_dimensions["B"].width = 25  # Артикул продавца
-        ws.column_dimensions["C"].width = 12  # Количество
-    elif has_size:
-        ws.column_dimensions["A"].width = 25  # Артикул продавца
-        ws.column_dimensions["B"].width = 15  # Размер
-        ws.column_dimensions["C"].width = 12  # Количество
-    else:
-        ws.column_dimensions["A"].width = 25  # Артикул продавца
-        ws.column_dimensions["B"].width = 12  # Количество
+            rows.append(["Нет данных о товарах"])
 
 
 def add_top_products_sheet(ws, all_analyses):
     """Добавляет лист с топ товарами по всем маршрутам (все три колонки)"""
-    ws.merge_cells("A1:E1")
-    title_cell = ws["A1"]
-    title_cell.value = "АНАЛИЗ ТОВАРОВ ПО ВСЕМ МАРШРУТАМ"
-    title_cell.font = Font(bold=True, size=16, color="1F4E79")
-    title_cell.alignment = Alignment(horizontal="center", vertical="center")
-    title_cell.fill = PatternFill(
-        start_color="E2EFDA", end_color="E2EFDA", fill_type="solid"
-    )
+    with_products = [
+        analysis_data
+        for analysis_data in all_analyses.values()
+        if analysis_data.get("route_products") is not None
+    ]
 
-    current_row = 3
+    # Ширина колонок по первому анализу с товарами
+    widths = {"A": 5}  # №
+    if with_products:
+        key_columns = route_product_keys(with_products[0]["route_products"])
+        product_widths = {"Артикул WB": 20, "Артикул продавца": 25, "Размер": 15}
+        column_widths = [
+            product_widths[name] for name in key_columns or ["Артикул продавца"]
+        ]
+        column_widths += [15, 40]  # Общее количество, Основные маршруты
+        for i, width in enumerate(column_widths, 2):
+            widths[get_column_letter(i)] = width
+    rows = SheetRows(ws, widths=widths)
 
-    for analysis_type, analysis_data in all_analyses.items():
-        if "traffic_with_products" not in analysis_data:
-            continue
+    rows.append(["АНАЛИЗ ТОВАРОВ ПО ВСЕМ МАРШРУТАМ"], "title")
+    rows.merge(5)
 
+    for analysis_data in with_products:
+        route_products = analysis_data["route_products"]
         analysis_name = analysis_data["analysis_name"]
 
-        # Проверяем наличие товарных колонок
-        has_wb_art = "Артикул WB" in analysis_data["product_columns"]
-        has_size = "Размер" in analysis_data["product_columns"]
-
-        # Собираем все товары по всем маршрутам
-        all_products = {}
-        for route_data in analysis_data["traffic_with_products"].values():
-            for product_key, product_info in route_data["products"].items():
-                # Создаем уникальный идентификатор товара
-                product_id = f"{product_info.get('артикул_wb', '')}|{product_info.get('артикул_продавца', '')}|{product_info.get('размер', '')}"
-                if product_id not in all_products:
-                    all_products[product_id] = {
-                        "артикул_wb": product_info.get("артикул_wb", ""),
-                        "артикул_продавца": product_info.get("артикул_продавца", ""),
-                        "размер": product_info.get("размер", ""),
-                        "общее_количество": 0,
-                        "маршруты": {},
-                    }
-                all_products[product_id]["общее_количество"] += product_info.get(
-                    "количество", 0
-                )
-
-                # Запоминаем маршруты для этого товара
-                route_name = list(analysis_data["traffic_with_products"].keys())[
-                    list(analysis_data["traffic_with_products"].values()).index(
-                        route_data
-                    )
-                ]
-                all_products[product_id]["маршруты"][route_name] = product_info.get(
-                    "количество", 0
-                )
+        # Отступ перед разделом
+        rows.skip(1 if rows.row == 1 else 2)
 
-        # Сортируем товары по количеству
-        sorted_products = sorted(
-            all_products.items(), key=lambda x: x[1]["общее_количество"], reverse=True
-        )
+        # Проверяем наличие товарных колонок
+        key_columns = route_product_keys(route_products)
+        has_wb_art = "Артикул WB" in key_columns
+        has_size = "Размер" in key_columns
+
+        # Топ-30 товаров по сумме всех маршрутов и топ-3 маршрута каждого из них
+        top_products = pd.DataFrame(columns=key_columns + ["Количество", "Маршруты"])
+        if key_columns and not route_products.empty:
+            totals = (
+                route_products.groupby(key_columns, sort=False)["Количество"]
+                .sum()
+                .sort_values(ascending=False, kind="stable")
+                .head(30)
+            )
+            ranked = (
+                route_products.sort_values("Количество", ascending=False, kind="stable")
+                .groupby(key_columns, sort=False)
+                .head(3)
+            )
+            routes = (
+                (ranked["Маршрут"] + ": " + ranked["Количество"].astype(str))
+                .groupby([ranked[k] for k in key_columns])
+                .agg("; ".join)
+            )
+            top_products = totals.reset_index()
+            top_products["Маршруты"] = routes.reindex(totals.index).to_numpy()
 
         # Заголовок раздела
+        rows.append([f"ТОП ТОВАРЫ ПО {analysis_name.upper()}"], "section")
         if has_wb_art and has_size:
-            ws.merge_cells(f"A{current_row}:F{current_row}")
+            rows.merge(6)
         elif has_wb_art or has_size:
-            ws.merge_cells(f"A{current_row}:E{current_row}")
+            rows.merge(5)
         else:
-            ws.merge_cells(f"A{current_row}:D{current_row}")
-
-        section_cell = ws[f"A{current_row}"]
-        section_cell.value = f"ТОП ТОВАРЫ ПО {analysis_name.upper()}"
-        section_cell.font = Font(bold=True, size=14, color="2E75B6")
-        section_cell.fill = PatternFill(
-            start_color="FCE4D6", end_color="FCE4D6", fill_type="solid"
-        )
-        section_cell.alignment = Alignment(horizontal="center")
-        current_row += 1
+            rows.merge(4)
 
         # Заголовки таблицы (все три колонки)
         headers = [
@@ -790,300 +827,123 @@ def add_top_products_sheet(ws, all_analyses):
         if not has_size:
             headers = [h for h in headers if h != "Размер"]
 
-        ws.append(headers)
+        rows.append(headers, "table_header")
 
-        # Форматирование заголовков
+        # Выравнивание: маршруты слева с переносом, количество по центру
         col_count = len(headers)
-        for col in range(1, col_count + 1):
-            cell = ws.cell(row=current_row, column=col)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(
-                start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-            )
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        current_row += 1
+        row_styles = [("left", "border")] * (col_count - 2) + [
+            ("center", "border"),
+            ("left_wrap", "border"),
+        ]
+        striped_styles = [style + ("stripe",) for style in row_styles]
 
         # Топ 30 товаров
-        for idx, (product_id, product_data) in enumerate(sorted_products[:30], 1):
-            # Получаем топ-3 маршрута для этого товара
-            top_routes = sorted(
-                product_data["маршруты"].items(), key=lambda x: x[1], reverse=True
-            )[:3]
-
-            routes_str = "; ".join([f"{route}: {count}" for route, count in top_routes])
-
-            # Формируем строку данных
-            row_data = [idx]
-            if has_wb_art:
-                row_data.append(product_data["артикул_wb"])
-            row_data.append(product_data["артикул_продавца"])
-            if has_size:
-                row_data.append(product_data["размер"])
-            row_data.append(product_data["общее_количество"])
-            row_data.append(routes_str)
-
-            ws.append(row_data)
-
-            # Форматирование
-            for col in range(1, col_count + 1):
-                cell = ws.cell(row=current_row, column=col)
-                # Выравнивание
-                if col == col_count:  # Последняя колонка - маршруты
-                    cell.alignment = Alignment(
-                        horizontal="left", vertical="center", wrap_text=True
-                    )
-                elif col == col_count - 1:  # Предпоследняя колонка - количество
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-                else:
-                    cell.alignment = Alignment(horizontal="left", vertical="center")
-                cell.border = Border(
-                    left=Side(style="thin"),
-                    right=Side(style="thin"),
-                    top=Side(style="thin"),
-                    bottom=Side(style="thin"),
-                )
-
-                if current_row % 2 == 0:
-                    cell.fill = PatternFill(
-                        start_color="F8F8F8", end_color="F8F8F8", fill_type="solid"
-                    )
-
-            current_row += 1
-
-        current_row += 2  # Отступ между разделами
-
-    # Настройка ширины колонок
-    if "A" in ws.column_dimensions:
-        ws.column_dimensions["A"].width = 5  # №
-
-    # Определяем ширину колонок в зависимости от наличия данных
-    col_idx = 1  # Начинаем с №
-    for analysis_type, analysis_data in all_analyses.items():
-        if "traffic_with_products" in analysis_data:
-            has_wb_art = "Артикул WB" in analysis_data["product_columns"]
-            has_size = "Размер" in analysis_data["product_columns"]
-
-            if has_wb_art:
-                col_idx += 1
-                ws.column_dimensions[get_column_letter(col_idx)].width = (
-                    20  # Артикул WB
-                )
-
-            col_idx += 1
-            ws.column_dimensions[get_column_letter(col_idx)].width = (
-                25  # Артикул продавца
-            )
-
-            if has_size:
-                col_idx += 1
-                ws.column_dimensions[get_column_letter(col_idx)].width = 15  # Размер
-
-            col_idx += 1
-            ws.column_dimensions[get_column_letter(col_idx)].width = (
-                15  # Общее количество
-            )
-
-            col_idx += 1
-            ws.column_dimensions[get_column_letter(col_idx)].width = (
-                40  # Основные маршруты
-            )
-            break  # Берем настройки из первого анализа
+        for idx, product in enumerate(top_products.itertuples(index=False), 1):
+            row_data = [idx] + list(product)
+            row_data[-2] = int(row_data[-2])
+            # Четные строки листа подсвечиваются
+            styles = striped_styles if (rows.row + 1) % 2 == 0 else row_styles
+            rows.append(row_data, styles=styles)
 
 
 def add_traffic_matrix_sheet(ws, analysis_data):
     """Добавляет лист с матрицей трафика"""
     matrix = analysis_data["traffic_matrix"]
     if matrix.empty:
-        ws["A1"] = "Нет данных для матрицы"
+        SheetRows(ws).append(["Нет данных для матрицы"])
         return
 
+    widths = {"A": 35}
+    for i in range(2, len(matrix.columns) + 2):
+        widths[get_column_letter(i)] = 12
+    rows = SheetRows(ws, widths=widths)
+
     # Заголовки
     headers = [f'{analysis_data["analysis_name"]} отправки →'] + list(matrix.columns)
-    ws.append(headers)
+    rows.append(headers, "matrix_header")
 
     # Данные
-    for location in matrix.index:
-        row_data = [location] + list(matrix.loc[location].values)
-        ws.append(row_data)
-
-    # Форматирование
-    ws.column_dimensions["A"].width = 35
-    for i in range(2, len(matrix.columns) + 2):
-        col_letter = get_column_letter(i)
-        ws.column_dimensions[col_letter].width = 12
-
-    for row in ws.iter_rows(
-        min_row=1, max_row=len(matrix) + 1, min_col=1, max_col=len(matrix.columns) + 1
-    ):
-        for cell in row:
-            if cell.row == 1 or cell.column == 1:
-                cell.font = Font(bold=True)
-                cell.fill = PatternFill(
-                    start_color="F0F0F0", end_color="F0F0F0", fill_type="solid"
-                )
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-            else:
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                cell.border = Border(
-                    left=Side(style="thin"),
-                    right=Side(style="thin"),
-                    top=Side(style="thin"),
-                    bottom=Side(style="thin"),
-                )
+    row_styles = ["matrix_header"] + [("center", "border")] * len(matrix.columns)
+    for location, values in zip(matrix.index, matrix.to_numpy()):
+        rows.append([location] + list(values), styles=row_styles)
 
 
 def add_destinations_summary_sheet(ws, dest_analysis):
     """Добавляет лист с общим количеством по городам прибытия"""
     analysis_name = dest_analysis["analysis_name"]
+    rows = SheetRows(ws, widths={"A": 35, "B": 20, "C": 20})
 
-    ws.append([f"{analysis_name} прибытия", "Всего поступлений", "Процент от общего"])
+    rows.append(
+        [f"{analysis_name} прибытия", "Всего поступлений", "Процент от общего"],
+        ("column_header", "center", "border"),
+    )
 
-    for _, row in dest_analysis["destinations_total"].iterrows():
-        city = row[dest_analysis["to_col"]]
-        total = row["Всего_поступлений"]
+    destinations = dest_analysis["destinations_total"]
+    for city, total in zip(
+        destinations[dest_analysis["to_col"]], destinations["Всего_поступлений"]
+    ):
         percentage = total / dest_analysis["total_records"] * 100
-        ws.append([city, total, f"{percentage:.2f}%"])
-
-    # Форматирование
-    ws.column_dimensions["A"].width = 35
-    ws.column_dimensions["B"].width = 20
-    ws.column_dimensions["C"].width = 20
-
-    for row in ws.iter_rows(min_row=1, max_row=ws.max_row):
-        for cell in row:
-            if cell.row == 1:
-                cell.font = Font(bold=True, size=11)
-                cell.fill = PatternFill(
-                    start_color="E0E0E0", end_color="E0E0E0", fill_type="solid"
-                )
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-            cell.border = Border(
-                left=Side(style="thin"),
-                right=Side(style="thin"),
-                top=Side(style="thin"),
-                bottom=Side(style="thin"),
-            )
+        rows.append([city, total, f"{percentage:.2f}%"], ("center", "border"))
 
 
 def add_detailed_sources_sheet(ws, dest_analysis):
     """Добавляет лист с детализацией источников для городов прибытия"""
     analysis_name = dest_analysis["analysis_name"]
-
-    current_row = 1
+    rows = SheetRows(ws, widths={"A": 5, "B": 35, "C": 15, "D": 12})
 
     # Проходим по топ-30 городам прибытия
     top_destinations = dest_analysis["destinations_total"].head(30)
 
-    for dest_idx, (_, dest_row) in enumerate(top_destinations.iterrows(), 1):
-        dest_city = dest_row[dest_analysis["to_col"]]
-        total_received = dest_row["Всего_поступлений"]
+    for dest_idx, (dest_city, total_received) in enumerate(
+        zip(
+            top_destinations[dest_analysis["to_col"]],
+            top_destinations["Всего_поступлений"],
+        ),
+        1,
+    ):
+        # Пустые строки между городами
+        if dest_idx > 1:
+            rows.skip(2)
 
         # Заголовок для города прибытия
-        ws.merge_cells(
-            start_row=current_row, start_column=1, end_row=current_row, end_column=4
-        )
-        title_cell = ws.cell(row=current_row, column=1)
-        title_cell.value = (
-            f"{dest_idx}. {dest_city} - Всего поступлений: {total_received:,}"
+        rows.append(
+            [f"{dest_idx}. {dest_city} - Всего поступлений: {total_received:,}"],
+            "destination_title",
         )
-        title_cell.font = Font(bold=True, size=12, color="1F4E79")
-        title_cell.fill = PatternFill(
-            start_color="DDEBF7", end_color="DDEBF7", fill_type="solid"
-        )
-        title_cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        current_row += 1
+        rows.merge(4)
 
         # Заголовки таблицы
         headers = ["№", f"{analysis_name} отправки", "Количество", "Процент"]
-        ws.append(headers)
-
-        # Форматирование заголовков
-        for col in range(1, 5):
-            cell = ws.cell(row=current_row, column=col)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(
-                start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-            )
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-            cell.border = Border(
-                left=Side(style="thin"),
-                right=Side(style="thin"),
-                top=Side(style="thin"),
-                bottom=Side(style="thin"),
-            )
-
-        current_row += 1
+        rows.append(headers, ("table_header", "border"))
 
         # Данные по источникам
         if dest_city in dest_analysis["destinations_detail"]:
             sources_data = dest_analysis["destinations_detail"][dest_city]["sources"]
+            columns = [dest_analysis["from_col"], "Количество", "Процент"]
 
-            for src_idx, (_, src_row) in enumerate(
-                sources_data.head(20).iterrows(), 1
+            for src_idx, (source_city, count, percent) in enumerate(
+                sources_data.head(20)[columns].itertuples(index=False), 1
             ):  # Топ-20 источников
-                source_city = src_row[dest_analysis["from_col"]]
-                count = src_row["Количество"]
-                percent = src_row["Процент"]
-
-                ws.append([src_idx, source_city, count, f"{percent}%"])
-
-                # Форматирование строки
-                for col in range(1, 5):
-                    cell = ws.cell(row=current_row, column=col)
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-                    cell.border = Border(
-                        left=Side(style="thin"),
-                        right=Side(style="thin"),
-                        top=Side(style="thin"),
-                        bottom=Side(style="thin"),
-                    )
-
-                    # Подсветка четных строк
-                    if current_row % 2 == 0:
-                        cell.fill = PatternFill(
-                            start_color="F8F8F8", end_color="F8F8F8", fill_type="solid"
-                        )
-
-                current_row += 1
+                # Подсветка четных строк
+                style = ("center", "border")
+                if (rows.row + 1) % 2 == 0:
+                    style += ("stripe",)
+                rows.append([src_idx, source_city, count, f"{percent}%"], style)
         else:
-            ws.append(["", "Нет данных", "", ""])
-            current_row += 1
-
-        # Добавляем пустую строку между городами
-        current_row += 2
-
-    # Настройка ширины колонок
-    ws.column_dimensions["A"].width = 5
-    ws.column_dimensions["B"].width = 35
-    ws.column_dimensions["C"].width = 15
-    ws.column_dimensions["D"].width = 12
+            rows.append(["", "Нет данных", "", ""])
 
 
 def add_info_sheet(ws, all_analyses):
     """Добавляет лист с информацией об анализе"""
-    ws.merge_cells("A1:D1")
-    title_cell = ws["A1"]
-    title_cell.value = "ИНФОРМАЦИЯ ОБ АНАЛИЗЕ"
-    title_cell.font = Font(bold=True, size=16, color="1F4E79")
-    title_cell.alignment = Alignment(horizontal="center", vertical="center")
-    title_cell.fill = PatternFill(
-        start_color="E2EFDA", end_color="E2EFDA", fill_type="solid"
-    )
-
-    # Информация
-    info_data = [
+    info_rows = [
         ["Дата анализа", datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
     ]
 
-    for info_item in info_data:
-        ws.append(info_item)
-
     # Добавляем информацию о каждом анализе
-    ws.append(["", ""])
-    ws.append(["ВЫПОЛНЕННЫЕ АНАЛИЗЫ:", ""])
+    info_rows.append(["", ""])
+    info_rows.append(["ВЫПОЛНЕННЫЕ АНАЛИЗЫ:", ""])
     for analysis_type, analysis_data in all_analyses.items():
-        ws.append(
+        info_rows.append(
             [
                 analysis_data["analysis_name"],
                 f"{analysis_data['from_col']} → {analysis_data['to_col']}",
@@ -1092,19 +952,19 @@ def add_info_sheet(ws, all_analyses):
 
         # Добавляем информацию о найденных товарных колонках
         if "product_columns" in analysis_data and analysis_data["product_columns"]:
-            ws.append(["Найденные товарные колонки:", ""])
+            info_rows.append(["Найденные товарные колонки:", ""])
             # Показываем обязательные колонки
             mandatory_columns = ["Артикул WB", "Артикул продавца", "Размер"]
             for col_name in mandatory_columns:
                 if col_name in analysis_data["product_columns"]:
                     actual_col = analysis_data["product_columns"][col_name]
-                    ws.append([f"  • {col_name}", f"→ {actual_col}"])
+                    info_rows.append([f"  • {col_name}", f"→ {actual_col}"])
                 else:
-                    ws.append([f"  • {col_name}", f"→ НЕ НАЙДЕНА"])
+                    info_rows.append([f"  • {col_name}", f"→ НЕ НАЙДЕНА"])
 
     # Добавляем информацию о дополнительном анализе
-    ws.append(["", ""])
-    ws.append(["ПРИМЕЧАНИЯ:", ""])
+    info_rows.append(["", ""])
+    info_rows.append(["ПРИМЕЧАНИЯ:", ""])
     notes = [
         "1. Анализ выполнен автоматически с определением колонок",
         "2. Данные очищены от пустых значений",
@@ -1117,53 +977,59 @@ def add_info_sheet(ws, all_analyses):
     ]
 
     for note in notes:
-        ws.append([note, ""])
-
-    # Форматирование
-    ws.column_dimensions["A"].width = 50
-    ws.column_dimensions["B"].width = 40
-
-    for row in ws.iter_rows(min_row=2):
-        for cell in row:
-            if cell.row == 2:  # Заголовки
-                cell.font = Font(bold=True)
-                cell.fill = PatternFill(
-                    start_color="FCE4D6", end_color="FCE4D6", fill_type="solid"
-                )
-
-            if cell.row % 2 == 0 and cell.row > 2:
-                cell.fill = PatternFill(
-                    start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                )
-
-            cell.alignment = Alignment(vertical="center", wrap_text=True)
+        info_rows.append([note, ""])
+
+    rows = SheetRows(ws, widths={"A": 50, "B": 40})
+    rows.append(["ИНФОРМАЦИЯ ОБ АНАЛИЗЕ"], "title")
+    rows.merge(4)
+
+    # Строки под заголовком: первая выделена, четные подсвечены, ширина A:D
+    for values in info_rows:
+        row = rows.row + 1
+        if row == 2:
+            style = ("info_header", "wrap")
+        elif row % 2 == 0:
+            style = ("info_stripe", "wrap")
+        else:
+            style = "wrap"
+        rows.append(values + [None] * (4 - len(values)), style)
 
 
 def add_statistics_sheet(ws, all_analyses, all_destination_analyses):
     """Добавляет лист со статистикой."""
-    ws.merge_cells("A1:C1")
-    title_cell = ws["A1"]
-    title_cell.value = "ОБЩАЯ СТАТИСТИКА АНАЛИЗА"
-    title_cell.font = Font(bold=True, size=16, color="1F4E79")
-    title_cell.alignment = Alignment(horizontal="center", vertical="center")
-    title_cell.fill = PatternFill(
-        start_color="E2EFDA", end_color="E2EFDA", fill_type="solid"
-    )
+    rows = SheetRows(ws, widths={"A": 50, "B": 40})
+
+    def stats_row(values):
+        # Три колонки с рамкой; подписи с двоеточием выделяются жирным
+        values = values + [None] * (3 - len(values))
+        styles = [
+            (
+                ("border", "label")
+                if isinstance(value, str) and ":" in value
+                else "border"
+            )
+            for value in values
+        ]
+        rows.append(values, styles=styles)
 
-    row = 3
-    for analysis_type, analysis_data in all_analyses.items():
+    rows.append(["ОБЩАЯ СТАТИСТИКА АНАЛИЗА"], "title")
+    rows.merge(3)
+    rows.skip(1)
+
+    for section_idx, (analysis_type, analysis_data) in enumerate(all_analyses.items()):
         analysis_name = analysis_data["analysis_name"]
 
+        # Отступ между разделами
+        if section_idx > 0:
+            stats_row([])
+            stats_row([])
+
         # Заголовок раздела
-        ws.merge_cells(f"A{row}:C{row}")
-        section_cell = ws[f"A{row}"]
-        section_cell.value = f"АНАЛИЗ {analysis_name.upper()}"
-        section_cell.font = Font(bold=True, size=14, color="2E75B6")
-        section_cell.fill = PatternFill(
-            start_color="FCE4D6", end_color="FCE4D6", fill_type="solid"
+        rows.append(
+            [f"АНАЛИЗ {analysis_name.upper()}", None, None],
+            styles=[("section", "border"), "border", "border"],
         )
-        section_cell.alignment = Alignment(horizontal="center")
-        row += 1
+        rows.merge(3)
 
         # Статистика
         stats_items = [
@@ -1184,28 +1050,20 @@ def add_statistics_sheet(ws, all_analyses, all_destination_analyses):
         ]
 
         # Добавляем статистику по товарам если есть
-        if (
-            "traffic_with_products" in analysis_data
-            and analysis_data["traffic_with_products"]
-        ):
-            # Считаем количество уникальных товаров
-            all_products = set()
-            for route_data in analysis_data["traffic_with_products"].values():
-                for product_key in route_data["products"].keys():
-                    all_products.add(product_key)
-
-            if all_products:
-                stats_items.append(["Уникальных товаров", len(all_products)])
+        route_products = analysis_data.get("route_products")
+        if route_products is not None and not route_products.empty:
+            unique_products = len(
+                route_products.drop_duplicates(route_product_keys(route_products))
+            )
+            stats_items.append(["Уникальных товаров", unique_products])
 
         for stat_name, stat_value in stats_items:
-            ws.append([stat_name, stat_value])
-            row += 1
+            stats_row([stat_name, stat_value])
 
         # Топ маршруты
         if not analysis_data["top_routes"].empty:
-            ws.append(["", ""])
-            ws.append([f"ТОП-10 МАРШРУТОВ ({analysis_name.lower()}):", ""])
-            row += 2
+            stats_row(["", ""])
+            stats_row([f"ТОП-10 МАРШРУТОВ ({analysis_name.lower()}):", ""])
             for i in range(min(10, len(analysis_data["top_routes"]))):
                 route = analysis_data["top_routes"].iloc[i]
                 from_val = route[analysis_data["from_col"]]
@@ -1215,8 +1073,7 @@ def add_statistics_sheet(ws, all_analyses, all_destination_analyses):
                     from_val = from_val[:22] + "..."
                 if len(to_val) > 25:
                     to_val = to_val[:22] + "..."
-                ws.append([f"{i+1}. {from_val} → {to_val}", f"{count:,}"])
-                row += 1
+                stats_row([f"{i+1}. {from_val} → {to_val}", f"{count:,}"])
 
         # Статистика по городам/регионам прибытия (если есть)
         if analysis_type in all_destination_analyses:
@@ -1233,18 +1090,15 @@ def add_statistics_sheet(ws, all_analyses, all_destination_analyses):
                 destination_type = "точек прибытия"
                 destination_single = "точка прибытия"
 
-            ws.append(["", ""])
-            ws.append([f"СТАТИСТИКА ПО {destination_type.upper()} ПРИБЫТИЯ:", ""])
-            row += 2
-            ws.append(
+            stats_row(["", ""])
+            stats_row([f"СТАТИСТИКА ПО {destination_type.upper()} ПРИБЫТИЯ:", ""])
+            stats_row(
                 [
                     f"Всего уникальных {destination_type} прибытия",
                     f"{dest_analysis['destinations_total'].shape[0]}",
                 ]
             )
-            row += 1
-            ws.append([f"ТОП-10 ПО {destination_type.upper()} ПОСТУПЛЕНИЯМ:", ""])
-            row += 1
+            stats_row([f"ТОП-10 ПО {destination_type.upper()} ПОСТУПЛЕНИЯМ:", ""])
             for i in range(min(10, len(dest_analysis["destinations_total"]))):
                 dest_row = dest_analysis["destinations_total"].iloc[i]
                 destination = dest_row[dest_analysis["to_col"]]
@@ -1252,33 +1106,124 @@ def add_statistics_sheet(ws, all_analyses, all_destination_analyses):
                 percentage = total / dest_analysis["total_records"] * 100
                 if len(destination) > 30:
                     destination = destination[:27] + "..."
-                ws.append([f"{i+1}. {destination}", f"{total:,} ({percentage:.1f}%)"])
-                row += 1
-
-        row += 2  # Отступ между разделами
-
-    # Настройка ширины колонок
-    ws.column_dimensions["A"].width = 50
-    ws.column_dimensions["B"].width = 40
-
-    # Форматирование
-    for row_cells in ws.iter_rows():
-        for cell in row_cells:
-            if cell.row == 1:
-                continue
-            if cell.value and isinstance(cell.value, str) and ":" in cell.value:
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(vertical="center")
-            if cell.row > 2:
-                cell.border = Border(
-                    left=Side(style="thin"),
-                    right=Side(style="thin"),
-                    top=Side(style="thin"),
-                    bottom=Side(style="thin"),
-                )
+                stats_row([f"{i+1}. {destination}", f"{total:,} ({percentage:.1f}%)"])
+
+
+def read_csv_chunks(uploaded_file, columns, routes, product_columns):
+    """
+    Читает из CSV только колонки маршрутов и товаров кусками по
+    CSV_CHUNK_ROWS строк. Значения читаются как текст: в разных кусках
+    pandas иначе мог бы угадать разные типы одной колонки.
+    """
+    needed = set()
+    for from_col, to_col, _ in routes.values():
+        needed.update((from_col, to_col))
+    needed.update(
+        product_columns[name] for name in ROUTE_PRODUCT_KEYS if name in product_columns
+    )
+    positions = [i for i, col in enumerate(columns) if col in needed]
+    reader = pd.read_csv(
+        uploaded_file,
+        encoding="utf-8",
+        usecols=positions,
+        dtype=str,
+        chunksize=CSV_CHUNK_ROWS,
+    )
+    for chunk in reader:
+        chunk.columns = [columns[i] for i in positions]
+        yield chunk
 
 
 # ===== VIEW =====
+def run_form19_job(job):
+    """Фоновая задача формы 19 (см. forms_app/jobs.py)"""
+    start_time = time.time()
+    file_name = job.input_name("file")
+    # Файл нужен до конца подсчёта: CSV читается по кускам
+    with job.open_input("file") as uploaded_file:
+        # Читаем файл: CSV потоково по кускам, Excel целиком
+        job.set_progress(5, "Чтение файла")
+        if file_name.endswith(".csv"):
+            # Колонки определяем по первому куску, он же идёт на лист исходных данных
+            df = pd.read_csv(uploaded_file, encoding="utf-8", nrows=CSV_CHUNK_ROWS)
+        else:
+            try:
+                df = read_sheet(uploaded_file, sheet_name="Все заказы", header=1)
+            except:
+                df = read_sheet(uploaded_file)
+
+        # Определяем колонки (регионы, города, товары) одним проходом
+        schema = detect_schema_cached(df)
+        region_from_col, region_to_col = schema.region_from, schema.region_to
+        city_from_col, city_to_col = schema.city_from, schema.city_to
+        product_columns = schema.product_columns
+
+        # Проверяем, найдены ли какие-либо колонки
+        if not (region_from_col and region_to_col) and not (
+            city_from_col and city_to_col
+        ):
+            raise ReportJobError(
+                "Не удалось определить колонки 'Регион отправки/прибытия' или 'Город отправки/прибытия'. "
+                "Убедитесь, что в файле есть колонки с названиями 'Регион отправки', 'Регион прибытия' "
+                "или неназванные колонки (Unnamed), содержащие слова 'Электросталь', 'Коледино', 'Москва', 'Санкт-Петербург'."
+            )
+
+        routes = {}
+        if region_from_col and region_to_col:
+            routes["regions"] = (region_from_col, region_to_col, "Регионы")
+        if city_from_col and city_to_col:
+            routes["cities"] = (city_from_col, city_to_col, "Города")
+
+        job.set_progress(20, "Анализ маршрутов")
+        if file_name.endswith(".csv"):
+            df = df.head(1000)
+            uploaded_file.seek(0)
+            chunks = read_csv_chunks(uploaded_file, df.columns, routes, product_columns)
+        else:
+            chunks = [df]
+        counts, rows = count_routes_in_chunks(chunks, routes, product_columns)
+    print(f"Форма 19: обработано строк: {rows:,}")
+
+    all_analyses = {}
+    all_destination_analyses = {}
+    for key, (from_col, to_col, analysis_name) in routes.items():
+        route_counts, product_counts = counts[key]
+        analysis_result = analyze_traffic_counts(
+            route_counts,
+            product_counts,
+            from_col,
+            to_col,
+            analysis_name,
+            product_columns,
+        )
+        if analysis_result is not None:
+            all_analyses[key] = analysis_result
+            destination_result = analyze_destination_counts(
+                route_counts, from_col, to_col, analysis_name
+            )
+            if destination_result is not None:
+                all_destination_analyses[key] = destination_result
+
+    # Если не удалось провести ни один анализ
+    if not all_analyses:
+        raise ReportJobError(
+            "Ни один из анализов (по регионам или городам) не дал результатов."
+        )
+
+    # Создаем Excel отчет
+    job.set_progress(70, "Формирование Excel")
+    excel_buffer = create_excel_report_with_proper_names(
+        df, all_analyses, all_destination_analyses
+    )
+    print(f"⏱ Форма 19: обработка заняла {time.time() - start_time:.1f} с")
+
+    # Создаем имя файла для скачивания
+    original_name = file_name.rsplit(".", 1)[0]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"Form19_анализ_трафика_{original_name}_{timestamp}.xlsx"
+    return ReportResult(excel_buffer.getvalue(), filename, XLSX_CONTENT_TYPE)
+
+
 @login_required
 @csrf_protect
 def form19_view(request):
@@ -1310,114 +1255,11 @@ def form19_view(request):
             messages.error(request, "❌ Пожалуйста, выберите файл для загрузки!")
             return redirect("forms_app:form19_view")
 
-        try:
-            start_time = time.time()
-            uploaded_file = request.FILES["file"]
-
-            # Читаем файл
-            if uploaded_file.name.endswith(".csv"):
-                df = pd.read_csv(uploaded_file, encoding="utf-8")
-            else:
-                try:
-                    df = pd.read_excel(uploaded_file, sheet_name="Все заказы", header=1)
-                except:
-                    df = pd.read_excel(uploaded_file)
-
-            # Определяем колонки
-            region_from_col, region_to_col = find_region_columns(df)
-            city_from_col, city_to_col = find_city_columns(df)
-
-            # Находим колонки с товарами (обязательные: Артикул WB, Артикул продавца, Размер)
-            product_columns = find_product_columns(df)
-
-            # Проверяем, найдены ли какие-либо колонки
-            if not (region_from_col and region_to_col) and not (
-                city_from_col and city_to_col
-            ):
-                messages.error(
-                    request,
-                    "❌ Не удалось определить колонки 'Регион отправки/прибытия' или 'Город отправки/прибытия'. "
-                    "Убедитесь, что в файле есть колонки с названиями 'Регион отправки', 'Регион прибытия' "
-                    "или неназванные колонки (Unnamed), содержащие слова 'Электросталь', 'Коледино', 'Москва', 'Санкт-Петербург'.",
-                )
-                return redirect("forms_app:form19_view")
-
-            all_analyses = {}
-            all_destination_analyses = {}
-
-            # Анализ по регионам
-            if region_from_col and region_to_col:
-                region_analysis_result = analyze_traffic_with_products(
-                    df, region_from_col, region_to_col, "Регионы", product_columns
-                )
-                if region_analysis_result is not None:
-                    all_analyses["regions"] = region_analysis_result
-                    region_destination_result = analyze_destinations_by_sources(
-                        df, region_from_col, region_to_col, "Регионы"
-                    )
-                    if region_destination_result is not None:
-                        all_destination_analyses["regions"] = region_destination_result
-
-            # Анализ по городам
-            if city_from_col and city_to_col:
-                city_analysis_result = analyze_traffic_with_products(
-                    df, city_from_col, city_to_col, "Города", product_columns
-                )
-                if city_analysis_result is not None:
-                    all_analyses["cities"] = city_analysis_result
-                    city_destination_result = analyze_destinations_by_sources(
-                        df, city_from_col, city_to_col, "Города"
-                    )
-                    if city_destination_result is not None:
-                        all_destination_analyses["cities"] = city_destination_result
-
-            # Если не удалось провести ни один анализ
-            if not all_analyses:
-                messages.error(
-                    request,
-                    "❌ Ни один из анализов (по регионам или городам) не дал результатов.",
-                )
-                return redirect("forms_app:form19_view")
-
-            # Создаем Excel отчет
-            excel_buffer = create_excel_report_with_proper_names(
-                df, all_analyses, all_destination_analyses
-            )
-            processing_time = time.time() - start_time
-
-            # Сохраняем информацию для статистики (опционально)
-            request.session["form19_processing_time"] = processing_time
-            request.session["form19_analysis_count"] = len(all_analyses)
-            request.session.modified = True
-
-            # Очищаем сессию после отправки файла
-            request.session.pop("form19_last_upload", None)
-
-            # Создаем имя файла для скачивания
-            original_name = uploaded_file.name.rsplit(".", 1)[0]
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"Form19_анализ_трафика_{original_name}_{timestamp}.xlsx"
-
-            # Создаем HttpResponse с правильными заголовками
-            response = HttpResponse(
-                excel_buffer.getvalue(),
-                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
-            safe_filename = quote(filename.encode("utf-8"))
-            response["Content-Disposition"] = (
-                f"attachment; filename*=UTF-8''{safe_filename}"
-            )
-            response["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-            response["Pragma"] = "no-cache"
-            response["Expires"] = "Mon, 01 Jan 1990 00:00:00 GMT"
-
-            return response
-
-        except Exception as e:
-            messages.error(request, f"❌ Ошибка при обработке файла: {str(e)}")
-            import traceback
+        # Новый токен: повторная отправка той же формы не создаст вторую задачу
+        request.session["form19_upload_token"] = str(uuid.uuid4())
+        request.session.pop("form19_last_upload", None)
 
-            print(traceback.format_exc())
-            # Возвращаем на главную с новым токеном
-            request.session["form19_upload_token"] = str(uuid.uuid4())
-            return redirect("forms_app:form19_view")
+        # Сам анализ выполняется в фоне (run_report_workers)
+        return submit_report_job(
+            request, "form19", files={"file": request.FILES["file"]}
+        )
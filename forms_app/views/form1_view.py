@@ -2,9 +2,10 @@ import pandas as pd
 from django.http import HttpResponse
 from django.shortcuts import render
 from io import BytesIO
-import matplotlib.pyplot as plt
 from openpyxl.drawing.image import Image as OpenpyxlImage
 from openpyxl.utils.dataframe import dataframe_to_rows
+from forms_app.charts import render_png
+from forms_app.ingest import read_sheet
 
 
 def form1(request):
@@ -29,7 +30,7 @@ def form1(request):
                     "forms_app/form1.html",
                     {"error": "Необходимо загрузить файл."},
                 )
-            df = pd.read_excel(file)
+            df = read_sheet(file)
             df["Источник"] = "Точка 1"
             dfs.append(df)
 
@@ -45,9 +46,9 @@ def form1(request):
                     {"error": "Пожалуйста, загрузите все три файла."},
                 )
 
-            df1 = pd.read_excel(file1)
-            df2 = pd.read_excel(file2)
-            df3 = pd.read_excel(file3)
+            df1 = read_sheet(file1)
+            df2 = read_sheet(file2)
+            df3 = read_sheet(file3)
 
             df1["Источник"] = "Точка 1"
             df2["Источник"] = "Точка 2"
@@ -99,54 +100,61 @@ def form1(request):
             sums_per_date["Итого к оплате"] / sums_per_date["Продажа"] * 100
         ).round(1)
 
+        # Графики рисуются один раз для одинаковых данных (кэш forms_app.charts)
+        dates = sums_per_date["Дата конца"].tolist()
+        since = start_date.strftime("%d-%m-%Y")
+
         # Построение графика для основных финансовых показателей
-        buf_main = BytesIO()
-        plt.figure(figsize=(15, 8))
-        for column in [
-            "Продажа",
-            "К перечислению за товар",
-            "Стоимость логистики",
-            "Итого к оплате",
-        ]:
-            plt.plot(
-                sums_per_date["Дата конца"],
-                sums_per_date[column],
-                label=column,
-                marker="o",  # Добавляем точки
-                markersize=6,  # Размер точек
-            )
-        plt.title(
-            f'Основные финансовые показатели (с {start_date.strftime("%d-%m-%Y")})'
+        main_png = render_png(
+            {
+                "figsize": (15, 8),
+                "series": [
+                    {
+                        "x": dates,
+                        "y": sums_per_date[column].tolist(),
+                        # Точки на линии и их размер
+                        "options": {"label": column, "marker": "o", "markersize": 6},
+                    }
+                    for column in [
+                        "Продажа",
+                        "К перечислению за товар",
+                        "Стоимость логистики",
+                        "Итого к оплате",
+                    ]
+                ],
+                "title": f"Основные финансовые показатели (с {since})",
+                "xlabel": "Дата",
+                "ylabel": "Сумма",
+                "xticks": {"rotation": 90},
+                "legend": {},
+                "grid": {"visible": True},
+            }
         )
-        plt.xlabel("Дата")
-        plt.ylabel("Сумма")
-        plt.xticks(rotation=90)
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(buf_main, format="png")
-        plt.close()
 
         # Построение отдельного графика для "Наш%"
-        buf_nash_percent = BytesIO()
-        plt.figure(figsize=(15, 4))
-        plt.plot(
-            sums_per_date["Дата конца"],
-            sums_per_date["Наш %"],
-            label="Наш %",
-            color="red",
-            marker="o",  # Добавляем точки
-            markersize=4,  # Размер точек
+        nash_percent_png = render_png(
+            {
+                "figsize": (15, 4),
+                "series": [
+                    {
+                        "x": dates,
+                        "y": sums_per_date["Наш %"].tolist(),
+                        "options": {
+                            "label": "Наш %",
+                            "color": "red",
+                            "marker": "o",
+                            "markersize": 4,
+                        },
+                    }
+                ],
+                "title": f"Наш Процент (с {since})",
+                "xlabel": "Дата",
+                "ylabel": "Наш Процент",
+                "xticks": {"rotation": 90},
+                "legend": {},
+                "grid": {"visible": True},
+            }
         )
-        plt.title(f'Наш Процент (с {start_date.strftime("%d-%m-%Y")})')
-        plt.xlabel("Дата")
-        plt.ylabel("Наш Процент")
-        plt.xticks(rotation=90)
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(buf_nash_percent, format="png")
-        plt.close()
 
         # Создание Excel-файла
         output = BytesIO()
@@ -159,11 +167,11 @@ def form1(request):
                 worksheet.append(row)
 
             # Добавляем график для основных финансовых показателей
-            img_main = OpenpyxlImage(buf_main)
+            img_main = OpenpyxlImage(BytesIO(main_png))
             worksheet.add_image(img_main, "K10")
 
             # Добавляем отдельный график для "Наш%"
-            img_nash_percent = OpenpyxlImage(buf_nash_percent)
+            img_nash_percent = OpenpyxlImage(BytesIO(nash_percent_png))
             worksheet.add_image(
                 img_nash_percent, "K50"
             )  # Вы можете изменить позицию как удобно
@@ -3,21 +3,136 @@
 Форма 20: Ежедневные данные по артикулам
 Отличие от Формы 4: не суммирует, а показывает ежедневные изменения по каждому артикулу
 """
+
 import re
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from decimal import Decimal
 from io import BytesIO
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from forms_app.forms import UploadFileForm, Form20DataForm
 from forms_app.models import Form20Data
+from forms_app.ingest import read_sheets, format_parse_times
 from openpyxl.styles import Alignment, Font, NamedStyle
 from openpyxl.utils import get_column_letter
 import json
 
+# Колонки отчёта → DecimalField модели Form20Data
+FORM20_DECIMAL_FIELDS = {
+    "Чистые продажи Наши": "clear_sales_our",
+    "Чистая реализация ВБ": "clear_sales_vb",
+    "Чистое Перечисление": "clear_transfer",
+    "Чистое Перечисление без Логистики": "clear_transfer_without_log",
+    "Наша цена Средняя": "our_price_mid",
+    "Реализация ВБ Средняя": "vb_selling_mid",
+    "К перечислению Среднее": "transfer_mid",
+    "К Перечислению без Логистики Средняя": "transfer_without_log_mid",
+    "Себес Продаж (600р)": "sebes_sale",
+    "Прибыль на 1 Юбку": "profit_1",
+    "%Выкупа": "percent_sell",
+    "Прибыль": "profit",
+    "% Лог/Наша Цена": "percent_log_price",
+    "% СПП": "spp_percent",
+}
+# Колонки отчёта → IntegerField
+FORM20_INT_FIELDS = {
+    "Чистые продажи, шт": "qentity_sale",
+    "Заказы": "orders",
+}
+
+# Колонки, которые читаются из файла (остальные не загружаются в память)
+FORM20_COLUMNS = [
+    "Код номенклатуры",
+    "Артикул поставщика",
+    *FORM20_DECIMAL_FIELDS,
+    *FORM20_INT_FIELDS,
+]
+
+INVALID_CODES = {"", "0", "000", "000000000"}
+
+BULK_BATCH_SIZE = 500
+
+# Поля, которые перезаписываются при повторной загрузке того же дня
+FORM20_UPDATE_FIELDS = [
+    "article",
+    *FORM20_DECIMAL_FIELDS.values(),
+    *FORM20_INT_FIELDS.values(),
+    "updated_at",
+]
+
+
+def _decimal_column(series, field_name):
+    """
+    Квантует всю колонку под DecimalField за один проход:
+    округление и форматирование — векторно, NaN и значения,
+    не помещающиеся в max_digits, — в None.
+    """
+    field = Form20Data._meta.get_field(field_name)
+    places = field.decimal_places
+    limit = 10 ** (field.max_digits - places)
+
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    values = np.round(values, places)
+    ok = np.isfinite(values) & (np.abs(values) < limit)
+
+    result = np.full(len(values), None, dtype=object)
+    if ok.any():
+        result[ok] = [Decimal(text) for text in np.char.mod(f"%.{places}f", values[ok])]
+    return result
+
+
+def _int_column(series):
+    values = pd.to_numeric(series, errors="coerce").replace([np.inf, -np.inf], np.nan)
+    values = np.trunc(values).astype("Int64")
+    return values.astype(object).where(values.notna(), None).to_numpy()
+
+
+def build_form20_records(df_input, user, file_date):
+    """
+    Строит объекты Form20Data по колонкам, без iterrows и safe_float на каждую ячейку.
+    Возвращает (список объектов, число пропущенных строк).
+    """
+    codes = df_input["Код номенклатуры"].astype(str).str.strip()
+    valid = df_input["Код номенклатуры"].notna() & ~codes.isin(INVALID_CODES)
+    df_valid = df_input[valid]
+    n = len(df_valid)
+
+    data = {"code": codes[valid].to_numpy()}
+
+    if "Артикул поставщика" in df_valid.columns:
+        articles = df_valid["Артикул поставщика"].astype(str).str.strip()
+        articles = articles.where(
+            df_valid["Артикул поставщика"].notna() & (articles != ""), None
+        )
+        data["article"] = articles.to_numpy()
+    else:
+        data["article"] = np.full(n, None, dtype=object)
+
+    for column, field in FORM20_DECIMAL_FIELDS.items():
+        if column in df_valid.columns:
+            data[field] = _decimal_column(df_valid[column], field)
+        else:
+            data[field] = np.full(n, None, dtype=object)
+
+    for column, field in FORM20_INT_FIELDS.items():
+        if column in df_valid.columns:
+            data[field] = _int_column(df_valid[column])
+        else:
+            data[field] = np.full(n, None, dtype=object)
+
+    names = list(data)
+    records = [
+        Form20Data(user=user, date=file_date, **dict(zip(names, values)))
+        for values in zip(*data.values())
+    ]
+    return records, int((~valid).sum())
+
 
 # ============================================================================
 # 📤 ЗАГРУЗКА ФАЙЛОВ
@@ -47,21 +162,34 @@ def upload_file20(request):
         total_uploaded = 0
         total_skipped = 0
 
+        xlsx_files = []
         for uploaded_file in uploaded_files:
             if not uploaded_file.name.lower().endswith(".xlsx"):
                 messages.error(request, f"❌ {uploaded_file.name} — не .xlsx")
                 total_skipped += 1
                 continue
+            xlsx_files.append(uploaded_file)
+
+        # Разбираем все файлы сразу (параллельно, см. INGEST_WORKERS)
+        parsed_files = read_sheets(
+            xlsx_files,
+            sheet_name=0,
+            usecols=FORM20_COLUMNS,
+            dtype={"Код номенклатуры": str, "Артикул поставщика": str},
+            nrows=150,
+        )
 
-            try:
-                file_data = BytesIO(uploaded_file.read())
-                df_input = pd.read_excel(file_data, sheet_name=0).head(150)
-            except Exception as e:
+        # (код, дата) → запись; дубли внутри загрузки схлопываются, побеждает последний
+        merged_records = {}
+        for uploaded_file, parsed in zip(xlsx_files, parsed_files):
+            if parsed.error is not None:
                 messages.error(
-                    request, f"❌ Ошибка при чтении {uploaded_file.name}: {e}"
+                    request,
+                    f"❌ Ошибка при чтении {uploaded_file.name}: {parsed.error}",
                 )
                 total_skipped += 1
                 continue
+            df_input = parsed.df
 
             required_columns = ["Код номенклатуры"]
             missing_columns = [
@@ -84,64 +212,31 @@ def upload_file20(request):
                     f"⚠️ Не найдена дата в '{uploaded_file.name}', использована {file_date}",
                 )
 
-            new_records = []
-            for idx, row in df_input.iterrows():
-                code = str(row["Код номенклатуры"]).strip()
-                if not code or code in {"0", "000", "000000000"}:
-                    continue
-
-                article = str(row.get("Артикул поставщика", "")).strip() or None
-
-                def safe_float(val):
-                    try:
-                        return float(val) if pd.notna(val) else None
-                    except (ValueError, TypeError):
-                        return None
-
-                def safe_int(val):
-                    try:
-                        return int(val) if pd.notna(val) else None
-                    except (ValueError, TypeError):
-                        return None
-
-                new_records.append(
-                    Form20Data(
-                        user=request.user,
-                        code=code,
-                        article=article,
-                        date=file_date,  # 🔥 Теперь правильная дата из имени файла!
-                        clear_sales_our=safe_float(row.get("Чистые продажи Наши")),
-                        clear_sales_vb=safe_float(row.get("Чистая реализация ВБ")),
-                        clear_transfer=safe_float(row.get("Чистое Перечисление")),
-                        clear_transfer_without_log=safe_float(
-                            row.get("Чистое Перечисление без Логистики")
-                        ),
-                        our_price_mid=safe_float(row.get("Наша цена Средняя")),
-                        vb_selling_mid=safe_float(row.get("Реализация ВБ Средняя")),
-                        transfer_mid=safe_float(row.get("К перечислению Среднее")),
-                        transfer_without_log_mid=safe_float(
-                            row.get("К Перечислению без Логистики Средняя")
-                        ),
-                        qentity_sale=safe_int(row.get("Чистые продажи, шт")),
-                        sebes_sale=safe_float(row.get("Себес Продаж (600р)")),
-                        profit_1=safe_float(row.get("Прибыль на 1 Юбку")),
-                        percent_sell=safe_float(row.get("%Выкупа")),
-                        profit=safe_float(row.get("Прибыль")),
-                        orders=safe_int(row.get("Заказы")),
-                        percent_log_price=safe_float(row.get("% Лог/Наша Цена")),
-                        spp_percent=safe_float(row.get("% СПП")),
-                    )
-                )
-
-            created = Form20Data.objects.bulk_create(new_records, ignore_conflicts=True)
-            total_uploaded += len(created)
+            new_records, _ = build_form20_records(df_input, request.user, file_date)
+            for record in new_records:
+                merged_records[(record.code, record.date)] = record
             print(
-                f"   ✅ {uploaded_file.name}: сохранено {len(created)} записей за {file_date}"
+                f"   ✅ {uploaded_file.name}: подготовлено {len(new_records)} записей за {file_date}"
+            )
+
+        # 🔥 Все файлы — одной транзакцией; повторная загрузка дня обновляет строки
+        with transaction.atomic():
+            saved = Form20Data.objects.bulk_create(
+                list(merged_records.values()),
+                update_conflicts=True,
+                unique_fields=["user", "code", "date"],
+                update_fields=FORM20_UPDATE_FIELDS,
+                batch_size=BULK_BATCH_SIZE,
             )
+        total_uploaded += len(saved)
+
+        parse_times = format_parse_times(parsed_files)
+        if parse_times:
+            messages.info(request, f"⏱ Время разбора: {parse_times}")
 
         if total_uploaded:
             messages.success(
-                request, f"✅ Загружено {total_uploaded} ежедневных записей."
+                request, f"✅ Загружено/обновлено {total_uploaded} ежедневных записей."
             )
         if total_skipped:
             messages.warning(request, f"⚠️ Пропущено {total_skipped} файлов.")
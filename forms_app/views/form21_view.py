@@ -4,6 +4,7 @@ import numpy as np
 from django.http import HttpResponse
 from django.shortcuts import render
 from io import BytesIO
+from forms_app.ingest import read_sheet
 
 
 def extract_prefix(article):
@@ -23,6 +24,72 @@ def calculate_purchase_percentage(revenue_count, logistics_count):
     return round((revenue_count / logistics_count) * 100, 1)
 
 
+# Колонки отчёта о начислениях Ozon
+SUM_COLUMN = "Сумма итого, руб."
+TYPE_COLUMN = "Тип начисления"
+
+
+def add_prefix_column(df):
+    """Префикс артикула: extract_prefix считается один раз на артикул"""
+    codes, articles = pd.factorize(df["Артикул"])
+    # Код -1 (пустой артикул) попадает на последний элемент — "unknown"
+    prefixes = np.array(
+        [extract_prefix(a) for a in articles] + ["unknown"], dtype=object
+    )
+    df["Префикс_артикула"] = prefixes[codes]
+    return df
+
+
+def accrual_stats(df, key):
+    """
+    Суммы и количество операций по ключу (артикул или префикс) за один
+    groupby по ключу и типу начисления. Ключи в порядке первого появления.
+    """
+    totals = df.groupby(key, sort=False, dropna=False)[SUM_COLUMN].sum()
+    by_type = df.groupby([key, TYPE_COLUMN], sort=False, dropna=False)[SUM_COLUMN].agg(
+        ["sum", "size"]
+    )
+    sums = by_type["sum"].unstack(fill_value=0).reindex(totals.index)
+    counts = by_type["size"].unstack(fill_value=0).reindex(totals.index)
+
+    def by_accrual(table, accrual_type, empty):
+        if accrual_type not in table.columns:
+            return pd.Series(empty, index=totals.index)
+        return table[accrual_type]
+
+    revenue_count = by_accrual(counts, "Выручка", 0)
+    logistics_count = by_accrual(counts, "Логистика", 0)
+    return pd.DataFrame(
+        {
+            "Общая сумма, руб": totals,
+            "Выручка, руб": by_accrual(sums, "Выручка", 0.0),
+            "Логистика, руб": by_accrual(sums, "Логистика", 0.0),
+            "Количество выкупов": revenue_count,
+            "Количество заказов": logistics_count,
+            "Процент выкупа, %": [
+                calculate_purchase_percentage(r, l)
+                for r, l in zip(revenue_count, logistics_count)
+            ],
+        }
+    )
+
+
+def article_stats(df_non_ad):
+    """Статистика по полным артикулам"""
+    stats = accrual_stats(df_non_ad, "Артикул")
+    stats.insert(0, "Префикс", [extract_prefix(a) for a in stats.index])
+    return stats.rename_axis("Артикул").reset_index()
+
+
+def prefix_stats(df_non_ad):
+    """Статистика по префиксам артикулов (группам)"""
+    stats = accrual_stats(df_non_ad, "Префикс_артикула")
+    stats["Количество артикулов в группе"] = df_non_ad.groupby(
+        "Префикс_артикула", sort=False
+    )["Артикул"].nunique()
+    return stats.rename_axis("Префикс_группы").reset_index()
+
+
 def form21(request):
     """Загрузка файла и скачивание обработанного результата"""
     if request.method == "POST":
@@ -37,10 +104,10 @@ def form21(request):
 
         try:
             # Читаем файл
-            df = pd.read_excel(excel_file, skiprows=1, header=0)
+            df = read_sheet(excel_file, skiprows=1, header=0)
 
             # Добавляем префикс
-            df["Префикс_артикула"] = df["Артикул"].apply(extract_prefix)
+            add_prefix_column(df)
 
             # Отделяем рекламу
             ad_types = ["Оплата за клик"]
@@ -51,78 +118,11 @@ def form21(request):
             total_ad_cost = df_ad["Сумма итого, руб."].sum() if len(df_ad) > 0 else 0
 
             # ============= ГРУППИРОВКА 1: ПО ПОЛНЫМ АРТИКУЛАМ =============
-            detailed_stats = []
-
-            for article in df_non_ad["Артикул"].unique():
-                article_df = df_non_ad[df_non_ad["Артикул"] == article]
-
-                total_sum = article_df["Сумма итого, руб."].sum()
-                revenue_count = len(
-                    article_df[article_df["Тип начисления"] == "Выручка"]
-                )
-                logistics_count = len(
-                    article_df[article_df["Тип начисления"] == "Логистика"]
-                )
-                purchase_percentage = calculate_purchase_percentage(
-                    revenue_count, logistics_count
-                )
-                revenue_sum = article_df[article_df["Тип начисления"] == "Выручка"][
-                    "Сумма итого, руб."
-                ].sum()
-                logistics_sum = article_df[article_df["Тип начисления"] == "Логистика"][
-                    "Сумма итого, руб."
-                ].sum()
-
-                detailed_stats.append(
-                    {
-                        "Артикул": article,
-                        "Префикс": extract_prefix(article),
-                        "Общая сумма, руб": total_sum,
-                        "Выручка, руб": revenue_sum,
-                        "Логистика, руб": logistics_sum,
-                        "Количество выкупов": revenue_count,
-                        "Количество заказов": logistics_count,
-                        "Процент выкупа, %": purchase_percentage,
-                    }
-                )
-
-            detailed_df = pd.DataFrame(detailed_stats)
+            detailed_df = article_stats(df_non_ad)
             detailed_df = detailed_df.sort_values("Общая сумма, руб", ascending=False)
 
             # ============= ГРУППИРОВКА 2: ПО ПРЕФИКСАМ =============
-            group_stats = []
-            for prefix in df_non_ad["Префикс_артикула"].unique():
-                group_df = df_non_ad[df_non_ad["Префикс_артикула"] == prefix]
-                total_sum = group_df["Сумма итого, руб."].sum()
-                revenue_count = len(group_df[group_df["Тип начисления"] == "Выручка"])
-                logistics_count = len(
-                    group_df[group_df["Тип начисления"] == "Логистика"]
-                )
-                purchase_percentage = calculate_purchase_percentage(
-                    revenue_count, logistics_count
-                )
-                revenue_sum = group_df[group_df["Тип начисления"] == "Выручка"][
-                    "Сумма итого, руб."
-                ].sum()
-                logistics_sum = group_df[group_df["Тип начисления"] == "Логистика"][
-                    "Сумма итого, руб."
-                ].sum()
-                unique_articles = group_df["Артикул"].nunique()
-
-                group_stats.append(
-                    {
-                        "Префикс_группы": prefix,
-                        "Общая сумма, руб": total_sum,
-                        "Выручка, руб": revenue_sum,
-                        "Логистика, руб": logistics_sum,
-                        "Количество выкупов": revenue_count,
-                        "Количество заказов": logistics_count,
-                        "Процент выкупа, %": purchase_percentage,
-                        "Количество артикулов в группе": unique_articles,
-                    }
-                )
-
-            group_df_result = pd.DataFrame(group_stats)
+            group_df_result = prefix_stats(df_non_ad)
             group_df_result = group_df_result.sort_values(
                 "Общая сумма, руб", ascending=False
             )
@@ -1,15 +1,13 @@
 # forms_app/views/form3_view.py
 
 import pandas as pd
-import matplotlib
-
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 from io import BytesIO
 from django.shortcuts import render, HttpResponse
 from django import forms
 from openpyxl.drawing.image import Image as XLImage
 from forms_app.forms import UploadFileForm  # ✅ Так тоже работает
+from forms_app.charts import render_png
+from forms_app.ingest import read_sheet
 
 
 # --- Форма прямо здесь ---
@@ -22,7 +20,7 @@ def form3(request):
         form = ExcelUploadForm(request.POST, request.FILES)
         if form.is_valid():
             uploaded_file = request.FILES["excel_file"]
-            df = pd.read_excel(uploaded_file)
+            df = read_sheet(uploaded_file)
 
             # --- Первый отчет: по Области ---
             area_local = (
@@ -37,21 +35,27 @@ def form3(request):
             )
 
             # График для "Local_area"
-            plt.figure(figsize=(12, 6))
-            plt.bar(
-                area_local["Область"].head(20),
-                area_local["К перечислению за товар, руб."].head(20),
-                color="skyblue",
+            image_data_local = BytesIO(
+                render_png(
+                    {
+                        "figsize": (12, 6),
+                        "series": [
+                            {
+                                "kind": "bar",
+                                "x": area_local["Область"].head(20).tolist(),
+                                "y": area_local["К перечислению за товар, руб."]
+                                .head(20)
+                                .tolist(),
+                                "options": {"color": "skyblue"},
+                            }
+                        ],
+                        "title": "Сумма к перечислению по регионам (топ-20)",
+                        "xlabel": "Регион",
+                        "ylabel": "Сумма, руб.",
+                        "xticks": {"rotation": 45, "ha": "right"},
+                    }
+                )
             )
-            plt.title("Сумма к перечислению по регионам (топ-20)")
-            plt.xlabel("Регион")
-            plt.ylabel("Сумма, руб.")
-            plt.xticks(rotation=45, ha="right")
-            plt.tight_layout()
-            image_data_local = BytesIO()
-            plt.savefig(image_data_local, format="png")
-            plt.close()
-            image_data_local.seek(0)
 
             # --- Второй отчет: по Федеральному округу ---
             area_federal = (
@@ -66,21 +70,29 @@ def form3(request):
             )
 
             # График для "Federal_area"
-            plt.figure(figsize=(12, 6))
-            plt.bar(
-                area_federal["Федеральный округ"].head(10),
-                area_federal["К перечислению за товар, руб."].head(10),
-                color="lightgreen",
+            image_data_federal = BytesIO(
+                render_png(
+                    {
+                        "figsize": (12, 6),
+                        "series": [
+                            {
+                                "kind": "bar",
+                                "x": area_federal["Федеральный округ"]
+                                .head(10)
+                                .tolist(),
+                                "y": area_federal["К перечислению за товар, руб."]
+                                .head(10)
+                                .tolist(),
+                                "options": {"color": "lightgreen"},
+                            }
+                        ],
+                        "title": "Сумма к перечислению по федеральным округам",
+                        "xlabel": "Федеральные округа",
+                        "ylabel": "Сумма, руб.",
+                        "xticks": {"rotation": 45, "ha": "right"},
+                    }
+                )
             )
-            plt.title("Сумма к перечислению по федеральным округам")
-            plt.xlabel("Федеральные округа")
-            plt.ylabel("Сумма, руб.")
-            plt.xticks(rotation=45, ha="right")
-            plt.tight_layout()
-            image_data_federal = BytesIO()
-            plt.savefig(image_data_federal, format="png")
-            plt.close()
-            image_data_federal.seek(0)
 
             # --- Генерация Excel-файла в памяти ---
             output = BytesIO()
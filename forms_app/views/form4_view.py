@@ -1,6 +1,7 @@
 # forms_app/views/form4_view.py
 
 import re
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from io import BytesIO
@@ -10,10 +11,90 @@ from django.http import HttpResponse
 from django.contrib import messages
 from forms_app.forms import UploadFileForm, Form4DataForm
 from forms_app.models import Form4Data  # Убедись, что модель добавлена
+from forms_app.ingest import read_sheets, format_parse_times
+from forms_app.search import search
+from django.db import transaction
 from django.db.models import Q
 from openpyxl.styles import Alignment, Font, NamedStyle
 from openpyxl.utils import get_column_letter
 
+# Колонки отчёта → поля Form4Data
+FORM4_FLOAT_FIELDS = {
+    "Чистые продажи Наши": "clear_sales_our",
+    "Чистая реализация ВБ": "clear_sales_vb",
+    "Чистое Перечисление": "clear_transfer",
+    "Чистое Перечисление без Логистики": "clear_transfer_without_log",
+    "Наша цена Средняя": "our_price_mid",
+    "Реализация ВБ Средняя": "vb_selling_mid",
+    "К перечислению Среднее": "transfer_mid",
+    "К Перечислению без Логистики Средняя": "transfer_without_log_mid",
+    "Себес Продаж (600р)": "sebes_sale",
+    "Прибыль на 1 Юбку": "profit_1",
+    "%Выкупа": "percent_sell",
+    "Прибыль": "profit",
+    "% Лог/Наша Цена": "percent_log_price",
+    "% СПП": "spp_percent",
+}
+FORM4_INT_FIELDS = {
+    "Чистые продажи, шт": "qentity_sale",
+    "Заказы": "orders",
+}
+
+# Колонки, которые читаются из файла (остальные не загружаются в память)
+FORM4_COLUMNS = [
+    "Код номенклатуры",
+    "Артикул поставщика",
+    *FORM4_FLOAT_FIELDS,
+    *FORM4_INT_FIELDS,
+]
+
+INVALID_CODES = {"", "0", "000", "000000000"}
+
+BULK_BATCH_SIZE = 1000
+
+
+def build_form4_records(df_input, user, file_date):
+    """
+    Строит объекты Form4Data из таблицы отчёта целиком по колонкам:
+    числа через pd.to_numeric(errors="coerce"), невалидные коды — маской.
+    Возвращает (список объектов, число пропущенных строк).
+    """
+    codes = df_input["Код номенклатуры"].astype(str).str.strip()
+    valid = df_input["Код номенклатуры"].notna() & ~codes.isin(INVALID_CODES)
+    df_valid = df_input[valid]
+
+    data = pd.DataFrame({"code": codes[valid]})
+
+    if "Артикул поставщика" in df_valid.columns:
+        articles = df_valid["Артикул поставщика"].astype(str).str.strip()
+        data["article"] = articles.where(
+            df_valid["Артикул поставщика"].notna() & (articles != ""), None
+        )
+    else:
+        data["article"] = None
+
+    for column, field in FORM4_FLOAT_FIELDS.items():
+        if column in df_valid.columns:
+            data[field] = pd.to_numeric(df_valid[column], errors="coerce")
+        else:
+            data[field] = np.nan
+
+    for column, field in FORM4_INT_FIELDS.items():
+        if column in df_valid.columns:
+            values = pd.to_numeric(df_valid[column], errors="coerce")
+            values = values.replace([np.inf, -np.inf], np.nan)
+            data[field] = np.trunc(values).astype("Int64")
+        else:
+            data[field] = pd.Series(pd.NA, index=data.index, dtype="Int64")
+
+    # NaN / NA → None, чтобы в БД попадал NULL
+    data = data.astype(object).where(data.notna(), None)
+
+    records = [
+        Form4Data(user=user, date=file_date, **row) for row in data.to_dict("records")
+    ]
+    return records, int((~valid).sum())
+
 
 @login_required
 def upload_file(request):
@@ -37,28 +118,39 @@ def upload_file(request):
         total_uploaded = 0
         total_skipped = 0
 
-        # ✅ Обрабатываем каждый файл
+        # Проверка расширения
+        xlsx_files = []
         for uploaded_file in uploaded_files:
-            print(f"📄 Обработка файла: {uploaded_file.name}")
-
-            # Проверка расширения
             if not uploaded_file.name.lower().endswith(".xlsx"):
                 messages.error(request, f"❌ {uploaded_file.name} — не .xlsx")
                 total_skipped += 1
                 continue
+            xlsx_files.append(uploaded_file)
+
+        # ✅ Разбираем все файлы сразу (параллельно, см. INGEST_WORKERS)
+        parsed_files = read_sheets(
+            xlsx_files,
+            sheet_name=0,
+            usecols=FORM4_COLUMNS,
+            dtype={"Код номенклатуры": str, "Артикул поставщика": str},
+        )
+
+        all_records = []
+        for uploaded_file, parsed in zip(xlsx_files, parsed_files):
+            print(f"📄 Обработка файла: {uploaded_file.name}")
 
-            try:
-                file_data = BytesIO(uploaded_file.read())
-                df_input = pd.read_excel(file_data, sheet_name=0).head(150)
-                print(f"   ✅ Прочитано строк: {len(df_input)}")
-            except Exception as e:
-                print(f"   ❌ Ошибка чтения: {e}")
+            if parsed.error is not None:
+                print(f"   ❌ Ошибка чтения: {parsed.error}")
                 messages.error(
-                    request, f"❌ Ошибка при чтении {uploaded_file.name}: {e}"
+                    request,
+                    f"❌ Ошибка при чтении {uploaded_file.name}: {parsed.error}",
                 )
                 total_skipped += 1
                 continue
 
+            df_input = parsed.df
+            print(f"   ✅ Прочитано строк: {len(df_input)} за {parsed.seconds:.2f} с")
+
             # Проверка обязательных колонок
             required_columns = ["Код номенклатуры"]
             missing_columns = [
@@ -82,68 +174,29 @@ def upload_file(request):
             )
             print(f"   📅 Извлечена дата: {file_date}")
 
-            # Подготовка записей
-            new_records = []
-            for idx, row in df_input.iterrows():
-                code = str(row["Код номенклатуры"]).strip()
-                if not code or code in {"0", "000", "000000000"}:
-                    print(f"   ⚠️ Пропущен код: '{code}' (строка {idx})")
-                    continue
-
-                # Логируем первую валидную строку
-                if len(new_records) == 0:
-                    article_sample = row.get("Артикул поставщика", "")
-                    print(
-                        f"   ✅ Первый валидный код: {code}, Артикул: {article_sample}"
-                    )
-
-                article = str(row.get("Артикул поставщика", "")).strip() or None
-
-                def safe_float(val):
-                    try:
-                        return float(val) if pd.notna(val) else None
-                    except:
-                        return None
-
-                def safe_int(val):
-                    try:
-                        return int(val) if pd.notna(val) else None
-                    except:
-                        return None
-
-                new_records.append(
-                    Form4Data(
-                        user=request.user,
-                        code=code,
-                        article=article,
-                        date=file_date,
-                        clear_sales_our=safe_float(row.get("Чистые продажи Наши")),
-                        clear_sales_vb=safe_float(row.get("Чистая реализация ВБ")),
-                        clear_transfer=safe_float(row.get("Чистое Перечисление")),
-                        clear_transfer_without_log=safe_float(
-                            row.get("Чистое Перечисление без Логистики")
-                        ),
-                        our_price_mid=safe_float(row.get("Наша цена Средняя")),
-                        vb_selling_mid=safe_float(row.get("Реализация ВБ Средняя")),
-                        transfer_mid=safe_float(row.get("К перечислению Среднее")),
-                        transfer_without_log_mid=safe_float(
-                            row.get("К Перечислению без Логистики Средняя")
-                        ),
-                        qentity_sale=safe_int(row.get("Чистые продажи, шт")),
-                        sebes_sale=safe_float(row.get("Себес Продаж (600р)")),
-                        profit_1=safe_float(row.get("Прибыль на 1 Юбку")),
-                        percent_sell=safe_float(row.get("%Выкупа")),
-                        profit=safe_float(row.get("Прибыль")),
-                        orders=safe_int(row.get("Заказы")),
-                        percent_log_price=safe_float(row.get("% Лог/Наша Цена")),
-                        spp_percent=safe_float(row.get("% СПП")),
-                    )
+            # Подготовка записей (по колонкам, без iterrows)
+            new_records, skipped_rows = build_form4_records(
+                df_input, request.user, file_date
+            )
+            if skipped_rows:
+                print(f"   ⚠️ Пропущено строк с пустым/нулевым кодом: {skipped_rows}")
+            if new_records:
+                print(
+                    f"   ✅ Первый валидный код: {new_records[0].code}, Артикул: {new_records[0].article}"
                 )
+            all_records.extend(new_records)
 
-            # Сохраняем в БД
-            created = Form4Data.objects.bulk_create(new_records, ignore_conflicts=True)
-            print(f"   ✅ Сохранено записей: {len(created)}")
-            total_uploaded += len(created)
+        # Сохраняем записи всех файлов одной транзакцией
+        with transaction.atomic():
+            created = Form4Data.objects.bulk_create(
+                all_records, ignore_conflicts=True, batch_size=BULK_BATCH_SIZE
+            )
+        print(f"   ✅ Сохранено записей: {len(created)}")
+        total_uploaded += len(created)
+
+        parse_times = format_parse_times(parsed_files)
+        if parse_times:
+            messages.info(request, f"⏱ Время разбора: {parse_times}")
 
         # 📢 Итоговые сообщения
         if total_uploaded:
@@ -173,6 +226,13 @@ def form4_list(request):
     # ✅ Получаем объекты, сортируем: сначала по коду, потом свежие данные сверху
     queryset = Form4Data.objects.filter(user=request.user).order_by("code", "-date")
 
+    # Поиск по коду и артикулу — в БД, затем вся история найденных кодов,
+    # чтобы у кода показывался его последний артикул
+    query = request.GET.get("q", "").strip()
+    if query:
+        codes = search(Form4Data.objects.filter(user=request.user), query)
+        queryset = queryset.filter(code__in=codes.values("code"))
+
     seen_codes = {}
     for item in queryset:
         if item.code not in seen_codes:
@@ -210,6 +270,7 @@ def form4_list(request):
         {
             "codes_with_articles": codes_with_articles,
             "available_dates": dates_list,  # Добавляем даты в контекст
+            "query": query,
         },
     )
 
@@ -5,23 +5,53 @@ from django.shortcuts import render, HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
 from forms_app.models import StockRecord
+from forms_app.search import search
 import os
 from django.shortcuts import render, redirect
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.urls import reverse
 from urllib.parse import urlencode
 
+PREVIEW_PAGE_SIZE = 20
+PREVIEW_FIELDS = ("id", "article_full_name", "size", "quantity", "location", "note")
+
+
+def keyset_page(records, after=None, before=None, size=PREVIEW_PAGE_SIZE):
+    """
+    Страница по id без OFFSET: after — id последней строки предыдущей страницы,
+    before — id первой строки следующей. Возвращает (строки, есть ли
+    предыдущая страница, есть ли следующая).
+    """
+    if before is not None:
+        rows = list(records.filter(id__lt=before).order_by("-id")[: size + 1])
+        if rows:
+            return rows[:size][::-1], len(rows) > size, True
+        # Строки до before удалены — показываем первую страницу
+        after = None
+
+    if after is not None:
+        records = records.filter(id__gt=after)
+    rows = list(records.order_by("id")[: size + 1])
+    return rows[:size], after is not None, len(rows) > size
+
+
+def _int_param(request, name):
+    value = request.GET.get(name, "")
+    return int(value) if value.isdigit() else None
+
 
 @login_required
 def preview_sql(request):
     """
-    Представление: предпросмотр текущих остатков через SQL с пагинацией
+    Представление: предпросмотр текущих остатков через SQL с пагинацией.
+    Поиск и пагинация выполняются в БД, читается только одна страница строк.
     """
     user = request.user
-    records = StockRecord.objects.filter(user=user).values(
-        "article_full_name", "size", "quantity", "location", "note"
-    )
+    records = StockRecord.objects.filter(user=user)
 
     if not records.exists():
         return render(
@@ -30,52 +60,26 @@ def preview_sql(request):
             {"error": "❌ Нет данных остатков для отображения"},
         )
 
-    df = pd.DataFrame(records)
-    df.rename(
-        columns={
-            "article_full_name": "Артикул поставщика",
-            "size": "Размер",
-            "quantity": "Количество",
-            "location": "Место",
-            "note": "Примечание",
-        },
-        inplace=True,
-    )
-
-    query = request.GET.get("q")
+    query = request.GET.get("q", "")
     if query:
-        df = df[
-            df.astype(str)
-            .apply(lambda row: row.str.contains(query, case=False, na=False))
-            .any(axis=1)
-        ]
-
-    # Пагинация
-    paginator = Paginator(
-        df.to_dict(orient="records"), per_page=20
-    )  # 20 записей на странице
-    page_number = request.GET.get("page")
-
-    try:
-        page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+        records = search(records, query)
 
-    updated_df = pd.DataFrame(page_obj.object_list)
-    table_html = updated_df.to_html(
-        classes="table table-bordered table-striped", index=False
+    rows, has_previous, has_next = keyset_page(
+        records.values(*PREVIEW_FIELDS),
+        after=_int_param(request, "after"),
+        before=_int_param(request, "before"),
     )
 
     return render(
         request,
         "forms_app/preview_sql.html",
         {
-            "table": table_html,
-            "query": query or "",
-            "page_obj": page_obj,
-            "is_paginated": True,
+            "rows": rows,
+            "query": query,
+            "has_previous": bool(rows) and has_previous,
+            "has_next": bool(rows) and has_next,
+            "first_id": rows[0]["id"] if rows else None,
+            "last_id": rows[-1]["id"] if rows else None,
         },
     )
 
@@ -89,16 +93,10 @@ def editable_preview_sql(request):
     records = StockRecord.objects.filter(user=user)
 
     if query:
-        from django.db.models import Q
+        records = search(records, query, ["article_full_name", "size", "location"])
 
-        records = records.filter(
-            Q(article_full_name__icontains=query)
-            | Q(size__icontains=query)
-            | Q(location__icontains=query)
-        )
-
-    # Пагинация
-    paginator = Paginator(records.values(), 20)  # 20 записей на странице
+    # Пагинация (стабильный порядок — страница сохраняется по своим строкам)
+    paginator = Paginator(records.order_by("id").values(), 20)  # 20 записей на странице
     page_number = request.GET.get("page")
 
     try:
@@ -124,34 +122,75 @@ def editable_preview_sql(request):
 @login_required
 def save_stock_sql(request):
     """
-    Представление: сохраняет редактированные данные обратно в SQL
+    Представление: сохраняет изменённые строки страницы редактирования в SQL.
+
+    Форма присылает только строки своей страницы (поле row и version_<id>),
+    скрипт шаблона отключает строки без изменений. Строка обновляется, только
+    если её значения отличаются от показанных и версия не менялась с момента
+    открытия страницы; иначе правка пропускается с предупреждением. Строки,
+    которых уже нет (остатки перезагружены), тоже считаются конфликтом.
     """
     user = request.user
-    records = StockRecord.objects.filter(user=user)
-
-    if not records.exists():
-        raise PermissionDenied("❌ Нет записей для сохранения")
-
-    updated_records = []
-    for record in records:
-        quantity_key = f"quantity_{record.id}"
-        location_key = f"location_{record.id}"
-        note_key = f"note_{record.id}"
-
-        try:
-            new_quantity = int(request.POST.get(quantity_key, record.quantity))
-        except ValueError:
-            new_quantity = record.quantity
-
-        new_location = request.POST.get(location_key, record.location or "")
-        new_note = request.POST.get(note_key, record.note or "")
-
-        record.quantity = new_quantity
-        record.location = new_location
-        record.note = new_note
-        updated_records.append(record)
-
-    StockRecord.objects.bulk_update(updated_records, ["quantity", "location", "note"])
+    row_ids = [int(pk) for pk in request.POST.getlist("row") if pk.isdigit()]
+
+    saved = 0
+    conflicts = []
+    with transaction.atomic():
+        records = list(StockRecord.objects.filter(user=user, pk__in=row_ids))
+        # Остатки перезагрузили (форма 6, замена, сброс) — строк с этими id нет
+        found = {record.pk for record in records}
+        missing = [pk for pk in dict.fromkeys(row_ids) if pk not in found]
+        for record in records:
+            try:
+                new_quantity = int(
+                    request.POST.get(f"quantity_{record.id}", record.quantity)
+                )
+            except ValueError:
+                new_quantity = record.quantity
+            # Как в шаблоне: пустое место показано как «Не указано»
+            shown_location = record.location or "Не указано"
+            new_location = request.POST.get(f"location_{record.id}", shown_location)
+            new_note = request.POST.get(f"note_{record.id}", record.note or "")
+
+            if (new_quantity, new_location, new_note) == (
+                record.quantity,
+                shown_location,
+                record.note or "",
+            ):
+                continue
+
+            try:
+                version = int(request.POST.get(f"version_{record.id}", ""))
+            except ValueError:
+                version = record.version
+            updated = StockRecord.objects.filter(pk=record.pk, version=version).update(
+                quantity=new_quantity,
+                location=new_location,
+                note=new_note,
+                version=F("version") + 1,
+            )
+            if updated:
+                saved += 1
+            else:
+                conflicts.append(f"{record.article_full_name} ({record.size})")
+
+    if saved:
+        messages.success(request, f"✅ Сохранено строк: {saved}")
+    if conflicts:
+        messages.warning(
+            request,
+            "⚠️ Эти строки изменились после открытия страницы и не сохранены, "
+            "проверьте их и повторите правку: " + ", ".join(conflicts),
+        )
+    if missing:
+        messages.warning(
+            request,
+            "⚠️ Строки удалены или заменены после открытия страницы, правки в них "
+            "не сохранены — обновите страницу: "
+            + ", ".join(f"№{pk}" for pk in missing),
+        )
+    if not saved and not conflicts and not missing:
+        messages.info(request, "ℹ️ Изменений нет")
 
     # --- ✅ Сначала получаем параметры ---
     query = request.POST.get("q", "")  # из скрытого поля
@@ -8,18 +8,21 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from io import BytesIO
 from forms_app.models import StockRecord
+from forms_app.ingest import read_sheet
 
 
-def extract_first_3(article):
-    """Возвращает первые 3 символа артикула"""
-    return str(article)[:3]
+def extract_first_3(articles):
+    """Возвращает первые 3 символа каждого артикула (Series)"""
+    return articles.astype(str).str[:3]
 
 
 def prepare_df(df):
     """Подготавливает DataFrame к обработке"""
     # Удаляем .0 у размеров (например, 46.0 → 46)
     if "Размер" in df.columns:
-        df["Размер"] = df["Размер"].astype(str).str.replace(r"\.0$", "", regex=True)
+        # Различных размеров немного — чистим их, а не каждую строку
+        codes, sizes = pd.factorize(df["Размер"].astype(str))
+        df["Размер"] = sizes.str.replace(r"\.0$", "", regex=True)[codes]
 
     # Если колонок нет — создаём их
     for col in ["Место", "Примечание"]:
@@ -28,22 +31,22 @@ def prepare_df(df):
 
     # Группировка по первым 3 символам артикула + размер
     if "Артикул поставщика" in df.columns:
-        df["Группа артикула"] = df["Артикул поставщика"].apply(extract_first_3)
+        df["Группа артикула"] = extract_first_3(df["Артикул поставщика"])
     else:
         df["Группа артикула"] = ""
 
     # Группируем данные
     if not df.empty and "Количество" in df.columns:
+        # "first" берёт первое непустое значение группы; пустые группы → ""
         grouped = df.groupby(["Группа артикула", "Размер"], as_index=False).agg(
             {
                 "Артикул поставщика": "first",
-                "Место": lambda x: x.dropna().iloc[0] if not x.isna().all() else "",
-                "Примечание": lambda x: (
-                    x.dropna().iloc[0] if not x.isna().all() else ""
-                ),
+                "Место": "first",
+                "Примечание": "first",
                 "Количество": "sum",
             }
         )
+        grouped[["Место", "Примечание"]] = grouped[["Место", "Примечание"]].fillna("")
     else:
         grouped = pd.DataFrame(
             columns=[
@@ -81,7 +84,7 @@ def form6(request):
 
         if input_stock:
             try:
-                df_stock_raw = pd.read_excel(BytesIO(input_stock.read()), sheet_name=0)
+                df_stock_raw = read_sheet(BytesIO(input_stock.read()), sheet_name=0)
 
                 if "Артикул" in df_stock_raw.columns:
                     df_stock_raw.rename(
@@ -129,7 +132,7 @@ def form6(request):
         df_input1 = pd.DataFrame()
         if input1:
             try:
-                df_raw = pd.read_excel(BytesIO(input1.read()), sheet_name=0)
+                df_raw = read_sheet(BytesIO(input1.read()), sheet_name=0)
                 df_raw.rename(
                     columns={"Артикул продавца": "Артикул поставщика"},
                     inplace=True,
@@ -149,7 +152,7 @@ def form6(request):
         df_input2 = pd.DataFrame()
         if input2:
             try:
-                df_raw = pd.read_excel(BytesIO(input2.read()), sheet_name=0)
+                df_raw = read_sheet(BytesIO(input2.read()), sheet_name=0)
                 df_raw.rename(
                     columns={"Артикул продавца": "Артикул поставщика"},
                     inplace=True,
@@ -181,7 +184,7 @@ def form6(request):
         df_input3 = pd.DataFrame()
         if input3:
             try:
-                df_raw = pd.read_excel(BytesIO(input3.read()), sheet_name=0)
+                df_raw = read_sheet(BytesIO(input3.read()), sheet_name=0)
                 df_raw.rename(
                     columns={"Артикул продавца": "Артикул поставщика"},
                     inplace=True,
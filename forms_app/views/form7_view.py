@@ -6,6 +6,7 @@ from plotly.utils import PlotlyJSONEncoder
 from django.shortcuts import render
 from django.core.files.storage import default_storage
 from ..models import WeeklyReport
+from ..ingest import read_sheet, sheet_names
 from django.shortcuts import redirect
 from django.contrib import messages
 from io import BytesIO
@@ -39,15 +40,14 @@ def form7_upload(request):
             full_path = default_storage.path(file_path)
 
             # Чтение Excel
-            xls = pd.ExcelFile(full_path)
-            if "Основные данные" not in xls.sheet_names:
+            if "Основные данные" not in sheet_names(full_path):
                 return render(
                     request,
                     "forms_app/form7/upload.html",
                     {"error": 'Лист "Основные данные" не найден'},
                 )
 
-            df = pd.read_excel(xls, sheet_name="Основные данные")
+            df = read_sheet(full_path, sheet_name="Основные данные")
 
             # Поиск нужных колонок
             art_col = [
@@ -7,9 +7,11 @@ from datetime import datetime
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 
 from ..forms import Form8UploadForm
 from ..models import Form8Report
+from ..ingest import read_sheets, format_parse_times
 
 
 @login_required
@@ -22,10 +24,14 @@ def form8_upload(request):
             messages.error(request, "❌ Не выбрано ни одного файла.")
             form = Form8UploadForm()
         else:
-            success_count = 0
-            for f in files:
+            # Разбираем все файлы сразу (параллельно, см. INGEST_WORKERS)
+            parsed_files = read_sheets(files)
+            reports = []
+            for f, parsed in zip(files, parsed_files):
                 try:
-                    df = pd.read_excel(f)
+                    if parsed.error is not None:
+                        raise parsed.error
+                    df = parsed.df
 
                     required_cols = [
                         "Прибыль",
@@ -106,29 +112,41 @@ def form8_upload(request):
 
                     week_name = filename.replace(".xlsx", "")
 
-                    Form8Report.objects.update_or_create(
-                        user=request.user,
-                        week_name=week_name,
-                        defaults={
-                            "date_extracted": date_extracted,
-                            "profit": profit if pd.notna(profit) else None,
-                            "clean_sales_ours": (
-                                clean_sales if pd.notna(clean_sales) else None
-                            ),
-                            "clean_transfer_without_logistics": (  # ← ДОБАВЬТЕ
-                                clean_transfer if pd.notna(clean_transfer) else None
-                            ),
-                            "spp_percent": spp,
-                            "avg_price": avg_price,
-                            "profit_per_skirt": profit_per_skirt,
-                            "orders": orders,
-                            "pickup_rate": pickup_rate,
-                        },
+                    reports.append(
+                        (
+                            week_name,
+                            {
+                                "date_extracted": date_extracted,
+                                "profit": profit if pd.notna(profit) else None,
+                                "clean_sales_ours": (
+                                    clean_sales if pd.notna(clean_sales) else None
+                                ),
+                                "clean_transfer_without_logistics": (  # ← ДОБАВЬТЕ
+                                    clean_transfer if pd.notna(clean_transfer) else None
+                                ),
+                                "spp_percent": spp,
+                                "avg_price": avg_price,
+                                "profit_per_skirt": profit_per_skirt,
+                                "orders": orders,
+                                "pickup_rate": pickup_rate,
+                            },
+                        )
                     )
-                    success_count += 1
                 except Exception as e:
                     messages.error(request, f"Ошибка при обработке {f.name}: {e}")
 
+            # Все недели — одной транзакцией
+            with transaction.atomic():
+                for week_name, defaults in reports:
+                    Form8Report.objects.update_or_create(
+                        user=request.user, week_name=week_name, defaults=defaults
+                    )
+            success_count = len(reports)
+
+            parse_times = format_parse_times(parsed_files)
+            if parse_times:
+                messages.info(request, f"⏱ Время разбора: {parse_times}")
+
             if success_count > 0:
                 messages.success(
                     request, f"✅ Успешно обработано: {success_count} файлов"
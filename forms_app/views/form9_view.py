@@ -8,6 +8,7 @@ from django.contrib import messages
 from io import BytesIO
 from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
 from openpyxl.utils import get_column_letter
+from forms_app.ingest import read_sheet
 
 
 def form9_view(request):
@@ -26,7 +27,7 @@ def form9_view(request):
         try:
             # === ЧИТАЕМ ФАЙЛ В ПАМЯТИ ===
             file_data = uploaded_file.read()
-            df_raw = pd.read_excel(BytesIO(file_data), header=1)
+            df_raw = read_sheet(BytesIO(file_data), header=1)
             df_raw = df_raw.reset_index(drop=True)
 
             # Убедимся, что числовые колонки корректны
@@ -9,6 +9,7 @@ from .models import StockRecord
 import pandas as pd
 import os
 from io import BytesIO
+from forms_app.ingest import read_sheet
 
 
 @login_required
@@ -28,7 +29,7 @@ def replace_sql_stock(request):
 
         try:
             # Чтение файла
-            df = pd.read_excel(BytesIO(uploaded_file.read()))
+            df = read_sheet(BytesIO(uploaded_file.read()))
 
             # Проверка наличия нужных колонок
             required_columns = [
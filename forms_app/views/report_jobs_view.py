@@ -0,0 +1,92 @@
+# forms_app/views/report_jobs_view.py
+
+from django.contrib import messages
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+
+from forms_app import jobs
+from forms_app.models import ReportJob
+
+
+def submit_report_job(request, kind, params=None, files=None, on_error=None):
+    """
+    Запускает отчёт: в фоне (страница ожидания) или сразу, если
+    REPORT_JOBS_ASYNC = False. on_error(текст) — ответ при ошибке в
+    синхронном режиме; по умолчанию сообщение и возврат на форму.
+    """
+    job = jobs.enqueue(kind, request.user, params=params, files=files)
+    jobs.remember_in_session(request, job)
+    if jobs.is_async():
+        return redirect("forms_app:report_job", job_id=job.pk)
+
+    jobs.claim(job, jobs.worker_name())
+    jobs.run_job(job)
+    if job.status != ReportJob.STATUS_DONE:
+        if on_error is not None:
+            return on_error(job.error)
+        messages.error(request, f"❌ {job.error}")
+        return redirect(jobs.JOB_KINDS[kind].back_url)
+    for note in job.notes:
+        messages.warning(request, note)
+    return _download_response(job)
+
+
+def _get_job(request, job_id):
+    job = get_object_or_404(ReportJob, pk=job_id)
+    owner = request.user.pk if request.user.is_authenticated else None
+    if job.user_id != owner:
+        raise Http404("Задача не найдена")
+    return job
+
+
+def _download_response(job):
+    response = FileResponse(
+        job.result_file.open("rb"),
+        as_attachment=True,
+        filename=job.result_name,
+        content_type=job.content_type or "application/octet-stream",
+    )
+    response["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+    return response
+
+
+def report_job(request, job_id):
+    """Страница ожидания: опрашивает статус и скачивает готовый файл"""
+    job = _get_job(request, job_id)
+    kind = jobs.JOB_KINDS.get(job.kind)
+    context = {
+        "job": job,
+        "title": kind.title if kind else job.kind,
+        "back_url": reverse(kind.back_url) if kind else "/",
+        "status_url": reverse("forms_app:report_job_status", args=[job.pk]),
+    }
+    return render(request, "forms_app/report_job.html", context)
+
+
+def report_job_status(request, job_id):
+    """JSON-статус задачи для опроса из браузера"""
+    job = _get_job(request, job_id)
+    data = {
+        "id": str(job.pk),
+        "kind": job.kind,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "progress": job.progress,
+        "stage": job.stage,
+        "notes": job.notes,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "download_url": None,
+    }
+    if job.status == ReportJob.STATUS_DONE and job.result_file:
+        data["download_url"] = reverse("forms_app:report_job_download", args=[job.pk])
+    return JsonResponse(data)
+
+
+def report_job_download(request, job_id):
+    job = _get_job(request, job_id)
+    if job.status != ReportJob.STATUS_DONE or not job.result_file:
+        raise Http404("Отчёт ещё не готов")
+    return _download_response(job)
@@ -2,7 +2,7 @@
 
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from forms_app.models import UserReport
+from forms_app.models import StockBalance, UserReport
 import os
 from datetime import datetime
 from django.utils import timezone
@@ -21,14 +21,16 @@ def my_reports(request):
     # === Форма 5: остатки ===
     form5_report = UserReport.objects.filter(user=user, report_type="form5").first()
 
-    # === Проверка наличия файла формы 5 ===
+    # === Остатки формы 5 (журнал в БД; файл — только кэш выгрузки) ===
+    stock_exists = StockBalance.objects.filter(user=user).exists()
+    last_updated = form5_report.last_updated if stock_exists and form5_report else None
+
+    # Старый output_stock.xlsx, ещё не перенесённый в БД
     stock_path = os.path.join(
         settings.MEDIA_ROOT, "user_stock", str(user.id), "output_stock.xlsx"
     )
-    stock_exists = os.path.exists(stock_path)
-
-    last_updated = None
-    if stock_exists:
+    if not stock_exists and os.path.exists(stock_path):
+        stock_exists = True
         try:
             last_updated = datetime.fromtimestamp(os.path.getmtime(stock_path))
         except Exception as e:
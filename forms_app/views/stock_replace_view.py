@@ -1,32 +1,21 @@
 # stock_replace_view.py
 
-import os
-import pandas as pd
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from forms_app.models import StockRecord
-from django.core.exceptions import PermissionDenied
-from django.conf import settings
+from forms_app.models import StockBalance, StockRecord
 from django.contrib import messages
-from forms_app.models import UserReport
 from io import BytesIO
+from forms_app import stock_ledger
+from forms_app.ingest import read_sheet
+from forms_app.views.form5_view import group_articles, import_legacy_stock, prepare_df
 
 
 @login_required
 def replace_stock(request):
     """
-    Представление для полной замены output_stock.xlsx новым файлом.
+    Полная замена остатков Формы 5 новым файлом.
     Пользователь загружает файл через форму с кнопкой "replace_stock"
     """
-
-    user_id = request.user.id
-    base_dir = os.path.join("user_stock", str(user_id))
-    output_path = os.path.join(base_dir, "output_stock.xlsx")
-    full_output_path = os.path.join(settings.MEDIA_ROOT, output_path)
-
-    # Создаем папку пользователя, если её нет
-    os.makedirs(os.path.dirname(full_output_path), exist_ok=True)
-
     if request.method == "POST":
         replace_file = request.FILES.get("replace_stock")
 
@@ -35,34 +24,13 @@ def replace_stock(request):
             return redirect("forms_app:form5")
 
         try:
-            print(f"🔄 Начинаем замену файла: {full_output_path}")
-
-            # Временный путь для безопасного сохранения
-            temp_path = full_output_path + ".tmp"
-
-            # Сохраняем загруженный файл во временный путь
-            with open(temp_path, "wb+") as destination:
-                for chunk in BytesIO(replace_file.read()):
-                    destination.write(chunk)
-
-            # Удаляем старый файл, если он существует
-            if os.path.exists(full_output_path):
-                os.remove(full_output_path)
-                print("🗑️ Старый файл удален")
-
-            # Переименовываем временный файл в основной
-            os.rename(temp_path, full_output_path)
-            print("✅ Файл успешно заменён")
-
-            # Обновляем запись в БД (если нужно)
-            UserReport.objects.update_or_create(
-                user=request.user,
-                file_name="output_stock.xlsx",
-                defaults={
-                    "file_path": output_path,
-                    "report_type": "form5",
-                },
+            print(f"🔄 Начинаем замену остатков пользователя {request.user.id}")
+
+            df_raw = read_sheet(BytesIO(replace_file.read()))
+            changed = stock_ledger.replace_balances(
+                request.user, prepare_df(df_raw), group_articles([df_raw])
             )
+            print(f"✅ Остатки заменены, изменено позиций: {changed}")
 
             # Перенаправляем обратно на форму 5 с сообщением об успехе
             messages.success(request, "✅ Файл остатков успешно заменён")
@@ -81,27 +49,19 @@ def replace_stock(request):
 @login_required
 def preview_output_stock(request):
     """
-    Представление для предпросмотра текущего файла output_stock.xlsx с поддержкой поиска
+    Предпросмотр текущих остатков Формы 5 с поддержкой поиска
     """
+    import_legacy_stock(request.user)
 
-    user_id = request.user.id
-    base_dir = os.path.join("user_stock", str(user_id))
-    full_output_path = os.path.join(settings.MEDIA_ROOT, base_dir, "output_stock.xlsx")
-
-    if not os.path.exists(full_output_path):
+    if not StockBalance.objects.filter(user=request.user).exists():
         return render(
             request,
             "forms_app/preview.html",
-            {"error": "❌ Файл output_stock.xlsx не найден для этого пользователя"},
+            {"error": "❌ Остатки не найдены для этого пользователя"},
         )
 
     try:
-        # Чтение файла
-        df = pd.read_excel(full_output_path)
-
-        # Убираем лишние колонки
-        if "Полный артикул" in df.columns:
-            df = df.drop(columns=["Полный артикул"])
+        df = stock_ledger.balances_frame(request.user)
 
         # Поиск по запросу
         query = request.GET.get("q")
@@ -125,11 +85,11 @@ def preview_output_stock(request):
         )
 
     except Exception as e:
-        print(f"❌ Ошибка при чтении файла: {e}")
+        print(f"❌ Ошибка при чтении остатков: {e}")
         return render(
             request,
             "forms_app/preview.html",
-            {"error": f"Ошибка при чтении файла: {e}"},
+            {"error": f"Ошибка при чтении остатков: {e}"},
         )
 
 
@@ -147,7 +107,7 @@ def replace_sql_stock(request):
             return redirect("forms_app:editable_preview_sql")
 
         try:
-            df = pd.read_excel(BytesIO(uploaded_file.read()))
+            df = read_sheet(BytesIO(uploaded_file.read()))
 
             required_columns = [
                 "Артикул поставщика",
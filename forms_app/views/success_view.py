@@ -3,7 +3,7 @@
 from django.shortcuts import render, HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from forms_app.models import UserReport
+from forms_app.models import StockBalance, UserReport
 import os
 from django.conf import settings
 
@@ -50,22 +50,19 @@ def download_form4_file(request):
 @login_required
 def download_current_file(request):
     """
-    Скачивание файла формы 5: output_stock.xlsx
+    Скачивание файла формы 5: output_stock.xlsx (собирается из остатков в БД)
     """
-    try:
-        report = UserReport.objects.get(user=request.user, report_type="form5")
-        file_path = os.path.join(settings.MEDIA_ROOT, report.file_path)
-
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Файл {file_path} не найден")
-
-        with open(file_path, "rb") as fh:
-            response = HttpResponse(
-                fh.read(),
-                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
-            response["Content-Disposition"] = 'attachment; filename="output_stock.xlsx"'
-            return response
+    # Модули формы 5 тянут pandas — импортируем только при скачивании
+    from forms_app import stock_ledger
+    from forms_app.views.form5_view import import_legacy_stock
 
-    except (UserReport.DoesNotExist, FileNotFoundError) as e:
+    import_legacy_stock(request.user)
+    if not StockBalance.objects.filter(user=request.user).exists():
         raise PermissionDenied("❌ Файл остатков не найден.")
+
+    response = HttpResponse(
+        stock_ledger.stock_xlsx(request.user),
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+    response["Content-Disposition"] = 'attachment; filename="output_stock.xlsx"'
+    return response
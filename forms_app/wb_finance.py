@@ -0,0 +1,416 @@
+# forms_app/wb_finance.py
+"""
+Финансовый расчёт по детализации Wildberries — общий для форм 2 и 18.
+
+Обе формы считают одно и то же: суммы и средние по коду номенклатуры,
+возвраты, события логистики, себестоимость продаж, маржу, налоги и прибыль
+с учётом дополнительных удержаний. Различается только себестоимость: в
+форме 2 она одна на все артикулы, в форме 18 берётся из ArticleCost
+пользователя (cost_map), а для остальных артикулов — общее значение.
+
+Расчёт векторный: числа разбираются pd.to_numeric, события логистики
+считаются pd.crosstab, производные показатели — арифметикой столбцов.
+Формы сами выбирают колонки, листы и категории артикулов для Excel.
+
+Расчёт разделён на две части. aggregate_report сводит загруженный отчёт по
+кодам номенклатуры — это дорого и от параметров не зависит. apply_parameters
+добавляет себестоимость, налоги и прибыль за миллисекунды. Агрегаты последней
+загрузки хранятся в дисковом кэше (см. ingest_cache), поэтому пересчёт с
+другой себестоимостью или налогом не требует повторной загрузки файла.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from forms_app import ingest_cache, jobs
+from forms_app.models import ReportJob
+
+CODE = "Код номенклатуры"
+ARTICLE = "Артикул поставщика"
+PRICE = "Цена розничная"
+WB_SALE = "Вайлдберриз реализовал Товар (Пр)"
+PAYOUT = "К перечислению Продавцу за реализованный Товар"
+DELIVERY = "Услуги по доставке товара покупателю"
+ACCEPTANCE = "Операции на приемке"
+
+NUMERIC_COLUMNS = [PRICE, WB_SALE, PAYOUT, DELIVERY]
+
+RETURN_COLUMNS = {
+    PRICE: "Возвраты Наша цена",
+    WB_SALE: "Возвраты реализация ВБ",
+    PAYOUT: "Возвраты к перечислению",
+}
+
+SALE_EVENT = "К клиенту при продаже"
+RETURN_EVENT = "От клиента при возврате"
+CANCEL_EVENT = "От клиента при отмене"
+LOGISTICS_EVENTS = [SALE_EVENT, RETURN_EVENT, CANCEL_EVENT]
+
+DEDUCTION_COLUMNS = ["Общая сумма штрафов", "Хранение", "Удержания", ACCEPTANCE]
+
+# Итоговые названия колонок отчёта
+FINAL_NAMES = {
+    PRICE: "Сумма Продаж Наша Цена",
+    WB_SALE: "Сумма Продаж по цене ВБ",
+    PAYOUT: "Сумма Продаж Перечисление С Лог",
+    DELIVERY: "Логистика",
+    RETURN_EVENT: "Возвраты, шт",
+    CANCEL_EVENT: "Отмена",
+    f"{PRICE}_Среднее": "Наша цена Средняя",
+    f"{WB_SALE}_Среднее": "Реализация ВБ Средняя",
+    f"{PAYOUT}_Среднее": "К перечислению Среднее",
+    f"{DELIVERY}_Среднее": "Логистика Средняя",
+}
+
+PROFIT_GROUPS = [
+    "1. >10 000",
+    "2. 5 000 - 10 000",
+    "3. 0 - 5 000",
+    "4. <0 (убытки)",
+]
+
+# Меняется при изменении состава ReportAggregates
+AGGREGATES_VERSION = 1
+
+FinancialReport = namedtuple("FinancialReport", ["table", "deductions"])
+ReportAggregates = namedtuple(
+    "ReportAggregates", ["table", "deductions", "has_logistics"]
+)
+
+
+def to_float(values):
+    """Числа с плавающей точкой; нечисловые значения → 0.0, пустые остаются NaN"""
+    numbers = pd.to_numeric(values, errors="coerce")
+    return numbers.mask(numbers.isna() & values.notna(), 0.0).astype(float)
+
+
+def to_int(values):
+    """Целые числа с отбрасыванием дробной части; пустые и нечисловые → 0"""
+    return pd.to_numeric(values, errors="coerce").fillna(0).astype(int)
+
+
+def percent(part, whole):
+    """part / whole * 100 с точностью 0.1; при whole == 0 — 0"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.Series(
+            np.where(whole == 0, 0, part / whole * 100), index=part.index
+        ).round(1)
+
+
+def nonzero_mean(values, codes):
+    """
+    Среднее ненулевых значений по коду с точностью 0.1. Код без ненулевых
+    значений даёт 0, если у него нет пропусков, иначе — NaN.
+    """
+    nonzero = values != 0
+    means = group_mean(values[nonzero], codes[nonzero])
+    means = means.reindex(values.groupby(codes).size().index)
+    has_missing = values.isna().groupby(codes).any()
+    return round_like_python(means.mask(means.isna() & ~has_missing, 0.0), 1)
+
+
+def group_mean(values, codes):
+    """
+    Среднее по коду, посчитанное как Series.mean() каждой группы отдельно
+    (сумма numpy, пропуски — нулями в сумме). groupby().mean() суммирует
+    иначе, последние биты среднего расходятся, и после округления до 0.1
+    «половинки» уходили в другую сторону, чем в прежнем отчёте.
+    """
+    keys, uniques = pd.factorize(codes, sort=True)
+    order = np.argsort(keys, kind="stable")
+    keys, data = keys[order], values.to_numpy(dtype=float)[order]
+    data, keys = data[keys >= 0], keys[keys >= 0]  # без пустого кода, как groupby
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])[: len(keys)]
+    ends = np.r_[starts[1:], len(keys)]
+    filled, valid = np.nan_to_num(data, nan=0.0), ~np.isnan(data)
+    means = [
+        filled[start:end].sum() / count if (count := valid[start:end].sum()) else np.nan
+        for start, end in zip(starts, ends)
+    ]
+    return pd.Series(
+        means, index=uniques[keys[starts]], dtype=float, name=values.name
+    ).rename_axis(codes.name)
+
+
+def round_like_python(values, decimals):
+    """
+    Округление встроенным round(), как в прежнем расчёте средних: Series.round
+    умножает на 10**decimals и округляет к чётному, поэтому на «половинках»
+    (например, 2.675) расходится с round() на одну единицу последнего знака.
+    """
+    return values.map(lambda value: round(value, decimals))
+
+
+def logistics_counts(df, log_col):
+    """Число событий логистики каждого вида по коду номенклатуры"""
+    events = df[[CODE, log_col]].explode(log_col)
+    counts = pd.crosstab(events[CODE], events[log_col].fillna("Не указано"))
+    return counts.reindex(columns=LOGISTICS_EVENTS, fill_value=0).astype(float)
+
+
+def aggregate_report(df):
+    """
+    Сводит детализацию по кодам номенклатуры: суммы, возвраты, средние и
+    события логистики, а также суммы дополнительных удержаний. Всё, что не
+    зависит от себестоимости и налога. Возвращает ReportAggregates.
+    """
+    if "Платная приемка" in df.columns and ACCEPTANCE not in df.columns:
+        df = df.rename(columns={"Платная приемка": ACCEPTANCE})
+    df = df.assign(
+        **{col: to_float(df[col]) for col in NUMERIC_COLUMNS if col in df.columns}
+    )
+    by_code = df.groupby(CODE)
+
+    # Суммы по коду номенклатуры (без кода 0)
+    table = (
+        by_code.agg({ARTICLE: "first", **{col: "sum" for col in NUMERIC_COLUMNS}})
+        .reset_index()
+        .query("`Код номенклатуры` != 0")
+    )
+    for col in NUMERIC_COLUMNS:
+        table[col] = to_int(table[col])
+    table["К Перечислению без Логистики"] = to_int(table[PAYOUT] - table[DELIVERY])
+    table["Сумма СПП"] = to_int(table[PRICE] - table[WB_SALE])
+    table["% Лог/рс"] = percent(table[DELIVERY], table[PAYOUT])
+    table["% Лог/Наша Цена"] = percent(table[DELIVERY], table[PRICE])
+
+    # Возвраты
+    returns = (
+        df[df["Тип документа"] == "Возврат"]
+        .groupby(CODE)
+        .agg({col: "sum" for col in RETURN_COLUMNS})
+        .rename(columns=RETURN_COLUMNS)
+        .apply(to_int)
+        .reset_index()
+    )
+    table = table.merge(returns, on=CODE, how="left").fillna(0)
+    table["Чистые продажи Наши"] = to_int(table[PRICE] - table["Возвраты Наша цена"])
+    table["Чистая реализация ВБ"] = to_int(
+        table[WB_SALE] - table["Возвраты реализация ВБ"] * 2
+    )
+    table["Чистое Перечисление"] = to_int(
+        table[PAYOUT] - table["Возвраты к перечислению"]
+    )
+    table["Чистое Перечисление без Логистики"] = to_int(
+        table["Чистое Перечисление"] - table[DELIVERY]
+    )
+
+    # Средние значения
+    codes = df[CODE]
+    averages = pd.DataFrame(
+        {
+            ARTICLE: by_code[ARTICLE].first(),
+            PRICE: nonzero_mean(df[PRICE], codes),
+            WB_SALE: nonzero_mean(df[WB_SALE], codes),
+            PAYOUT: nonzero_mean(df[PAYOUT], codes),
+            DELIVERY: round_like_python(
+                group_mean(df[DELIVERY], codes).reindex(by_code.size().index) * 2, 1
+            ),
+        }
+    )
+    averages["СПП Средняя"] = (averages[PRICE] - averages[WB_SALE]).round(1)
+    averages["К Перечислению без Логистики Средняя"] = (
+        averages[PAYOUT] - averages[DELIVERY]
+    ).round(1)
+    averages["% Лог/Перечисление с Лог Средний"] = percent(
+        averages[DELIVERY], averages[PAYOUT]
+    )
+    averages["% Лог/Наша цена Средний"] = percent(averages[DELIVERY], averages[PRICE])
+    table = table.merge(
+        averages.reset_index(), on=CODE, how="left", suffixes=("", "_Среднее")
+    ).fillna(0)
+
+    # Логистика
+    log_col = next((col for col in df.columns if "Виды логистики" in col), None)
+    if log_col:
+        events = logistics_counts(df, log_col)
+        sales = events[SALE_EVENT]
+        orders = sales + events[RETURN_EVENT] + events[CANCEL_EVENT]
+        status_log = pd.DataFrame(
+            {
+                "%Выкупа": percent(sales, orders),
+                "Чистые продажи, шт": sales,
+                "Заказы": orders,
+                RETURN_EVENT: events[RETURN_EVENT],
+                CANCEL_EVENT: events[CANCEL_EVENT],
+            }
+        )
+        table = table.merge(
+            status_log.rename_axis(CODE).reset_index(), on=CODE, how="left"
+        ).fillna(0)
+    else:
+        # Без колонки логистики продажи определить нельзя
+        table["Чистые продажи, шт"] = 0
+        table["Заказы"] = 0
+        table["%Выкупа"] = 0.0
+        table[RETURN_EVENT] = 0
+        table[CANCEL_EVENT] = 0
+
+    table = table.rename(columns=FINAL_NAMES)
+
+    # Дополнительные удержания (распределяются в apply_parameters)
+    deduction_columns = [col for col in DEDUCTION_COLUMNS if col in df.columns]
+    by_reason = df.groupby("Обоснование для оплаты")[deduction_columns].sum()
+    deductions = {col: by_reason[col].sum() for col in deduction_columns}
+    deductions.setdefault(ACCEPTANCE, 0)
+    return ReportAggregates(table, deductions, bool(log_col))
+
+
+def apply_parameters(aggregates, nalog_procent, sebestoimost, cost_map=None):
+    """
+    Себестоимость, налоги и прибыль по агрегатам отчёта. cost_map —
+    {код: себестоимость 1 шт}; для кодов вне него (или для всех, если
+    cost_map не задан) — sebestoimost. Возвращает FinancialReport: таблицу
+    с итоговыми названиями колонок и суммы удержаний {колонка: сумма}.
+    """
+    table = aggregates.table.copy()
+    deductions = aggregates.deductions
+
+    # Себестоимость продаж
+    if not aggregates.has_logistics:
+        table["Себес Продаж"] = 0
+        table["Себестоимость за 1 шт"] = sebestoimost
+    else:
+        if cost_map is None:
+            unit_cost = float(sebestoimost)
+        else:
+            unit_cost = table[CODE].map(cost_map).fillna(sebestoimost).astype(float)
+        table["Себестоимость за 1 шт"] = unit_cost
+        table["Себес Продаж"] = (table["Чистые продажи, шт"] * unit_cost).round(0)
+
+    # Маржа и налоги
+    table["Маржа"] = (
+        table["Чистое Перечисление без Логистики"] - table["Себес Продаж"]
+    ).round(1)
+    table["Налоги"] = (table["Чистая реализация ВБ"] * nalog_procent).round(1)
+
+    # Дополнительные удержания распределяются пропорционально заказам
+    table["Доп удержание на кол-во заказов 1 Артикула"] = (
+        (sum(deductions.values()) / table["Заказы"].sum()) * table["Заказы"]
+    ).round(1)
+
+    # Прибыль с учётом дополнительных удержаний
+    profit = (
+        table["Маржа"]
+        - table["Налоги"]
+        - table["Доп удержание на кол-во заказов 1 Артикула"]
+    ).round(1)
+    sales = table["Чистые продажи, шт"]
+    orders = table["Заказы"]
+    payment = table["Чистое Перечисление без Логистики"]
+    table["Прибыль"] = profit
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Прибыль на 1 юбку: на проданную, а без продаж — на заказанную
+        per_unit = np.where(
+            sales > 0, profit / sales, np.where(orders > 0, profit / orders, 0)
+        )
+        table["Прибыль на 1 Юбку"] = (
+            pd.Series(per_unit, index=table.index)
+            .replace([np.inf, -np.inf], 0)
+            .fillna(0)
+            .round(1)
+        )
+
+        table["% СПП"] = (
+            table["СПП Средняя"] / table["Наша цена Средняя"] * 100
+        ).round(1)
+
+        # Нагрузка логистики на одну проданную юбку
+        table["Логистика/1 Продажа"] = np.where(
+            sales == 0, -table["Логистика"], (table["Логистика"] / sales).round(1)
+        )
+
+        # Рентабельность: убыток всегда со знаком минус
+        rentability = profit / payment * 100
+        rentability = rentability.where(profit >= 0, -rentability.abs())
+        rentability = round_like_python(rentability, 1)
+        table["% Рентабельности(Приб/ЧП_без_Л)"] = rentability.where(
+            payment != 0, profit
+        ).fillna(0)
+
+    table["План на неделю"] = ""
+    table["План по доходу"] = ""
+    return FinancialReport(table, deductions)
+
+
+def profit_groups(profit):
+    """Группа по прибыли для листов отчёта (см. PROFIT_GROUPS)"""
+    conditions = [
+        profit > 10000,
+        (profit >= 5000) & (profit <= 10000),
+        (profit > 0) & (profit < 5000),
+        profit < 0,
+    ]
+    return np.select(conditions, PROFIT_GROUPS, default="Не попал")
+
+
+def article_prefix(articles):
+    """Первые три символа артикула поставщика до "_" """
+    return articles.astype(str).str.split("_").str[0].str[:3]
+
+
+def cost_params(data):
+    """
+    Себестоимость и налог из POST-данных формы: (sebestoimost, nalog_procent).
+    Налог вводится в процентах ("7" или "7,5") и ограничивается 0–100%.
+    """
+    try:
+        sebestoimost = float(data.get("sebestoimost", 600))
+    except (ValueError, TypeError):
+        sebestoimost = 600.0
+    try:
+        nalog_procent = float(data.get("nalog_procent", "7").replace(",", ".")) / 100
+        nalog_procent = max(0.0, min(1.0, nalog_procent))
+    except (ValueError, TypeError, AttributeError):
+        nalog_procent = 0.07
+    return sebestoimost, nalog_procent
+
+
+def aggregates_key(job):
+    return f"wb-finance-{AGGREGATES_VERSION}-{job.pk.hex}"
+
+
+def store_aggregates(job, aggregates):
+    """Сохраняет агрегаты загрузки для пересчёта; ключ — в job.params"""
+    key = aggregates_key(job)
+    ingest_cache.store(key, aggregates)
+    job.params["aggregates_key"] = key
+
+
+def last_upload(kind, request):
+    """
+    Последняя успешная загрузка формы kind с сохранёнными агрегатами —
+    своя: у пользователя по user, у анонима только из его сессии.
+    """
+    uploads = ReportJob.objects.filter(
+        kind=kind,
+        status=ReportJob.STATUS_DONE,
+        params__has_key="aggregates_key",
+    )
+    if request.user.is_authenticated:
+        uploads = uploads.filter(user=request.user)
+    else:
+        # Анонимные загрузки все с user=None — чужие не показываем
+        uploads = uploads.filter(user=None, pk__in=jobs.session_job_ids(request, kind))
+    return uploads.order_by("-created_at").first()
+
+
+def recalc_context(kind, request):
+    """Контекст блока «Пересчитать» на странице формы"""
+    job = last_upload(kind, request)
+    if job is None:
+        return {"last_upload": None}
+    return {
+        "last_upload": job,
+        "last_sebestoimost": job.params["sebestoimost"],
+        "last_nalog_procent": round(job.params["nalog_procent"] * 100, 1),
+    }
+
+
+def load_aggregates(job):
+    """ReportAggregates загрузки или None, если они уже вытеснены из кэша"""
+    return ingest_cache.load(job.params["aggregates_key"])
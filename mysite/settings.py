@@ -144,6 +144,23 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
+# Кэш разобранных Excel-отчётов (forms_app/ingest_cache.py)
+INGEST_CACHE_ENABLED = True
+INGEST_CACHE_DIR = os.path.join(BASE_DIR, "cache", "ingest")
+INGEST_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 МБ
+# Сколько процессов разбирают файлы одной многофайловой загрузки (1 — без пула)
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+
+# Кэш PNG-графиков дашборда и форм 1, 3 (forms_app/charts.py)
+CHART_CACHE_DIR = os.path.join(BASE_DIR, "cache", "charts")
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64 МБ
+
+# Фоновые задачи отчётов (forms_app/jobs.py, manage.py run_report_workers).
+# False — отчёт считается прямо в запросе, как раньше (удобно для разработки)
+REPORT_JOBS_ASYNC = True
+REPORT_JOBS_TIMEOUT = 60 * 60  # сек.; дольше считается зависшей и помечается ошибкой
+REPORT_JOBS_RETENTION_DAYS = 7  # сколько хранить готовые отчёты в MEDIA_ROOT
+
 CKEDITOR_UPLOAD_PATH = "uploads/"
 CKEDITOR_CONFIGS = {
     "default": {